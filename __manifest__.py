@@ -5,24 +5,37 @@
     "author": "simonlundmark1",
     "website": "https://github.com/simonlundmark1",
     "category": "Inventory",
-    "depends": ["base", "product", "stock", "project", "mail"],
+    "depends": ["base", "product", "stock", "project", "mail", "bus"],
     "data": [
         "security/rental_security.xml",
         "security/ir.model.access.csv",
         "data/rental_sequence.xml",
         "data/rental_cron.xml",
         "data/stock_warehouse_data.xml",
+        "data/product_data.xml",
         "views/product_view.xml",
+        "views/stock_warehouse_views.xml",
+        "views/stock_picking_views.xml",
         "views/rental_booking_views.xml",
+        "views/rental_perf_views.xml",
+        "views/rental_configuration_views.xml",
+        "views/rental_booking_import_views.xml",
+        "views/rental_booking_archive_views.xml",
+        "views/rental_utilisation_report_views.xml",
+        "views/rental_demand_forecast_views.xml",
     ],
     "assets": {
         "web.assets_backend": [
             "tl_rental_manager/static/src/css/rental_availability.css",
             "tl_rental_manager/static/src/js/rental_calendar.js",
+            "tl_rental_manager/static/src/js/availability_bus.js",
+            "tl_rental_manager/static/src/js/availability_cache.js",
+            "tl_rental_manager/static/src/js/availability_virtual_grid.js",
             "tl_rental_manager/static/src/js/rental_availability_action.js",
             "tl_rental_manager/static/src/js/booking_availability_wizard.js",
             "tl_rental_manager/static/src/js/booking_availability_action.js",
             "tl_rental_manager/static/src/js/rental_dashboard.js",
+            "tl_rental_manager/static/src/xml/availability_virtual_grid_templates.xml",
             "tl_rental_manager/static/src/xml/rental_availability_templates.xml",
             "tl_rental_manager/static/src/xml/booking_availability_wizard_templates.xml",
             "tl_rental_manager/static/src/xml/rental_dashboard_templates.xml",
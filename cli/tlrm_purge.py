@@ -0,0 +1,56 @@
+import argparse
+import sys
+
+from odoo import api, fields, SUPERUSER_ID
+from odoo.cli import Command
+from odoo.modules.registry import Registry
+from odoo.tools import config
+
+
+class TlrmPurge(Command):
+    """Purge or reset rental data in chunks (see tl.rental.maintenance)"""
+    name = 'tlrm_purge'
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog='odoo-bin tlrm_purge',
+            description="Delete rental bookings, their pickings and archived bookings in "
+                        "chunks, committing after each chunk.",
+            epilog="Other options (-c, -d, --db_host, ...) are passed to the server configuration.",
+        )
+        parser.add_argument('--company', type=int, help="only purge this company (id)")
+        parser.add_argument('--date-from', help="only bookings starting on or after this date")
+        parser.add_argument('--date-to', help="only bookings starting before this date")
+        parser.add_argument('--chunk-size', type=int, default=500, help="records per transaction (default 500)")
+        parser.add_argument('--dry-run', action='store_true', help="only count what would be deleted")
+        parser.add_argument('--reset', action='store_true',
+                            help="also delete rental products and their stock, and restart the booking sequence")
+        args, server_args = parser.parse_known_args(cmdargs)
+
+        config.parse_config(server_args, setup_logging=True)
+        db_names = config['db_name']
+        if isinstance(db_names, str):
+            db_names = [name for name in db_names.split(',') if name]
+        if len(db_names or []) != 1:
+            sys.exit("Exactly one database must be given with -d.")
+
+        with Registry(db_names[0]).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            company = None
+            if args.company:
+                company = env['res.company'].browse(args.company).exists()
+                if not company:
+                    sys.exit(f"Company {args.company} does not exist.")
+            counts = env['tl.rental.maintenance']._purge_rental_data(
+                company=company,
+                date_from=fields.Datetime.to_datetime(args.date_from) if args.date_from else None,
+                date_to=fields.Datetime.to_datetime(args.date_to) if args.date_to else None,
+                chunk_size=args.chunk_size,
+                dry_run=args.dry_run,
+                reset=args.reset,
+                auto_commit=True,
+            )
+
+        prefix = "Would delete" if args.dry_run else "Deleted"
+        for kind, count in counts.items():
+            print(f"{prefix} {kind}: {count}")
@@ -1,5 +1,19 @@
-from odoo import http
-from odoo.http import request
+import csv
+import hashlib
+import io
+import json
+import tempfile
+
+import xlsxwriter
+
+from odoo import api, http
+from odoo.exceptions import AccessError, UserError
+from odoo.http import content_disposition, request
+
+from ..models.rental_perf_stat import tlrm_profiled
+
+# Bytes of output collected before a chunk is sent
+EXPORT_BUFFER_SIZE = 64 * 1024
 
 
 def _to_int(value):
@@ -12,13 +26,134 @@ def _to_int(value):
         return None
 
 
+def _to_needed_by_product(values):
+    """Convert a JSON ``{product_id: qty}`` mapping (string keys) to int keys."""
+    needed_by_product = {}
+    for key, qty in (values or {}).items():
+        pid = _to_int(key)
+        if pid:
+            needed_by_product[pid] = float(qty or 0.0)
+    return needed_by_product
+
+
+def _make_etag(*parts):
+    """Return a strong HTTP entity tag for the given version parts."""
+    return '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+
+
+def _etag_matches(etag, if_none_match):
+    """Check ``etag`` against an If-None-Match value (list of tags or ``*``)."""
+    if not if_none_match:
+        return False
+    for candidate in str(if_none_match).split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate.strip('"') == etag.strip('"'):
+            return True
+    return False
+
+
+def _csv_chunks(header, rows):
+    """Encode ``rows`` as CSV, yielding bytes every EXPORT_BUFFER_SIZE characters."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _xlsx_chunks(header, rows, sheet_name):
+    """Write ``rows`` to an XLSX workbook and yield the file in chunks.
+
+    ``constant_memory`` flushes every row to disk once written, and the
+    workbook itself is assembled in a temporary file, so neither is held
+    in memory. An XLSX file can only be sent once it is complete.
+    """
+    with tempfile.TemporaryFile() as fileobj:
+        workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(sheet_name[:31])
+        worksheet.write_row(0, 0, header, workbook.add_format({'bold': True}))
+        for index, row in enumerate(rows, start=1):
+            worksheet.write_row(index, 0, row)
+        workbook.close()
+        fileobj.seek(0)
+        while chunk := fileobj.read(EXPORT_BUFFER_SIZE):
+            yield chunk
+
+
+def _stream_availability_export(registry, uid, context, export_format, params):
+    """Produce an availability export in a cursor of its own.
+
+    The response body is consumed after the request's cursor is closed, so
+    the generator opens a read-only cursor for as long as it streams.
+    """
+    with registry.cursor(readonly=True) as cr:
+        env = api.Environment(cr, uid, context)
+        company = env['res.company'].browse(params['company_id'])
+        line_model = env['tl.rental.booking.line']
+        header = line_model._get_availability_export_header()
+        rows = line_model._iter_availability_export(
+            params['product_domain'], params['date_start'], params['week_count'],
+            warehouse_id=params['warehouse_id'], company=company,
+        )
+        if export_format == 'xlsx':
+            yield from _xlsx_chunks(header, rows, env._("Availability"))
+        else:
+            yield from _csv_chunks(header, rows)
+
+
 class TlrmAvailabilityController(http.Controller):
 
+    def _check_not_modified(self, etag, if_none_match=None):
+        """Announce ``etag`` and tell whether the client already has this version.
+
+        JSON-RPC answers always travel as ``200``, so instead of a ``304`` the
+        routes return ``{'not_modified': True, 'etag': ...}``. The client
+        version comes from the ``if_none_match`` parameter or, failing that,
+        the ``If-None-Match`` header.
+        """
+        request.future_response.headers['ETag'] = etag
+        if if_none_match is None:
+            if_none_match = request.httprequest.headers.get('If-None-Match')
+        return _etag_matches(etag, if_none_match)
+
+    def _grid_etag(self, line_model, change_token, company, warehouse_id, date_start, week_count, *extra):
+        """Version of a grid response, computed without building the grid.
+
+        :param change_token: change token of the availability data, also
+            passed on to ``_get_availability_grid`` so it is computed once
+        :param extra: further request parameters that shape the response
+        """
+        _product_ids, week_count, _company, _needed = line_model._normalize_grid_params(
+            [], week_count, company.id, None
+        )
+        first_week = line_model._compute_weeks(date_start, 1)[0]['key']
+        return _make_etag(change_token, company.id, warehouse_id, first_week, week_count,
+                          line_model.env.lang, *extra)
+
+    def _get_company(self, company_id):
+        env = request.env
+        company_id = _to_int(company_id)
+        return env['res.company'].browse(company_id) if company_id else env.company
+
+    def _get_warehouses(self, company):
+        warehouses = request.env['stock.warehouse'].search([
+            ('company_id', '=', company.id)
+        ])
+        return [{'id': wh.id, 'name': wh.name} for wh in warehouses]
+
     @http.route(
         '/tlrm/availability_grid/global',
         type='json',
         auth='user'
     )
+    @tlrm_profiled('route_grid_global')
     def tlrm_availability_global(
         self,
         company_id=None,
@@ -26,11 +161,12 @@ class TlrmAvailabilityController(http.Controller):
         date_start=None,
         week_count=12,
         product_domain=None,
+        limit=None,
+        offset=0,
+        if_none_match=None,
     ):
         env = request.env
-
-        company_id = _to_int(company_id)
-        company = env['res.company'].browse(company_id) if company_id else env.company
+        company = self._get_company(company_id)
 
         line_model = env['tl.rental.booking.line'].with_context(
             allowed_company_ids=[company.id]
@@ -40,22 +176,45 @@ class TlrmAvailabilityController(http.Controller):
         warehouse_id = _to_int(warehouse_id)
 
         if not product_domain:
-            product_domain = [('type', '=', 'product')]
+            product_domain = env['product.product']._tlrm_rental_product_domain()
 
-        products = env['product.product'].search(product_domain)
+        limit = _to_int(limit)
+        offset = _to_int(offset) or 0
+        change_token = line_model._get_availability_change_token(
+            company, warehouse_id, line_model._compute_weeks(date_start, 1)[0]['start_dt'],
+        )
+        # The rows of the page are part of the version: products created,
+        # archived or re-sorted change the response without touching the data
+        products = env['product.product'].search(
+            product_domain, limit=limit, offset=offset,
+        )
         product_ids = products.ids
+        if limit:
+            product_count = env['product.product'].search_count(product_domain)
+        else:
+            product_count = len(product_ids)
 
-        grid = line_model.get_availability_grid(
+        etag = self._grid_etag(
+            line_model, change_token, company, warehouse_id, date_start, week_count,
+            'global', product_ids, product_count,
+        )
+        if self._check_not_modified(etag, if_none_match):
+            return {'not_modified': True, 'etag': etag}
+
+        grid = line_model._get_availability_grid(
             product_ids=product_ids,
             date_start=date_start,
             week_count=week_count,
             warehouse_id=warehouse_id,
             company_id=company.id,
             needed_by_product=None,
+            change_token=change_token,
         )
 
         grid.setdefault('meta', {})
         grid['meta'].setdefault('mode', 'global')
+        grid['meta']['product_count'] = product_count
+        grid['meta']['etag'] = etag
         return grid
 
     @http.route(
@@ -63,6 +222,7 @@ class TlrmAvailabilityController(http.Controller):
         type='json',
         auth='user'
     )
+    @tlrm_profiled('route_grid_booking')
     def tlrm_availability_booking(
         self,
         booking_id,
@@ -70,6 +230,7 @@ class TlrmAvailabilityController(http.Controller):
         anchor='booking_period',
         date_start=None,
         warehouse_id=None,
+        if_none_match=None,
     ):
         env = request.env
 
@@ -107,18 +268,30 @@ class TlrmAvailabilityController(http.Controller):
                 product_ids.append(pid)
             needed_by_product[pid] += qty
 
-        grid = line_model.get_availability_grid(
+        change_token = line_model._get_availability_change_token(
+            company, warehouse_id, line_model._compute_weeks(date_start, 1)[0]['start_dt'],
+        )
+        etag = self._grid_etag(
+            line_model, change_token, company, warehouse_id, date_start, week_count,
+            'booking', booking.id, sorted(needed_by_product.items()),
+        )
+        if self._check_not_modified(etag, if_none_match):
+            return {'not_modified': True, 'etag': etag}
+
+        grid = line_model._get_availability_grid(
             product_ids=product_ids,
             date_start=date_start,
             week_count=week_count,
             warehouse_id=warehouse_id,
             company_id=company.id,
             needed_by_product=needed_by_product,
+            change_token=change_token,
         )
 
         grid_meta = grid.setdefault('meta', {})
         grid_meta['mode'] = 'booking'
         grid_meta['booking_id'] = booking.id
+        grid_meta['etag'] = etag
         return grid
 
     @http.route(
@@ -126,20 +299,196 @@ class TlrmAvailabilityController(http.Controller):
         type='json',
         auth='user'
     )
-    def tlrm_get_warehouses(self, company_id=None):
+    @tlrm_profiled('route_warehouses')
+    def tlrm_get_warehouses(self, company_id=None, if_none_match=None):
         """Get list of warehouses for the filter dropdown."""
+        company = self._get_company(company_id)
         env = request.env
-        
-        company_id = _to_int(company_id)
-        company = env['res.company'].browse(company_id) if company_id else env.company
-        
-        warehouses = env['stock.warehouse'].search([
-            ('company_id', '=', company.id)
-        ])
-        
+        env['stock.warehouse'].flush_model(['name', 'company_id', 'active'])
+        env.cr.execute("""
+            SELECT COUNT(*), MAX(write_date)::text
+              FROM stock_warehouse
+             WHERE company_id = %s
+        """, [company.id])
+        etag = _make_etag('warehouses', company.id, env.lang, *env.cr.fetchone())
+        if self._check_not_modified(etag, if_none_match):
+            return {'not_modified': True, 'etag': etag}
+        return {'warehouses': self._get_warehouses(company), 'etag': etag}
+
+    @http.route(
+        '/tlrm/availability_bootstrap',
+        type='json',
+        auth='user'
+    )
+    @tlrm_profiled('route_bootstrap')
+    def tlrm_availability_bootstrap(
+        self,
+        company_id=None,
+        warehouse_id=None,
+        date_start=None,
+        week_count=None,
+        product_ids=None,
+        needed_by_product=None,
+        product_domain=None,
+        limit=100,
+        offset=0,
+    ):
+        """Return everything an availability screen needs for its first paint.
+
+        Warehouses, user preferences and the first page of the grid are
+        computed in one request instead of three sequential round trips.
+
+        :param warehouse_id: source warehouse; when omitted, the warehouse
+            saved in the user's preferences is used
+        :param week_count: number of weeks; defaults to the saved preference, then 12
+        :param product_ids: explicit rows (booking wizard); disables paging
+        :param needed_by_product: optional ``{product_id: qty}`` for booking views
+        :param product_domain: domain of the rows when ``product_ids`` is not given
+        :param limit: page size of the rows when ``product_ids`` is not given
+        :param offset: page offset of the rows when ``product_ids`` is not given
+        :return: dict with ``warehouses``, ``preferences``, ``product_count``
+            and ``grid`` (meta, columns, rows)
+        """
+        env = request.env
+        company = self._get_company(company_id)
+        preferences = env.user._tlrm_get_preferences()
+        warehouses = self._get_warehouses(company)
+
+        warehouse_id = _to_int(warehouse_id)
+        if warehouse_id is None:
+            warehouse_id = _to_int(preferences.get('warehouse_id'))
+            if warehouse_id not in {wh['id'] for wh in warehouses}:
+                warehouse_id = None
+        week_count = _to_int(week_count) or _to_int(preferences.get('week_count')) or 12
+        limit = _to_int(limit)
+        offset = _to_int(offset) or 0
+
+        Product = env['product.product']
+        if product_ids:
+            product_ids = [pid for pid in (_to_int(pid) for pid in product_ids) if pid]
+            product_count = len(product_ids)
+            limit, offset = None, 0
+        else:
+            if not product_domain:
+                product_domain = Product._tlrm_rental_product_domain()
+            product_count = Product.search_count(product_domain)
+            product_ids = Product.search(product_domain, limit=limit, offset=offset).ids
+
+        line_model = env['tl.rental.booking.line'].with_context(
+            allowed_company_ids=[company.id]
+        )
+        grid = line_model.get_availability_grid(
+            product_ids=product_ids,
+            date_start=date_start,
+            week_count=week_count,
+            warehouse_id=warehouse_id,
+            company_id=company.id,
+            needed_by_product=_to_needed_by_product(needed_by_product),
+        )
+        grid_meta = grid.setdefault('meta', {})
+        grid_meta.setdefault('mode', 'booking' if needed_by_product else 'global')
+        grid_meta.update({
+            'product_count': product_count,
+            'limit': limit,
+            'offset': offset,
+        })
+
+        return {
+            'warehouses': warehouses,
+            'preferences': preferences,
+            'product_count': product_count,
+            'grid': grid,
+        }
+
+    @http.route(
+        '/tlrm/availability_change_token',
+        type='json',
+        auth='user'
+    )
+    def tlrm_availability_change_token(self, company_id=None, warehouse_id=None, date_start=None):
+        """Return the current change token of the availability data.
+
+        Clients compare it with ``meta.change_token`` of a cached grid to
+        decide whether the grid must be fetched again; ``date_start`` is the
+        start of that grid (``meta.date_start``).
+        """
+        company = self._get_company(company_id)
+        line_model = request.env['tl.rental.booking.line'].with_context(
+            allowed_company_ids=[company.id]
+        )
+        date_from = line_model._compute_weeks(date_start, 1)[0]['start_dt'] if date_start else None
         return {
-            'warehouses': [
-                {'id': wh.id, 'name': wh.name}
-                for wh in warehouses
-            ]
+            'change_token': line_model._get_availability_change_token(company, _to_int(warehouse_id), date_from),
+        }
+
+    @http.route(
+        '/tlrm/preferences',
+        type='json',
+        auth='user'
+    )
+    def tlrm_save_preferences(self, preferences=None):
+        """Merge ``preferences`` into the current user's rental screen preferences."""
+        return request.env.user._tlrm_set_preferences(preferences or {})
+
+    @http.route(
+        '/tlrm/availability_export',
+        type='http',
+        auth='user',
+        methods=['GET'],
+    )
+    def tlrm_availability_export(
+        self,
+        company_id=None,
+        warehouse_id=None,
+        date_start=None,
+        week_count=52,
+        product_domain=None,
+        export_format='csv',
+    ):
+        """Stream the availability of products x weeks as CSV or XLSX.
+
+        Takes the filters of the global grid, with ``product_domain`` as a
+        JSON string, for up to EXPORT_MAX_WEEKS weeks. Rows are computed and
+        written chunk by chunk while the response is sent, see
+        ``tl.rental.booking.line._iter_availability_export``.
+        """
+        env = request.env
+        company = self._get_company(company_id)
+        if company not in env.user.company_ids:
+            raise AccessError(env._("You are not allowed to access the availability of %s.", company.name))
+        if export_format not in ('csv', 'xlsx'):
+            raise UserError(env._("Unsupported export format: %s", export_format))
+
+        Product = env['product.product']
+        if product_domain:
+            try:
+                product_domain = json.loads(product_domain)
+            except ValueError:
+                raise UserError(env._("The product filter is not valid JSON."))
+        else:
+            product_domain = Product._tlrm_rental_product_domain()
+        # Fail now on an invalid domain rather than in the middle of the stream
+        Product.search(product_domain, limit=1)
+
+        params = {
+            'company_id': company.id,
+            'warehouse_id': _to_int(warehouse_id),
+            'date_start': date_start,
+            'week_count': _to_int(week_count) or 52,
+            'product_domain': product_domain,
         }
+        first_week = env['tl.rental.booking.line']._compute_weeks(date_start, 1)[0]['key']
+        filename = 'availability_%s.%s' % (first_week, export_format)
+        content_type = (
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            if export_format == 'xlsx' else 'text/csv; charset=utf-8'
+        )
+        context = dict(env.context, allowed_company_ids=[company.id])
+        return request.make_response(
+            _stream_availability_export(env.registry, env.uid, context, export_format, params),
+            headers=[
+                ('Content-Type', content_type),
+                ('Content-Disposition', content_disposition(filename)),
+                ('Cache-Control', 'no-store'),
+            ],
+        )
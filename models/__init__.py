@@ -1,4 +1,16 @@
 from . import product
 from . import rental_booking
+from . import rental_booking_import
+from . import rental_booking_archive
+from . import rental_utilisation_report
+from . import rental_demand_forecast
+from . import rental_maintenance
+from . import stock_move
 from . import stock_picking
+from . import stock_quant
 from . import stock_warehouse
+from . import rental_perf_stat
+from . import rental_capacity_guard
+from . import ir_websocket
+from . import res_users
+from . import rental_grid_snapshot
@@ -0,0 +1,16 @@
+from odoo import models
+
+from .rental_booking import AVAILABILITY_BUS_CHANNEL
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        """Subscribe rental users to availability deltas of their companies."""
+        channels = super()._build_bus_channel_list(channels)
+        if self.env.uid and self.env.user.has_group('tl_rental_manager.tlrm_group_user'):
+            channels = list(channels)
+            for company in self.env.user.company_ids:
+                channels.append((company, AVAILABILITY_BUS_CHANNEL))
+        return channels
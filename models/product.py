@@ -1,4 +1,23 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+from odoo.tools import SQL
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+import pytz
+
+from .rental_pricing_engine import PRICE_TABLE_FIELDS
+
+COUNTER_HORIZON_PARAM = 'tl_rental_manager.counter_horizon'
+COUNTER_WINDOW_PARAM = 'tl_rental_manager.counter_window'
+ACTIVE_BOOKING_STATES = ['planned', 'reserved', 'ongoing', 'finished']
+
+COUNTER_FIELDS = (
+    'tlrm_planned_units',
+    'tlrm_reserved_units',
+    'tlrm_rented_units',
+    'tlrm_available_units',
+    'tlrm_status',
+)
+
 
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
@@ -10,6 +29,10 @@ class ProductTemplate(models.Model):
     tlrm_min_hours = fields.Float(string="Min. Rental Hours", default=1.0)
     tlrm_min_days = fields.Float(string="Min. Rental Days", default=0.0)
     tlrm_min_weeks = fields.Float(string="Min. Rental Weeks", default=0.0)
+    tlrm_price_write_date = fields.Datetime(
+        string="Rental Prices Changed On", readonly=True, copy=False,
+        help="Last change of the rental prices or minimums; versions the cached price tables.",
+    )
     
     tlrm_fleet_capacity = fields.Float(
         string="Fleet Capacity",
@@ -20,28 +43,32 @@ class ProductTemplate(models.Model):
              "for booking, regardless of current physical location."
     )
     
+    # Stored per company and maintained from booking line, booking state and
+    # quant changes (see _tlrm_mark_counters_dirty), so they can be searched,
+    # sorted and grouped like plain columns. They count bookings within the
+    # configured horizon (see _tlrm_stored_counter_window).
     tlrm_planned_units = fields.Integer(
         string="Planned Units", 
-        compute="_compute_tlrm_counts", 
-        store=False,
+        company_dependent=True,
+        readonly=True,
         help="Units in planned bookings (blocks availability for planning)."
     )
     tlrm_reserved_units = fields.Integer(
         string="Reserved Units",
-        compute="_compute_tlrm_counts",
-        store=False,
+        company_dependent=True,
+        readonly=True,
         help="Units reserved with pickings created (hard commitment)."
     )
     tlrm_rented_units = fields.Integer(
         string="Rented Units", 
-        compute="_compute_tlrm_counts", 
-        store=False,
+        company_dependent=True,
+        readonly=True,
         help="Units currently in ongoing bookings."
     )
     tlrm_available_units = fields.Integer(
         string="Available Units", 
-        compute="_compute_tlrm_counts", 
-        store=False
+        company_dependent=True,
+        readonly=True,
     )
     
     tlrm_status = fields.Selection([
@@ -49,7 +76,7 @@ class ProductTemplate(models.Model):
         ('planned', 'Planned'),
         ('rented', 'Rented'),
         ('unavailable', 'Unavailable'),
-    ], string="Rental Status", compute="_compute_tlrm_status", store=False)
+    ], string="Rental Status", company_dependent=True, readonly=True)
 
     def _compute_tlrm_fleet_capacity(self):
         """Compute fleet capacity from stock.quant across all internal locations.
@@ -96,68 +123,178 @@ class ProductTemplate(models.Model):
                 total += qty_by_product.get(variant.id, 0.0)
             product.tlrm_fleet_capacity = total
 
-    @api.depends('tlrm_available_units', 'tlrm_planned_units', 'tlrm_rented_units')
-    def _compute_tlrm_status(self):
-        for product in self:
-            if product.tlrm_rented_units > 0:
-                product.tlrm_status = 'rented'
-            elif product.tlrm_planned_units > 0:
-                product.tlrm_status = 'planned'
-            elif product.tlrm_available_units <= 0:
-                product.tlrm_status = 'unavailable'
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        # Counters are company dependent: shared templates need them in every company
+        all_company_ids = None
+        for template in templates:
+            if template.company_id:
+                company_ids = template.company_id.ids
             else:
-                product.tlrm_status = 'available'
+                if all_company_ids is None:
+                    all_company_ids = self.env['res.company'].sudo().search([]).ids
+                company_ids = all_company_ids
+            self._tlrm_mark_counters_dirty(template.ids, company_ids)
+        if any(vals.get(fname) for vals in vals_list for fname in PRICE_TABLE_FIELDS):
+            templates._tlrm_stamp_prices()
+        return templates
+
+    def write(self, vals):
+        res = super().write(vals)
+        if any(fname in vals for fname in PRICE_TABLE_FIELDS):
+            self._tlrm_stamp_prices()
+        return res
+
+    def _tlrm_stamp_prices(self):
+        """Record a change of rental prices, see :meth:`_tlrm_get_price_tables`.
+
+        The wall clock is used rather than the transaction time, so that
+        every change gets a new stamp, even within one transaction.
+        """
+        self.env.cr.execute(SQL(
+            "UPDATE product_template SET tlrm_price_write_date = clock_timestamp() AT TIME ZONE 'UTC' "
+            "WHERE id = ANY(%s)", self.ids,
+        ))
+        self.invalidate_recordset(['tlrm_price_write_date'])
+
+    @api.model
+    def _tlrm_get_price_tables(self):
+        """Return the rental price table of every template with a rental price.
+
+        The tables are cached per version of the prices: the number of
+        priced templates and their price change stamps, read with one
+        aggregate query. A price change, a new priced template or a deleted
+        one starts a new version, so only the price tables are recomputed,
+        and quotes never read the templates themselves.
+
+        :return: frozendict template_id -> tuple of PRICE_TABLE_FIELDS values
+        """
+        self.flush_model(PRICE_TABLE_FIELDS[:3] + ('tlrm_price_write_date',))
+        self.env.cr.execute(SQL("""
+            SELECT COUNT(*), SUM(EXTRACT(EPOCH FROM tlrm_price_write_date))
+              FROM product_template
+             WHERE tlrm_price_hour > 0 OR tlrm_price_day > 0 OR tlrm_price_week > 0
+        """))
+        return self._tlrm_read_price_tables(tuple(self.env.cr.fetchone()))
+
+    @api.model
+    @tools.ormcache('version')
+    def _tlrm_read_price_tables(self, version):
+        """Read the price tables of :meth:`_tlrm_get_price_tables` for one price version."""
+        templates = self.sudo().with_context(active_test=False).search_fetch([
+            '|', '|',
+            ('tlrm_price_hour', '>', 0),
+            ('tlrm_price_day', '>', 0),
+            ('tlrm_price_week', '>', 0),
+        ], PRICE_TABLE_FIELDS)
+        return tools.frozendict({
+            template.id: tuple(template[fname] for fname in PRICE_TABLE_FIELDS)
+            for template in templates
+        })
+
+    @api.model
+    def _tlrm_status_from_counts(self, planned, rented, available):
+        """Return the rental status for the given unit counts."""
+        if rented > 0:
+            return 'rented'
+        if planned > 0:
+            return 'planned'
+        if available <= 0:
+            return 'unavailable'
+        return 'available'
+
+    @api.model
+    def _tlrm_horizon_window(self, tz_name):
+        """Return the (date_from, date_to) window of the configured horizon.
+
+        Driven by the ``tl_rental_manager.counter_horizon`` system parameter:
+        ``now`` counts bookings active at this instant (``date_to`` is None),
+        ``today`` (default) counts bookings overlapping the current day in
+        the ``tz_name`` timezone.
+        """
+        horizon = self.env['ir.config_parameter'].sudo().get_param(COUNTER_HORIZON_PARAM) or 'today'
+        now = fields.Datetime.now()
+        if horizon == 'now':
+            return now, None
+        tz = pytz.timezone(tz_name or 'UTC')
+        local_today = pytz.utc.localize(now).astimezone(tz).date()
+        day_start = tz.localize(datetime.combine(local_today, time.min)).astimezone(pytz.utc).replace(tzinfo=None)
+        return day_start, day_start + timedelta(days=1)
+
+    @api.model
+    def _tlrm_stored_counter_window(self, company):
+        """Return the (date_from, date_to) window of the stored counters of ``company``.
+
+        Stored values are shared by all users, so the day is taken in the
+        timezone of the company's partner (UTC when it has none), never in
+        the current user's.
+        """
+        return self._tlrm_horizon_window(company.partner_id.tz)
+
+    @api.model
+    def _tlrm_counter_window(self):
+        """Return the counter window of the current user, honouring a context-supplied one.
 
-    def _compute_tlrm_counts(self):
+        The ``tlrm_date_from`` / ``tlrm_date_to`` context keys override the
+        configured horizon, e.g. to show counts for a planning period.
+        Otherwise the horizon is taken in the user's timezone.
+        """
+        date_from = self.env.context.get('tlrm_date_from')
+        if date_from:
+            date_to = self.env.context.get('tlrm_date_to')
+            return (
+                fields.Datetime.to_datetime(date_from),
+                fields.Datetime.to_datetime(date_to) if date_to else None,
+            )
+        return self._tlrm_horizon_window(self.env.context.get('tz') or self.env.user.tz)
+
+    def get_tlrm_counts(self, date_from=None, date_to=None, company_id=None):
+        """Return rental counters of these templates for a time window.
+
+        :param date_from: window start; defaults to the configured horizon or
+            the ``tlrm_date_from`` context key
+        :param date_to: window end (exclusive); None counts bookings active
+            at ``date_from``
+        :param company_id: optional res.company id; defaults to current company
+        :return: dict mapping template id to the counter values
+        """
+        company = self.env['res.company'].browse(company_id) if company_id else self.env.company
+        if date_from:
+            date_from = fields.Datetime.to_datetime(date_from)
+            date_to = fields.Datetime.to_datetime(date_to) if date_to else None
+        else:
+            date_from, date_to = self._tlrm_counter_window()
+        return self._tlrm_compute_counter_values(company, date_from, date_to)
+
+    def _tlrm_compute_counter_values(self, company, date_from, date_to=None):
         """Compute rental availability counts using fleet capacity.
         
-        Uses read_group for efficient batch querying instead of multiple searches.
+        Only booking lines overlapping the window are counted, through one
+        indexed range query (see product.product._tlrm_get_booked_quantities).
         
         - Planned: Units in 'planned' state (blocks availability for planning)
         - Reserved: Units in 'reserved' state (hard lock, stock movements created)
         - Rented: Units in 'ongoing' or 'finished' state (physically out)
         - Available: Fleet capacity minus planned, reserved and rented units
+
+        :param company: res.company record the counters are computed for
+        :param date_from: window start
+        :param date_to: window end (exclusive), or None for an instant
+        :return: dict mapping template id to the counter field values
         """
-        # Initialize all products with zero values
-        for product in self:
-            product.tlrm_planned_units = 0
-            product.tlrm_reserved_units = 0
-            product.tlrm_rented_units = 0
-            product.tlrm_available_units = 0
-        
-        if not self:
-            return
-        
-        # Collect all variant IDs for batch query
-        all_variant_ids = self.mapped('product_variant_ids').ids
-        if not all_variant_ids:
-            return
-        
-        BookingLine = self.env['tl.rental.booking.line']
-        company_id = self.env.company.id
-        
-        # Single read_group query for all states
-        domain = [
-            ('product_id', 'in', all_variant_ids),
-            ('state', 'in', ['planned', 'reserved', 'ongoing', 'finished']),
-            ('company_id', '=', company_id),
-        ]
-        groups = BookingLine._read_group(
-            domain,
-            groupby=['product_id', 'state'],
-            aggregates=['quantity:sum'],
-        )
+        templates = self.with_company(company)
+        values = {}
+        if not templates:
+            return values
         
         # Build lookup: product_id -> state -> quantity
-        qty_by_product_state = {}
-        for product_id, state, qty_sum in groups:
-            pid = product_id.id if product_id else False
-            if pid not in qty_by_product_state:
-                qty_by_product_state[pid] = {}
-            qty_by_product_state[pid][state] = qty_sum or 0.0
+        qty_by_product_state = templates.product_variant_ids._tlrm_get_booked_quantities(
+            date_from, date_to, company,
+        )
         
         # Assign values to each product template
-        for product in self:
+        for product in templates:
             planned = 0.0
             reserved = 0.0
             rented = 0.0
@@ -170,10 +307,164 @@ class ProductTemplate(models.Model):
             
             fleet_capacity = product.tlrm_fleet_capacity or 0.0
             # Planned, reserved, and rented all reduce availability
-            available = fleet_capacity - planned - reserved - rented
+            available = max(fleet_capacity - planned - reserved - rented, 0.0)
             
-            product.tlrm_planned_units = int(planned)
-            product.tlrm_reserved_units = int(reserved)
-            product.tlrm_rented_units = int(rented)
-            product.tlrm_available_units = int(max(available, 0.0))
+            values[product.id] = {
+                'tlrm_planned_units': int(planned),
+                'tlrm_reserved_units': int(reserved),
+                'tlrm_rented_units': int(rented),
+                'tlrm_available_units': int(available),
+                'tlrm_status': self._tlrm_status_from_counts(planned, rented, available),
+            }
+        return values
+
+    def _tlrm_refresh_counters(self, company):
+        """Recompute and store the rental counters of these templates for ``company``.
+
+        Only templates whose values actually changed are written, grouped by
+        identical values so a refresh costs one write per distinct result.
+        """
+        templates = self.sudo().with_company(company).exists()
+        date_from, date_to = templates._tlrm_stored_counter_window(company)
+        values = templates._tlrm_compute_counter_values(company, date_from, date_to)
+        counter_fields = list(COUNTER_FIELDS)
+        current = {
+            rec['id']: rec
+            for rec in templates.read(counter_fields)
+        }
+        ids_by_values = defaultdict(list)
+        for template_id, vals in values.items():
+            stored = current.get(template_id, {})
+            if any(stored.get(fname) != vals[fname] for fname in counter_fields):
+                ids_by_values[tuple(vals[fname] for fname in counter_fields)].append(template_id)
+        for key, template_ids in ids_by_values.items():
+            templates.browse(template_ids).write(dict(zip(counter_fields, key)))
+
+    @api.model
+    def _tlrm_mark_counters_dirty(self, template_ids, company_ids):
+        """Schedule a counter refresh of ``template_ids`` for ``company_ids``.
+
+        Changes are collected for the whole transaction and refreshed once,
+        right before commit.
+        """
+        template_ids = {tid for tid in template_ids if tid}
+        company_ids = {cid for cid in company_ids if cid}
+        if not template_ids or not company_ids:
+            return
+        precommit = self.env.cr.precommit
+        dirty = precommit.data.setdefault('tlrm.counters_dirty', defaultdict(set))
+        if not dirty:
+            precommit.add(self._tlrm_flush_dirty_counters)
+        for company_id in company_ids:
+            dirty[company_id].update(template_ids)
+
+    @api.model
+    def _tlrm_flush_dirty_counters(self):
+        """Refresh every template/company pair marked dirty in this transaction."""
+        dirty = self.env.cr.precommit.data.pop('tlrm.counters_dirty', {})
+        for company_id, template_ids in dirty.items():
+            company = self.env['res.company'].browse(company_id).exists()
+            if company:
+                self.browse(template_ids)._tlrm_refresh_counters(company)
+        self.env.flush_all()
+
+    @api.model
+    def _tlrm_refresh_all_counters(self, batch_size=1000, companies=None):
+        """Refresh the counters of all goods templates for every company.
 
+        Called from a data file on install/upgrade to fill the stored values.
+
+        :param companies: optional res.company records to restrict the refresh to
+        """
+        templates = self.with_context(active_test=False).search([('type', '=', 'consu')])
+        for company in companies or self.env['res.company'].search([]):
+            for start in range(0, len(templates), batch_size):
+                templates[start:start + batch_size]._tlrm_refresh_counters(company)
+
+    @api.model
+    def _cron_tlrm_refresh_counters(self):
+        """Refresh stored counters of products whose bookings crossed the horizon.
+
+        Counters depend on time, so bookings that start or end between the
+        previous and the current window are refreshed even though nothing
+        was written. Each company has its own window (see
+        :meth:`_tlrm_stored_counter_window`); its first run refreshes everything.
+        """
+        Param = self.env['ir.config_parameter'].sudo()
+        for company in self.env['res.company'].search([]):
+            date_from, date_to = self._tlrm_stored_counter_window(company)
+            new_window = '%s|%s' % (
+                fields.Datetime.to_string(date_from),
+                fields.Datetime.to_string(date_to) if date_to else '',
+            )
+            window_param = '%s.%s' % (COUNTER_WINDOW_PARAM, company.id)
+            old_window = Param.get_param(window_param)
+            if old_window == new_window:
+                continue
+            if not old_window:
+                self._tlrm_refresh_all_counters(companies=company)
+            else:
+                old_from = fields.Datetime.to_datetime(old_window.split('|')[0])
+                new_to = date_to or date_from
+                # Over-selecting is harmless: refreshes are exact
+                lines = self.env['tl.rental.booking.line'].sudo().search([
+                    ('company_id', '=', company.id),
+                    ('state', 'in', ACTIVE_BOOKING_STATES),
+                    '|',
+                    '&', ('date_start', '>=', old_from), ('date_start', '<=', new_to),
+                    '&', ('date_end', '>=', old_from), ('date_end', '<=', new_to),
+                ])
+                lines.product_id.product_tmpl_id._tlrm_refresh_counters(company)
+            Param.set_param(window_param, new_window)
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    @api.model
+    def _tlrm_rental_product_domain(self):
+        """Domain of the products shown as rows on the availability screens."""
+        return [('type', '=', 'consu')]
+
+    def _tlrm_get_booked_quantities(self, date_from, date_to=None, company=None,
+                                    warehouse_id=None, states=None):
+        """Return booked quantities per product and state for a time window.
+
+        Uses the same half-open interval logic as the availability grid: a
+        line ``[date_start, date_end)`` counts when it overlaps
+        ``[date_from, date_to)``, or contains ``date_from`` when ``date_to``
+        is None.
+
+        :param date_from: window start (datetime or string)
+        :param date_to: window end (exclusive), or None for an instant
+        :param company: res.company record; defaults to current company
+        :param warehouse_id: optional source stock.warehouse id
+        :param states: booking states to count; defaults to all blocking states
+        :return: dict mapping product_id -> state -> quantity
+        """
+        quantities = {}
+        if not self:
+            return quantities
+        company = company or self.env.company
+        date_from = fields.Datetime.to_datetime(date_from)
+        date_to = fields.Datetime.to_datetime(date_to) if date_to else None
+        domain = [
+            ('product_id', 'in', self.ids),
+            ('company_id', '=', company.id),
+            ('state', 'in', states or ACTIVE_BOOKING_STATES),
+            ('date_end', '>', date_from),
+        ]
+        if date_to:
+            domain.append(('date_start', '<', date_to))
+        else:
+            domain.append(('date_start', '<=', date_from))
+        if warehouse_id:
+            domain.append(('source_warehouse_id', '=', warehouse_id))
+        groups = self.env['tl.rental.booking.line']._read_group(
+            domain,
+            groupby=['product_id', 'state'],
+            aggregates=['quantity:sum'],
+        )
+        for product, state, qty_sum in groups:
+            quantities.setdefault(product.id, {})[state] = qty_sum or 0.0
+        return quantities
@@ -1,11 +1,34 @@
 from odoo import models, fields, api, _
-from odoo.exceptions import ValidationError
+from odoo.tools import SQL
+from odoo.exceptions import AccessError, ValidationError
 import logging
 from datetime import datetime, timedelta
 from collections import defaultdict
+import hashlib
+
+from .rental_perf_stat import tlrm_profiled
+from .rental_grid_engine import TlrmGridEngine
+from .rental_pricing_engine import TlrmPricingEngine
+from .rental_warehouse_allocator import TlrmWarehouseAllocator
+from .rental_grid_flight import grid_flight
+from .product import ACTIVE_BOOKING_STATES
 
 logger = logging.getLogger(__name__)
 
+# Line fields that feed the stored product rental counters
+COUNTER_TRIGGER_FIELDS = {'product_id', 'quantity', 'booking_id'}
+# Line fields that change the availability grid (pushed to open grids over the bus)
+AVAILABILITY_TRIGGER_FIELDS = COUNTER_TRIGGER_FIELDS | {
+    'source_warehouse_id', 'return_warehouse_id', 'expected_return_date',
+}
+AVAILABILITY_BUS_CHANNEL = 'tlrm_availability'
+GRID_CACHE_TTL_PARAM = 'tl_rental_manager.grid_cache_ttl'
+AVAILABILITY_BUS_TYPE = 'tlrm_availability_delta'
+# Availability exports: weeks allowed and products computed at once
+EXPORT_MAX_WEEKS = 104
+EXPORT_CHUNK_SIZE = 200
+AUTO_ALLOCATE_PARAM = 'tl_rental_manager.auto_allocate_warehouses'
+
 
 class TlRentalBooking(models.Model):
     _name = 'tl.rental.booking'
@@ -57,6 +80,14 @@ class TlRentalBooking(models.Model):
     
     notes = fields.Text(string="Notes")
 
+    currency_id = fields.Many2one(related='company_id.currency_id', string="Currency")
+    amount_total = fields.Monetary(string="Rental Total", compute='_compute_amount_total')
+
+    @api.depends('line_ids.price_subtotal')
+    def _compute_amount_total(self):
+        for booking in self:
+            booking.amount_total = sum(booking.line_ids.mapped('price_subtotal'))
+
     @api.model_create_multi
     def create(self, vals_list):
         for vals in vals_list:
@@ -64,8 +95,42 @@ class TlRentalBooking(models.Model):
                 vals['name'] = self.env['ir.sequence'].next_by_code('tl.rental.booking') or _('New')
         return super().create(vals_list)
 
+    @api.model
+    def _reserve_names(self, count):
+        """Return ``count`` booking references, reserved from the sequence at once.
+
+        Standard (gap-allowed) sequences hand out the whole block in one
+        query; other sequences fall back to one number at a time.
+
+        :param count: number of references to reserve
+        :return: list of booking references
+        """
+        if count <= 0:
+            return []
+        sequence = self.env['ir.sequence'].sudo().search([
+            ('code', '=', 'tl.rental.booking'),
+            ('company_id', 'in', [self.env.company.id, False]),
+        ], order='company_id', limit=1)
+        if not sequence:
+            return [_('New')] * count
+        if sequence.implementation != 'standard' or sequence.use_date_range:
+            return [sequence.next_by_id() for _index in range(count)]
+        self.env.cr.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            ['ir_sequence_%03d' % sequence.id, count],
+        )
+        return [sequence.get_next_char(number) for number, in self.env.cr.fetchall()]
+
+    @tlrm_profiled('action_confirm')
     def action_confirm(self):
-        """Confirm booking: draft -> reserved (soft hold, no picking yet)."""
+        """Confirm booking: draft -> reserved (soft hold, no picking yet).
+
+        With ``tl_rental_manager.auto_allocate_warehouses`` set, lines whose
+        source warehouse lacks units are first moved to other warehouses,
+        see :meth:`_allocate_warehouses`.
+        """
+        if self.env['ir.config_parameter'].sudo().get_param(AUTO_ALLOCATE_PARAM):
+            self._allocate_warehouses(only_if_short=True)
         for booking in self:
             # Validate header fields only when confirming
             if not booking.date_start:
@@ -87,6 +152,7 @@ class TlRentalBooking(models.Model):
             # Planned is a soft hold - no picking created yet, blocks availability for planning
             booking.state = 'planned'
 
+    @tlrm_profiled('action_reserve')
     def action_reserve(self):
         """Reserve booking: planned -> reserved (hard commitment, creates pickings)."""
         for booking in self:
@@ -96,12 +162,14 @@ class TlRentalBooking(models.Model):
             # Hard availability check - this is the commitment point
             for line in booking.line_ids:
                 line._check_line_availability()
-            
-            # Create outbound and return pickings
-            booking._create_start_picking()
-            booking._create_return_picking()
-            booking.state = 'reserved'
 
+        # Create outbound and return pickings of all bookings at once, so
+        # consolidated warehouses get one wave picking per day
+        self._create_start_picking()
+        self._create_return_picking()
+        self.state = 'reserved'
+
+    @tlrm_profiled('action_mark_ongoing')
     def action_mark_ongoing(self):
         """Mark as ongoing: reserved -> ongoing (items physically out)."""
         for booking in self:
@@ -109,6 +177,7 @@ class TlRentalBooking(models.Model):
                 raise ValidationError(_("Only reserved bookings can be marked as ongoing."))
             booking.state = 'ongoing'
 
+    @tlrm_profiled('action_finish')
     def action_finish(self):
         """Mark as finished: ongoing -> finished (past return date, awaiting return)."""
         for booking in self:
@@ -116,6 +185,7 @@ class TlRentalBooking(models.Model):
                 raise ValidationError(_("Only ongoing bookings can be marked as finished."))
             booking.state = 'finished'
 
+    @tlrm_profiled('action_return')
     def action_return(self):
         """Mark as returned: finished -> returned (items back in stock)."""
         for booking in self:
@@ -124,10 +194,146 @@ class TlRentalBooking(models.Model):
             # Return pickings were already created at booking time
             booking.state = 'returned'
 
-    def action_cancel(self):
+    def action_allocate_warehouses(self):
+        """Assign the lines to the source warehouses that have the units."""
+        if any(booking.state not in ('draft', 'planned') for booking in self):
+            raise ValidationError(_("Only draft and planned bookings can be reallocated."))
+        shortages = self._allocate_warehouses()
+        messages = [
+            _("%(booking)s: %(qty)s x %(product)s cannot be provided by any warehouse.",
+              booking=booking.name, qty=quantity, product=product.display_name)
+            for booking, by_product in shortages.items()
+            for product, quantity in by_product.items()
+        ]
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _("Allocate Warehouses"),
+                'message': '\n'.join(messages) or _("All lines are allocated to warehouses with available units."),
+                'type': 'warning' if messages else 'success',
+                'sticky': bool(messages),
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            },
+        }
+
+    def _get_warehouse_availability(self, products):
+        """Return the units of ``products`` available per warehouse over this booking's period.
+
+        A warehouse has the units stored in it (including those out on
+        rent from it), minus the active lines leaving from it during the
+        period, plus the units other lines will have moved to it by
+        returning there before the period starts (and minus those moved
+        away). The booking's own lines are ignored.
+
+        :return: dict product_id -> dict warehouse_id -> quantity
+        """
+        self.ensure_one()
+        available = defaultdict(lambda: defaultdict(float))
+        if not products or not self.date_start or not self.date_end:
+            return available
+        company = self.company_id
+        Line = self.env['tl.rental.booking.line'].sudo()
+        for product, location, quantity in self.env['stock.quant'].sudo()._read_group(
+            [('product_id', 'in', products.ids), ('company_id', '=', company.id),
+             ('location_id.usage', '=', 'internal'), ('location_id.warehouse_id', '!=', False)],
+            ['product_id', 'location_id'], ['quantity:sum'],
+        ):
+            available[product.id][location.warehouse_id.id] += quantity
+        other_lines = [
+            ('product_id', 'in', products.ids),
+            ('company_id', '=', company.id),
+            ('booking_id', '!=', self.id),
+            ('state', 'in', ACTIVE_BOOKING_STATES),
+        ]
+        for product, warehouse, quantity in Line._read_group(
+            other_lines + [('date_start', '<', self.date_end), ('date_end', '>', self.date_start),
+                           ('source_warehouse_id', '!=', False)],
+            ['product_id', 'source_warehouse_id'], ['quantity:sum'],
+        ):
+            available[product.id][warehouse.id] -= quantity
+        for product, source, destination, quantity in Line._read_group(
+            other_lines + [('expected_return_date', '<=', self.date_start),
+                           ('source_warehouse_id', '!=', False), ('return_warehouse_id', '!=', False)],
+            ['product_id', 'source_warehouse_id', 'return_warehouse_id'], ['quantity:sum'],
+        ):
+            if source != destination:
+                available[product.id][source.id] -= quantity
+                available[product.id][destination.id] += quantity
+        return available
+
+    def _allocate_warehouses(self, only_if_short=False):
+        """Move lines, splitting them if needed, to warehouses that have their units.
+
+        Lines follow :class:`TlrmWarehouseAllocator` on a snapshot from
+        :meth:`_get_warehouse_availability`. A line returning to its source
+        warehouse keeps doing so. Planned bookings are checked once all
+        their lines are moved.
+
+        :param only_if_short: leave bookings alone whose lines all fit in
+            their current source warehouse
+        :return: dict booking -> dict product.product -> quantity no
+            warehouse can provide
+        """
+        Line = self.env['tl.rental.booking.line']
+        shortages = {}
         for booking in self:
-            booking.state = 'cancelled'
+            lines = booking.line_ids.filtered(lambda line: line.product_id and line.quantity > 0)
+            if not lines:
+                continue
+            available = booking._get_warehouse_availability(lines.product_id)
+            if only_if_short:
+                needed = defaultdict(float)
+                for line in lines:
+                    needed[line.product_id.id, line.source_warehouse_id.id] += line.quantity
+                if all(available[pid][wid] >= quantity for (pid, wid), quantity in needed.items()):
+                    continue
+            allocator = TlrmWarehouseAllocator(available, booking.source_warehouse_id.id)
+            allocation, short = allocator.allocate(
+                [(line.id, line.product_id.id, line.quantity) for line in lines]
+            )
 
+            # Lines are moved one by one: check them once, set-based, below
+            lines.check_access('write')
+            Line.check_access('create')
+            lines = lines.sudo().with_context(tlrm_skip_availability_check=True)
+            new_vals = []
+            for line in lines:
+                (warehouse_id, quantity), *others = allocation[line.id]
+                follows = not line.return_warehouse_id or line.return_warehouse_id == line.source_warehouse_id
+                vals = {}
+                if line.source_warehouse_id.id != warehouse_id:
+                    vals['source_warehouse_id'] = warehouse_id
+                    if follows:
+                        vals['return_warehouse_id'] = warehouse_id
+                if others:
+                    vals['quantity'] = quantity
+                if vals:
+                    line.write(vals)
+                for other_warehouse_id, other_quantity in others:
+                    new_vals.append(line.copy_data({
+                        'quantity': other_quantity,
+                        'source_warehouse_id': other_warehouse_id,
+                        'return_warehouse_id': other_warehouse_id if follows else line.return_warehouse_id.id,
+                    })[0])
+            new_lines = Line.sudo().with_context(tlrm_skip_availability_check=True).create(new_vals)
+            if booking.state == 'planned':
+                violations = (lines | new_lines)._get_availability_violations()
+                if violations:
+                    raise ValidationError('\n\n'.join(violations.values()))
+            if short:
+                products = self.env['product.product'].browse(list(short))
+                shortages[booking] = {product: short[product.id] for product in products}
+        return shortages
+
+    @tlrm_profiled('action_cancel')
+    def action_cancel(self):
+        """Cancel bookings, releasing the pickings and reservations of reserved ones."""
+        reserved = self.filtered(lambda booking: booking.state == 'reserved')
+        self.write({'state': 'cancelled'})
+        reserved._tlrm_pending_moves()._action_cancel()
+
+    @tlrm_profiled('action_check_availability')
     def action_check_availability(self):
         """Open the availability wizard for this booking's lines."""
         self.ensure_one()
@@ -160,12 +366,39 @@ class TlRentalBooking(models.Model):
         if self.env.context.get('tlrm_skip_date_tracking'):
             # Temporarily disable tracking for date fields
             self = self.with_context(tracking_disable=True)
+        if {'state', 'company_id', 'date_start', 'date_end'}.intersection(vals):
+            # Return dates equal to the booking end move with it
+            following_lines = self.env['tl.rental.booking.line']
+            if 'date_end' in vals:
+                following_lines = self.line_ids.filtered(
+                    lambda line: line.expected_return_date
+                    and line.expected_return_date == line.booking_id.date_end
+                )
+            # Line states and dates follow the booking through stored related
+            # fields, which do not go through the line's write()
+            self.line_ids._tlrm_mark_counters_dirty()
+            self.line_ids._tlrm_track_availability(-1)
+            res = super().write(vals)
+            self.line_ids._tlrm_mark_counters_dirty()
+            self.line_ids._tlrm_track_availability(1)
+            for booking, lines in following_lines.grouped('booking_id').items():
+                if booking.date_end:
+                    lines.write({'expected_return_date': booking.date_end})
+            if {'date_start', 'date_end'}.intersection(vals):
+                self._tlrm_reschedule_pickings()
+            return res
         return super().write(vals)
+
+    def unlink(self):
+        self.line_ids._tlrm_mark_counters_dirty()
+        self.line_ids._tlrm_track_availability(-1)
+        return super().unlink()
             
     def _expand_states(self, states, domain, order):
         return [key for key, val in type(self).state.selection]
 
     @api.model
+    @tlrm_profiled('get_dashboard_data')
     def get_dashboard_data(self):
         """Return KPI data for the rental dashboard."""
         company = self.env.company
@@ -301,6 +534,24 @@ class TlRentalBooking(models.Model):
             'tlrm_direction': direction,
         }
 
+    @api.model
+    def _prepare_wave_picking_vals(self, picking_type, location_id, location_dest_id, direction, scheduled_date):
+        """Prepare values for a wave picking shared by the bookings of one day.
+
+        :param scheduled_date: start of the day the wave is scheduled on
+        :return: dict of values for stock.picking.create()
+        """
+        return {
+            'picking_type_id': picking_type.id,
+            'location_id': location_id,
+            'location_dest_id': location_dest_id,
+            'company_id': picking_type.company_id.id or self.env.company.id,
+            'origin': _("Rental wave %s", fields.Date.to_string(scheduled_date)),
+            'scheduled_date': scheduled_date,
+            'tlrm_direction': direction,
+            'tlrm_wave': True,
+        }
+
     def _prepare_move_vals(self, line, picking, location_id, location_dest_id):
         """Prepare values for stock.move creation.
         
@@ -318,16 +569,77 @@ class TlRentalBooking(models.Model):
             'company_id': self.company_id.id,
             'location_id': location_id,
             'location_dest_id': location_dest_id,
+            'origin': self.name,
+            'tlrm_booking_id': self.id,
         }
 
+    def _tlrm_create_pickings(self, groups):
+        """Create the pickings and moves of grouped booking lines.
+
+        Lines of a booking-specific group get a picking of that booking.
+        Lines of a wave group (no booking) join the open wave picking with
+        the same type, locations, direction and day, which is created when
+        missing. Each move keeps its booking in ``tlrm_booking_id``.
+        Pickings and moves are created with one ``create`` each.
+
+        :param groups: dict mapping ``(booking, picking_type, location_id,
+            location_dest_id, direction, scheduled_date)`` to a list of
+            ``(booking, line)``; ``booking`` is an empty recordset for waves
+            and ``scheduled_date`` may be ``False``
+        :return: stock.picking recordset of all pickings holding the new moves
+        """
+        Picking = self.env['stock.picking']
+        picking_by_key = {}
+
+        wave_keys = [key for key in groups if not key[0]]
+        if wave_keys:
+            open_waves = Picking.search([
+                ('tlrm_wave', '=', True),
+                ('state', 'not in', ('done', 'cancel')),
+                ('picking_type_id', 'in', list({key[1].id for key in wave_keys})),
+                ('scheduled_date', 'in', list({key[5] for key in wave_keys})),
+            ])
+            for wave in open_waves:
+                key = (
+                    self.browse(), wave.picking_type_id, wave.location_id.id, wave.location_dest_id.id,
+                    wave.tlrm_direction, wave.scheduled_date,
+                )
+                picking_by_key.setdefault(key, wave)
+
+        new_keys = [key for key in groups if key not in picking_by_key]
+        vals_list = []
+        for booking, picking_type, location_id, location_dest_id, direction, scheduled_date in new_keys:
+            if booking:
+                vals = booking._prepare_picking_vals(picking_type, location_id, location_dest_id, direction)
+                if scheduled_date:
+                    vals['scheduled_date'] = scheduled_date
+            else:
+                vals = self._prepare_wave_picking_vals(
+                    picking_type, location_id, location_dest_id, direction, scheduled_date,
+                )
+            vals_list.append(vals)
+        picking_by_key.update(zip(new_keys, Picking.create(vals_list)))
+
+        move_vals_list = []
+        for key, lines in groups.items():
+            picking = picking_by_key[key]
+            for booking, line in lines:
+                move_vals = booking._prepare_move_vals(line, picking, key[2], key[3])
+                if key[5]:
+                    # The picking's scheduled date is computed from its moves
+                    move_vals['date'] = key[5]
+                move_vals_list.append(move_vals)
+        self.env['stock.move'].create(move_vals_list)
+        return Picking.union(*(picking_by_key[key] for key in groups))
+
     def _create_outbound_picking(self):
         """Create outbound picking(s) to move products from source to rental location.
         
-        Groups lines by source_warehouse_id.
+        Groups lines by source_warehouse_id. When the source warehouse
+        consolidates rental pickings, lines of all bookings starting on the
+        same day share one wave picking.
         """
-        Picking = self.env['stock.picking']
-        Move = self.env['stock.move']
-
+        groups = {}
         for booking in self:
             lines_by_wh = booking._group_lines_by_warehouse()
 
@@ -343,19 +655,21 @@ class TlRentalBooking(models.Model):
                 if not picking_type:
                     continue
 
-                picking_vals = booking._prepare_picking_vals(
-                    picking_type, source_location.id, rental_location.id, 'out'
-                )
-                picking = Picking.create(picking_vals)
-
-                for line in lines:
-                    move_vals = booking._prepare_move_vals(
-                        line, picking, source_location.id, rental_location.id
+                if source_wh.tlrm_consolidate_pickings:
+                    day = booking.date_start.date() if booking.date_start else fields.Date.context_today(self)
+                    key = (
+                        self.browse(), picking_type, source_location.id, rental_location.id, 'out',
+                        datetime.combine(day, datetime.min.time()),
                     )
-                    Move.create(move_vals)
+                else:
+                    key = (booking, picking_type, source_location.id, rental_location.id, 'out', False)
+                groups.setdefault(key, []).extend((booking, line) for line in lines)
 
-                picking.action_confirm()
-                picking.action_assign()
+        if not groups:
+            return
+        pickings = self._tlrm_create_pickings(groups)
+        pickings.action_confirm()
+        pickings.action_assign()
 
     def _group_lines_for_return(self):
         """Group booking lines by (source_warehouse, return_warehouse, expected_return_date).
@@ -390,10 +704,11 @@ class TlRentalBooking(models.Model):
         gets its own return picking. This supports:
         - Cross-warehouse returns (items returning to different warehouse than source)
         - Partial returns on different dates
-        """
-        Picking = self.env['stock.picking']
-        Move = self.env['stock.move']
 
+        When the return warehouse consolidates rental pickings, lines of all
+        bookings returning on the same day share one wave picking.
+        """
+        groups = {}
         for booking in self:
             lines_by_return = booking._group_lines_for_return()
 
@@ -414,25 +729,64 @@ class TlRentalBooking(models.Model):
                 if not picking_type:
                     continue
 
-                picking_vals = booking._prepare_picking_vals(
-                    picking_type, rental_location.id, return_location.id, 'in'
-                )
-                # Add scheduled date if we have a return date
-                if return_date:
-                    picking_vals['scheduled_date'] = fields.Datetime.to_string(
-                        datetime.combine(return_date, datetime.min.time())
-                    )
-                
-                picking = Picking.create(picking_vals)
-
-                for line in lines:
-                    move_vals = booking._prepare_move_vals(
-                        line, picking, rental_location.id, return_location.id
-                    )
-                    Move.create(move_vals)
-
-                picking.action_confirm()
-                # Don't assign return pickings yet - they'll be assigned when items are ready to return
+                # Schedule on the return date if we have one
+                scheduled_date = return_date and datetime.combine(return_date, datetime.min.time())
+                if return_wh.tlrm_consolidate_pickings and scheduled_date:
+                    key = (self.browse(), picking_type, rental_location.id, return_location.id, 'in', scheduled_date)
+                else:
+                    key = (booking, picking_type, rental_location.id, return_location.id, 'in', scheduled_date or False)
+                groups.setdefault(key, []).extend((booking, line) for line in lines)
+
+        if not groups:
+            return
+        pickings = self._tlrm_create_pickings(groups)
+        pickings.action_confirm()
+        # Don't assign return pickings yet - they'll be assigned when items are ready to return
+
+    def _tlrm_pending_moves(self, direction=None):
+        """Return the rental moves of these bookings that are not done or cancelled.
+
+        :param direction: optional ``'out'`` or ``'in'`` to keep one direction
+        :return: stock.move recordset
+        """
+        domain = [
+            ('state', 'not in', ('done', 'cancel')),
+            '|',
+            ('tlrm_booking_id', 'in', self.ids),
+            # Pickings created before moves carried their booking
+            ('picking_id.tlrm_booking_id', 'in', self.ids),
+        ]
+        if direction:
+            domain.append(('picking_id.tlrm_direction', '=', direction))
+        return self.env['stock.move'].search(domain)
+
+    def _tlrm_reschedule_pickings(self):
+        """Move the pending pickings of reserved bookings to their current dates.
+
+        Outbound moves of a booking's own pickings are moved to the start
+        date, with one write per date. Moves in wave pickings, and all
+        return moves (their grouping depends on the line return dates), are
+        cancelled, which unreserves them, and created again for the new
+        dates, so they join the right wave and return pickings.
+        """
+        reserved = self.filtered(lambda booking: booking.state == 'reserved')
+        if not reserved:
+            return
+        outbound = reserved._tlrm_pending_moves('out')
+        rebuild_outbound = outbound.filtered(lambda move: move.picking_id.tlrm_wave).tlrm_booking_id
+
+        moves_by_date = defaultdict(lambda: self.env['stock.move'])
+        for move in outbound:
+            booking = move.tlrm_booking_id or move.picking_id.tlrm_booking_id
+            if booking not in rebuild_outbound and booking.date_start and move.date != booking.date_start:
+                moves_by_date[booking.date_start] |= move
+        for date, moves in moves_by_date.items():
+            moves.write({'date': date})
+
+        rebuilt = outbound.filtered(lambda move: move.tlrm_booking_id in rebuild_outbound)
+        (rebuilt | reserved._tlrm_pending_moves('in'))._action_cancel()
+        rebuild_outbound._create_outbound_picking()
+        reserved._create_return_pickings()
 
     def _create_start_picking(self):
         """Create picking(s) to move products from source to rental location."""
@@ -479,16 +833,33 @@ class TlRentalBookingLine(models.Model):
     product_id = fields.Many2one('product.product', string="Product")
     quantity = fields.Float(string="Quantity", default=1.0, digits='Product Unit of Measure')
     
-    date_start = fields.Datetime(related='booking_id.date_start', store=True)
-    date_end = fields.Datetime(related='booking_id.date_end', store=True)
+    date_start = fields.Datetime(related='booking_id.date_start', store=True, index=True)
+    date_end = fields.Datetime(related='booking_id.date_end', store=True, index=True)
     state = fields.Selection(related='booking_id.state', store=True)
 
+    currency_id = fields.Many2one(related='company_id.currency_id', string="Currency")
+    price_unit = fields.Monetary(
+        string="Unit Price", compute='_compute_price',
+        help="Cheapest rental price of one unit over the booking period, from the "
+             "product's hourly, daily and weekly prices and minimums.",
+    )
+    price_subtotal = fields.Monetary(string="Subtotal", compute='_compute_price')
+
+    # Range lookups by product (grid, availability checks, product counters)
+    _product_period_idx = models.Index('(product_id, company_id, date_start, date_end)')
+    _product_return_idx = models.Index('(product_id, return_warehouse_id, expected_return_date)')
+
     @api.model_create_multi
     def create(self, vals_list):
         """Ensure warehouse and return fields are populated from booking header if not set."""
+        # One browse for all bookings, so their headers are read in one query
+        bookings = self.env['tl.rental.booking'].browse(
+            {vals['booking_id'] for vals in vals_list if vals.get('booking_id')}
+        )
+        bookings_by_id = {booking.id: booking for booking in bookings}
         for vals in vals_list:
             if vals.get('booking_id'):
-                booking = self.env['tl.rental.booking'].browse(vals['booking_id'])
+                booking = bookings_by_id[vals['booking_id']]
                 if not vals.get('source_warehouse_id') and booking.source_warehouse_id:
                     vals['source_warehouse_id'] = booking.source_warehouse_id.id
                 # Default return warehouse to source warehouse
@@ -497,7 +868,94 @@ class TlRentalBookingLine(models.Model):
                 # Default expected return date to booking end date
                 if not vals.get('expected_return_date') and booking.date_end:
                     vals['expected_return_date'] = booking.date_end
-        return super().create(vals_list)
+        lines = super().create(vals_list)
+        lines._tlrm_mark_counters_dirty()
+        lines._tlrm_track_availability(1)
+        return lines
+
+    def write(self, vals):
+        if not AVAILABILITY_TRIGGER_FIELDS.intersection(vals):
+            return super().write(vals)
+        counters = bool(COUNTER_TRIGGER_FIELDS.intersection(vals))
+        if counters:
+            self._tlrm_mark_counters_dirty()
+        self._tlrm_track_availability(-1)
+        res = super().write(vals)
+        if counters:
+            self._tlrm_mark_counters_dirty()
+        self._tlrm_track_availability(1)
+        return res
+
+    def unlink(self):
+        self._tlrm_mark_counters_dirty()
+        self._tlrm_track_availability(-1)
+        return super().unlink()
+
+    def _tlrm_mark_counters_dirty(self):
+        """Schedule a refresh of the stored rental counters of these lines' products."""
+        if not self:
+            return
+        self.env['product.template']._tlrm_mark_counters_dirty(
+            self.product_id.product_tmpl_id.ids,
+            self.company_id.ids,
+        )
+
+    def _tlrm_track_availability(self, sign):
+        """Queue the availability contribution of these lines for open grids.
+
+        Called with ``-1`` before and ``1`` after a change, so only the net
+        difference per (kind, company, product, warehouse, period) remains
+        when the transaction commits. Committed quantities cover
+        ``[date_start, date_end)`` at the source warehouse; incoming returns
+        land at the return warehouse on the expected return date.
+
+        :param sign: ``1`` to add the lines' current contribution, ``-1`` to remove it
+        """
+        if not self:
+            return
+        precommit = self.env.cr.precommit
+        deltas = precommit.data.setdefault('tlrm.availability_deltas', defaultdict(float))
+        if not deltas:
+            precommit.add(self._tlrm_send_availability_deltas)
+        for line in self:
+            if (not line.product_id or not line.company_id or not line.quantity
+                    or line.state not in ACTIVE_BOOKING_STATES):
+                continue
+            qty = sign * line.quantity
+            if line.date_start and line.date_end:
+                deltas[(
+                    'committed', line.company_id.id, line.product_id.id,
+                    line.source_warehouse_id.id or False,
+                    fields.Datetime.to_string(line.date_start),
+                    fields.Datetime.to_string(line.date_end),
+                )] += qty
+            if line.state in ('ongoing', 'finished') and line.expected_return_date:
+                return_date = fields.Datetime.to_string(line.expected_return_date)
+                deltas[(
+                    'incoming', line.company_id.id, line.product_id.id,
+                    line.return_warehouse_id.id or False,
+                    return_date, return_date,
+                )] += qty
+
+    @api.model
+    def _tlrm_send_availability_deltas(self):
+        """Publish the net availability deltas of this transaction, one message per company.
+
+        Message payload: ``{'company_id', 'deltas'}`` where each delta is
+        ``[kind, product_id, warehouse_id, start, end, quantity]``.
+        """
+        deltas = self.env.cr.precommit.data.pop('tlrm.availability_deltas', {})
+        by_company = defaultdict(list)
+        for (kind, company_id, product_id, warehouse_id, start, end), qty in deltas.items():
+            if abs(qty) > 1e-9:
+                by_company[company_id].append([kind, product_id, warehouse_id, start, end, qty])
+        for company_id, company_deltas in by_company.items():
+            company = self.env['res.company'].browse(company_id)
+            self.env['bus.bus']._sendone(
+                (company, AVAILABILITY_BUS_CHANNEL),
+                AVAILABILITY_BUS_TYPE,
+                {'company_id': company_id, 'deltas': company_deltas},
+            )
 
     @api.onchange('booking_id')
     def _onchange_booking_id(self):
@@ -531,6 +989,7 @@ class TlRentalBookingLine(models.Model):
                       - finished overlapping
                       + incoming returns (to source_wh, before date_start)
         """
+        PerfStat = self.env['tl.rental.perf.stat']
         for line in self:
             if not line.product_id or not line.date_start or not line.date_end:
                 continue
@@ -538,6 +997,7 @@ class TlRentalBookingLine(models.Model):
             if line.quantity <= 0:
                 continue
 
+            perf = PerfStat._new_recorder()
             product = line.product_id
             product_template = product.product_tmpl_id
             company = line.company_id or self.env.company
@@ -546,7 +1006,8 @@ class TlRentalBookingLine(models.Model):
             source_wh = line.source_warehouse_id or line.booking_id.source_warehouse_id
             
             # Get fleet capacity from product template
-            fleet_capacity = product_template.tlrm_fleet_capacity or 0.0
+            with perf.phase('capacity'):
+                fleet_capacity = product_template.tlrm_fleet_capacity or 0.0
             
             logger.debug(
                 "Availability check for %s in warehouse %s: fleet_capacity=%s",
@@ -572,8 +1033,9 @@ class TlRentalBookingLine(models.Model):
             ]
             if source_wh:
                 domain.append(('source_warehouse_id', '=', source_wh.id))
-            overlapping_lines = self.search(domain)
-            committed_qty = sum(overlapping_lines.mapped('quantity'))
+            with perf.phase('committed'):
+                overlapping_lines = self.search(domain)
+                committed_qty = sum(overlapping_lines.mapped('quantity'))
 
             # Find incoming returns to this warehouse before booking starts
             # These are items returning TO source_wh with expected_return_date before line.date_start
@@ -585,10 +1047,18 @@ class TlRentalBookingLine(models.Model):
                 ('return_warehouse_id', '=', source_wh.id if source_wh else False),
                 ('expected_return_date', '<=', line.date_start),
             ]
-            incoming_lines = self.search(incoming_domain)
-            incoming_qty = sum(incoming_lines.mapped('quantity'))
+            with perf.phase('incoming'):
+                incoming_lines = self.search(incoming_domain)
+                incoming_qty = sum(incoming_lines.mapped('quantity'))
 
             available = fleet_capacity - committed_qty + incoming_qty
+            perf.row_count = len(overlapping_lines) + len(incoming_lines)
+            PerfStat._record(
+                'line_check', perf,
+                company_id=company.id if company else None,
+                warehouse_id=source_wh.id if source_wh else None,
+                product_id=product.id,
+            )
 
             logger.debug(
                 "Availability for %s: fleet=%s, committed=%s, incoming=%s, available=%s, requested=%s",
@@ -596,22 +1066,183 @@ class TlRentalBookingLine(models.Model):
             )
 
             if line.quantity > available:
-                raise ValidationError(_(
-                    "Not enough availability for product '%s' during this period.\n"
-                    "Fleet capacity: %s\n"
-                    "Already committed: %s\n"
-                    "Incoming returns: %s\n"
-                    "Available: %s\n"
-                    "Requested: %s"
-                ) % (product.display_name, fleet_capacity, committed_qty, incoming_qty, available, line.quantity))
+                raise ValidationError(line._availability_error_message(
+                    fleet_capacity, committed_qty, incoming_qty, available,
+                ))
+
+    def _availability_error_message(self, fleet_capacity, committed_qty, incoming_qty, available):
+        """Explain why this line's quantity exceeds availability."""
+        self.ensure_one()
+        return _(
+            "Not enough availability for product '%s' during this period.\n"
+            "Fleet capacity: %s\n"
+            "Already committed: %s\n"
+            "Incoming returns: %s\n"
+            "Available: %s\n"
+            "Requested: %s"
+        ) % (self.product_id.display_name, fleet_capacity, committed_qty, incoming_qty, available, self.quantity)
+
+    def _get_availability_violations(self, ordered=False):
+        """Set-based counterpart of :meth:`_check_line_availability`.
+
+        Committed and incoming quantities of all lines are summed in one
+        query instead of two searches per line, with the same rules.
+
+        :param ordered: count, among the lines of ``self``, only those
+            created before each line (lower id), as if the lines had been
+            checked one by one while being created
+        :return: dict line id -> error message for the lines exceeding availability
+        """
+        lines = self.filtered(
+            lambda line: line.product_id and line.date_start and line.date_end
+            and line.quantity > 0 and line.state in ACTIVE_BOOKING_STATES
+        )
+        if not lines:
+            return {}
+        self.env.flush_all()
+        committed_filter = incoming_filter = ""
+        if ordered:
+            committed_filter = "AND (o.id < l.id OR o.id NOT IN %(all_ids)s)"
+            incoming_filter = "AND (i.id < l.id OR i.id NOT IN %(all_ids)s)"
+        self.env.cr.execute(f"""
+            SELECT l.id,
+                   (SELECT COALESCE(SUM(o.quantity), 0)
+                      FROM tl_rental_booking_line o
+                     WHERE o.id != l.id
+                       AND o.product_id = l.product_id
+                       AND o.company_id = l.company_id
+                       AND o.state IN %(active_states)s
+                       AND o.date_start < l.date_end
+                       AND o.date_end > l.date_start
+                       AND (l.source_warehouse_id IS NULL OR o.source_warehouse_id = l.source_warehouse_id)
+                       {committed_filter}),
+                   (SELECT COALESCE(SUM(i.quantity), 0)
+                      FROM tl_rental_booking_line i
+                     WHERE i.id != l.id
+                       AND i.product_id = l.product_id
+                       AND i.company_id = l.company_id
+                       AND i.state IN ('ongoing', 'finished')
+                       AND i.return_warehouse_id IS NOT DISTINCT FROM l.source_warehouse_id
+                       AND i.expected_return_date <= l.date_start
+                       {incoming_filter})
+              FROM tl_rental_booking_line l
+             WHERE l.id IN %(line_ids)s
+        """, {
+            'active_states': tuple(ACTIVE_BOOKING_STATES),
+            'line_ids': tuple(lines.ids),
+            'all_ids': tuple(self.ids),
+        })
+        quantities = {
+            line_id: (float(committed), float(incoming))
+            for line_id, committed, incoming in self.env.cr.fetchall()
+        }
+
+        violations = {}
+        for company, company_lines in lines.grouped('company_id').items():
+            fleet_by_product = self.with_company(company)._get_base_capacity(
+                company_lines.product_id.ids, None, company,
+            )
+            for line in company_lines:
+                fleet_capacity = fleet_by_product.get(line.product_id.id, 0.0)
+                if fleet_capacity <= 0:
+                    violations[line.id] = _(
+                        "No fleet capacity configured for product '%s'. "
+                        "Please set the Fleet Capacity on the product."
+                    ) % line.product_id.display_name
+                    continue
+                committed_qty, incoming_qty = quantities[line.id]
+                available = fleet_capacity - committed_qty + incoming_qty
+                if line.quantity > available:
+                    violations[line.id] = line._availability_error_message(
+                        fleet_capacity, committed_qty, incoming_qty, available,
+                    )
+        return violations
 
     @api.constrains('product_id', 'date_start', 'date_end', 'state', 'company_id', 'quantity')
     def _constrains_check_availability(self):
-        """Check availability for all planning commitments (planned, reserved, ongoing, finished)."""
+        """Check availability for all planning commitments (planned, reserved, ongoing, finished).
+
+        When the database capacity guard is enabled (tl.rental.capacity.guard),
+        this check is the early, user-friendly warning; the trigger enforces
+        the same rule atomically for every write path.
+
+        Server-side batch code (booking import, warehouse allocation, picking
+        state sync) skips this check by passing ``tlrm_skip_availability_check``
+        in a superuser environment, and validates the lines itself with
+        :meth:`_get_availability_violations`. The context comes from the
+        client, so the key is ignored in any other environment.
+        """
+        if self.env.su and self.env.context.get('tlrm_skip_availability_check'):
+            return
         for line in self:
             if line.state in ['planned', 'reserved', 'ongoing', 'finished']:
                 line._check_line_availability()
 
+    @api.depends('product_id', 'quantity', 'date_start', 'date_end')
+    def _compute_price(self):
+        prices = self._tlrm_compute_prices(
+            self.product_id, [(line.product_id, line.date_start, line.date_end) for line in self]
+        )
+        for line, (price, _weeks, _days, _hours) in zip(self, prices):
+            line.price_unit = price
+            line.price_subtotal = price * line.quantity
+
+    @api.model
+    def _tlrm_compute_prices(self, products, items):
+        """Price many rental periods in one pass of the pricing engine.
+
+        :param products: product.product records of the items, read in one go
+        :param items: list of ``(product, date_start, date_end)`` tuples
+        :return: list of ``(unit_price, weeks, days, hours)`` tuples, in order
+        """
+        products.product_tmpl_id  # prefetch the templates of all items at once
+        hours = []
+        for _product, date_start, date_end in items:
+            date_start = fields.Datetime.to_datetime(date_start)
+            date_end = fields.Datetime.to_datetime(date_end)
+            if date_start and date_end and date_end > date_start:
+                hours.append((date_end - date_start).total_seconds() / 3600.0)
+            else:
+                hours.append(0.0)
+        engine = TlrmPricingEngine(self.env['product.template']._tlrm_get_price_tables())
+        return engine.price([product.product_tmpl_id.id for product, _start, _end in items], hours)
+
+    @api.model
+    def get_rental_quote(self, lines, company_id=None):
+        """Price candidate booking lines without creating them.
+
+        :param lines: list of dicts with ``product_id``, ``quantity``,
+            ``date_start`` and ``date_end``
+        :param company_id: optional res.company id for the currency; defaults
+            to the current company
+        :return: dict with ``lines`` (unit price, subtotal and billed weeks,
+            days and hours per line, in order), ``amount_total`` and
+            ``currency_id``
+        """
+        self.check_access('read')
+        company = self.env['res.company'].browse(company_id) if company_id else self.env.company
+        Product = self.env['product.product']
+        products = Product.browse({vals['product_id'] for vals in lines if vals.get('product_id')}).exists()
+        products_by_id = {product.id: product for product in products}
+        items = [
+            (products_by_id.get(vals.get('product_id'), Product), vals.get('date_start'), vals.get('date_end'))
+            for vals in lines
+        ]
+        quote_lines = []
+        for vals, (price, weeks, days, hours) in zip(lines, self._tlrm_compute_prices(products, items)):
+            quote_lines.append({
+                'price_unit': company.currency_id.round(price),
+                'price_subtotal': company.currency_id.round(price * float(vals.get('quantity') or 0.0)),
+                'weeks': weeks,
+                'days': days,
+                'hours': hours,
+            })
+        return {
+            'lines': quote_lines,
+            'amount_total': company.currency_id.round(sum(line['price_subtotal'] for line in quote_lines)),
+            'currency_id': company.currency_id.id,
+        }
+
     @api.model
     def _normalize_grid_params(self, product_ids, week_count, company_id, needed_by_product):
         """Normalize and validate input parameters for availability grid.
@@ -798,31 +1429,14 @@ class TlRentalBookingLine(models.Model):
             for week in weeks
         ]
 
-    @api.model
-    def _compute_cell_status(self, available, needed):
-        """Determine cell status and booking_ok flag.
-        
-        :param available: available quantity
-        :param needed: needed quantity (or None)
-        :return: tuple (status, booking_ok)
-        """
-        if needed is not None and needed > 0:
-            if available >= needed:
-                return 'free', True
-            elif available > 0:
-                return 'partial', False
-            else:
-                return 'full', False
-        else:
-            if available <= 0:
-                return 'full', None
-            else:
-                return 'free', None
-
     @api.model
     def _build_grid_rows(self, product_ids, weeks, base_capacity_by_product,
                          committed_by_product_week, incoming_by_product_week, needed_by_product):
         """Build row data for each product in the grid.
+
+        Availability and status are computed for the whole grid at once by
+        :class:`TlrmGridEngine`; dicts are only built here, at the edge.
+        Cells carry numbers only: tooltips are formatted by the client.
         
         :param product_ids: list of product.product ids
         :param weeks: list of week dicts
@@ -833,49 +1447,31 @@ class TlRentalBookingLine(models.Model):
         :return: list of row dicts for the grid
         """
         products = self.env['product.product'].browse(product_ids)
-        rows = []
+        engine = TlrmGridEngine.from_mappings(
+            products.ids, [week['key'] for week in weeks], base_capacity_by_product,
+            committed_by_product_week, incoming_by_product_week, needed_by_product,
+        ).compute()
 
+        grid = engine.materialize()
+        rows = []
         for product in products:
-            fleet_capacity = float(base_capacity_by_product.get(product.id, 0.0) or 0.0)
-            needed = float(needed_by_product.get(product.id, 0.0) or 0.0)
+            fleet_capacity, needed, engine_cells = grid[product.id]
             cell_needed = needed if needed > 0.0 else None
             cells = []
-            
-            # Track cumulative incoming returns for availability projection
-            cumulative_incoming = 0.0
-
-            for week in weeks:
-                week_key = week['key']
-                committed = float(committed_by_product_week[product.id].get(week_key, 0.0) or 0.0)
-                incoming = float(incoming_by_product_week[product.id].get(week_key, 0.0) or 0.0)
-                
-                # Incoming returns accumulate (once returned, they stay available)
-                cumulative_incoming += incoming
-                
-                # Available = fleet - committed + cumulative incoming returns
-                available = max(fleet_capacity - committed + cumulative_incoming, 0.0)
-                status, booking_ok = self._compute_cell_status(available, cell_needed)
-
-                try:
-                    tooltip = _(
-                        "Fleet: %(fleet)s, Committed: %(committed)s, Incoming: %(incoming)s, Available: %(available)s",
-                        fleet=fleet_capacity,
-                        committed=committed,
-                        incoming=cumulative_incoming,
-                        available=available,
-                    )
-                except Exception:
-                    tooltip = None
-
+            for week_key, committed, incoming, cumulative_incoming, available, status in engine_cells:
+                if cell_needed is None:
+                    booking_ok = None
+                else:
+                    booking_ok = status == 'free'
                 cells.append({
                     'column_key': week_key,
                     'committed': committed,
                     'incoming': incoming,
+                    'cumulative_incoming': cumulative_incoming,
                     'available': available,
                     'needed': cell_needed,
                     'status': status,
                     'booking_ok': booking_ok,
-                    'tooltip': tooltip,
                 })
 
             rows.append({
@@ -890,6 +1486,178 @@ class TlRentalBookingLine(models.Model):
 
         return rows
 
+    @api.model
+    def _add_forecast_overlay(self, rows, weeks, warehouse_id, company):
+        """Add the forecast demand of tl.rental.demand.forecast to the grid cells.
+
+        Cells get ``forecast`` (None without a forecast) and
+        ``forecast_short``, set when the forecast demand not yet booked
+        exceeds the available quantity.
+        """
+        overlay = self.env['tl.rental.demand.forecast'].sudo()._get_grid_overlay(
+            company, warehouse_id, [row['product_id'] for row in rows], weeks,
+        )
+        for row in rows:
+            forecast_by_week = overlay.get(row['product_id'], {})
+            for cell in row['cells']:
+                forecast = forecast_by_week.get(cell['column_key'])
+                cell['forecast'] = forecast
+                cell['forecast_short'] = bool(forecast and forecast - cell['committed'] > cell['available'])
+
+    @api.model
+    def _get_availability_change_token(self, company, warehouse_id=None, date_from=None):
+        """Return a short token that changes whenever grid data may have changed.
+
+        Combines, for the company, the count and latest write of booking
+        lines (restricted to lines leaving from or returning to the
+        warehouse when given), bookings and rental products, the fleet
+        capacity of every rental product, and the latest write of warehouses
+        and demand forecasts. The product columns shown in the rows (name,
+        reference, unit, archiving) are also fingerprinted, so changing them
+        within a transaction is seen too.
+        Counts catch deletions; write dates catch updates. The fleet is
+        fingerprinted from its quantities rather than from quant write
+        dates, so stock moves of other products and reservations leave the
+        token unchanged. A changed token may be a false alarm, but an
+        unchanged token means the data of the grid's rows is the same;
+        which products are rows is up to the caller.
+
+        :param company: res.company record
+        :param warehouse_id: optional stock.warehouse id the grid is filtered on
+        :param date_from: optional start of the grid; bookings that ended
+            before it, and are not expected back after it, are left out
+        :return: hexadecimal token string
+        """
+        for model_name in ('tl.rental.booking.line', 'tl.rental.booking', 'stock.quant', 'stock.warehouse',
+                           'product.product', 'product.template', 'uom.uom'):
+            self.env[model_name].flush_model()
+        self.env['stock.location'].flush_model(['usage'])
+        rental_products = self.env['product.product'].sudo().with_context(active_test=False)._search(
+            self.env['product.product']._tlrm_rental_product_domain()
+        )
+        line_filter = SQL()
+        if warehouse_id:
+            line_filter = SQL(
+                "AND (source_warehouse_id = %(warehouse_id)s OR return_warehouse_id = %(warehouse_id)s)",
+                warehouse_id=warehouse_id,
+            )
+        booking_filter = SQL()
+        if date_from:
+            # A line ending before the grid only matters while it is still
+            # expected back within it (incoming returns)
+            line_filter = SQL(
+                "%s AND (date_end IS NULL OR date_end >= %s OR expected_return_date >= %s)",
+                line_filter, date_from, date_from,
+            )
+            booking_filter = SQL("""
+                AND (date_end IS NULL OR date_end >= %(date_from)s OR EXISTS (
+                    SELECT 1 FROM tl_rental_booking_line line
+                     WHERE line.booking_id = tl_rental_booking.id
+                       AND line.expected_return_date >= %(date_from)s))
+            """, date_from=date_from)
+        self.env.cr.execute(SQL("""
+            SELECT
+                (SELECT ROW(COUNT(*), MAX(write_date), MAX(id))::text
+                   FROM tl_rental_booking_line
+                  WHERE company_id = %(company_id)s %(line_filter)s),
+                (SELECT ROW(COUNT(*), MAX(write_date))::text
+                   FROM tl_rental_booking
+                  WHERE company_id = %(company_id)s %(booking_filter)s),
+                (SELECT ROW(COUNT(*), MAX(product.write_date), MAX(template.write_date), md5(string_agg(
+                            concat_ws('|', product.id, product.active, product.default_code, template.name, uom.name),
+                            ',' ORDER BY product.id)))::text
+                   FROM product_product product
+                   JOIN product_template template ON template.id = product.product_tmpl_id
+                   LEFT JOIN uom_uom uom ON uom.id = template.uom_id
+                  WHERE product.id IN %(rental_products)s
+                    AND (template.company_id IS NULL OR template.company_id = %(company_id)s)),
+                (SELECT md5(string_agg(fleet.product_id || ':' || fleet.quantity, ',' ORDER BY fleet.product_id))
+                   FROM (SELECT quant.product_id, SUM(quant.quantity) AS quantity
+                           FROM stock_quant quant
+                           JOIN stock_location location ON location.id = quant.location_id
+                          WHERE quant.company_id = %(company_id)s
+                            AND location.usage = 'internal'
+                            AND quant.product_id IN %(rental_products)s
+                          GROUP BY quant.product_id) fleet),
+                (SELECT ROW(COUNT(*), MAX(write_date))::text
+                   FROM stock_warehouse
+                  WHERE company_id = %(company_id)s),
+                (SELECT MAX(fitted_at)::text
+                   FROM tl_rental_demand_forecast
+                  WHERE company_id = %(company_id)s)
+        """,
+            company_id=company.id,
+            line_filter=line_filter,
+            booking_filter=booking_filter,
+            rental_products=rental_products.subselect(),
+        ))
+        state = repr((company.id, warehouse_id or None, str(date_from or ''), self.env.lang)
+                     + tuple(self.env.cr.fetchone()))
+        return hashlib.sha1(state.encode()).hexdigest()[:20]
+
+    @api.model
+    def _compute_availability_grid(self, product_ids, weeks, week_count, warehouse_id,
+                                   company, needed_by_product, change_token, perf):
+        """Build the grid returned by :meth:`get_availability_grid`.
+
+        :param weeks: list of week dicts from _compute_weeks
+        :param perf: TlrmPerfRecorder timing the phases
+        :return: dict with ``meta``, ``columns`` and ``rows``
+        """
+        # Get overall date range
+        if weeks:
+            overall_start_dt = weeks[0]['start_dt']
+            overall_end_dt = weeks[-1]['end_dt']
+        else:
+            overall_start_dt = fields.Datetime.now()
+            overall_end_dt = overall_start_dt
+
+        # Get fleet capacity and committed/incoming quantities
+        with perf.phase('capacity'):
+            base_capacity_by_product = self._get_base_capacity(product_ids, warehouse_id, company)
+        with perf.phase('committed'):
+            committed_by_product_week = self._get_committed_by_product_week(
+                product_ids, weeks, warehouse_id, company
+            )
+        with perf.phase('incoming'):
+            incoming_by_product_week = self._get_incoming_by_product_week(
+                product_ids, weeks, warehouse_id, company
+            )
+
+        # Build grid structure
+        with perf.phase('rows'):
+            rows = self._build_grid_rows(
+                product_ids, weeks, base_capacity_by_product,
+                committed_by_product_week, incoming_by_product_week, needed_by_product
+            )
+        with perf.phase('forecast'):
+            self._add_forecast_overlay(rows, weeks, warehouse_id, company)
+
+        with perf.phase('serialization'):
+            columns = self._build_grid_columns(weeks)
+            grid = {
+                'meta': {
+                    'company_id': company.id,
+                    'warehouse_id': warehouse_id,
+                    'date_start': fields.Datetime.to_string(overall_start_dt),
+                    'date_end': fields.Datetime.to_string(overall_end_dt),
+                    'week_count': week_count,
+                    'change_token': change_token,
+                },
+                'columns': columns,
+                'rows': rows,
+            }
+
+        return grid
+
+    @api.model
+    def _grid_cache_ttl(self):
+        """Seconds a computed grid is reused by identical requests of this worker."""
+        try:
+            return float(self.env['ir.config_parameter'].sudo().get_param(GRID_CACHE_TTL_PARAM, 5.0))
+        except (TypeError, ValueError):
+            return 0.0
+
     @api.model
     def get_availability_grid(
         self,
@@ -912,48 +1680,143 @@ class TlRentalBookingLine(models.Model):
         :param needed_by_product: optional dict {product_id: qty} used mainly for
             booking-specific views to highlight if capacity is sufficient.
         :return: dict with ``meta``, ``columns`` and ``rows`` suitable for OWL grids.
+            ``meta['change_token']`` identifies the data the grid was built from
+            (see :meth:`_get_availability_change_token`). When performance
+            instrumentation is enabled, ``meta['perf']`` holds per-phase
+            timings, query counts and the row count.
         """
+        return self._get_availability_grid(
+            product_ids, date_start, week_count, warehouse_id, company_id, needed_by_product,
+        )
+
+    @api.model
+    @tlrm_profiled('get_availability_grid')
+    def _get_availability_grid(self, product_ids, date_start, week_count=12, warehouse_id=None,
+                               company_id=None, needed_by_product=None, change_token=None):
+        """Implement :meth:`get_availability_grid`.
+
+        Shared grids are looked up by change token, so only server code may
+        pass one, e.g. the grid routes that already computed it for their ETag.
+
+        :param change_token: change token computed for the same company,
+            warehouse and first week; computed here when not given
+        """
+        perf = self.env['tl.rental.perf.stat']._new_recorder()
+
         # Normalize inputs
         product_ids, week_count, company, needed_by_product = self._normalize_grid_params(
             product_ids, week_count, company_id, needed_by_product
         )
+        if not self.env.su and company not in self.env.user.company_ids:
+            # Results are shared between users: check access before reusing one
+            raise AccessError(_("You are not allowed to access the availability of %s.", company.name))
         self = self.with_context(allowed_company_ids=[company.id])
 
         # Compute week periods
-        weeks = self._compute_weeks(date_start, week_count)
+        with perf.phase('weeks'):
+            weeks = self._compute_weeks(date_start, week_count)
+
+        # Taken before reading the data: a concurrent change makes the token
+        # stale rather than letting a client cache miss it
+        if not change_token:
+            with perf.phase('change_token'):
+                change_token = self._get_availability_change_token(
+                    company, warehouse_id, weeks[0]['start_dt'] if weeks else None,
+                )
 
-        # Get overall date range
-        if weeks:
-            overall_start_dt = weeks[0]['start_dt']
-            overall_end_dt = weeks[-1]['end_dt']
+        def build():
+            # Warm-up snapshots hold plain grids, without needed quantities
+            if not any(needed_by_product.values()):
+                with perf.phase('snapshot'):
+                    grid = self.env['tl.rental.grid.snapshot']._get_grid(
+                        company, warehouse_id, weeks, product_ids, change_token,
+                    )
+                if grid:
+                    return grid
+            return self._compute_availability_grid(
+                product_ids, weeks, week_count, warehouse_id,
+                company, needed_by_product, change_token, perf,
+            )
+
+        if perf.enabled:
+            # Measure real computations only: never coalesce instrumented calls
+            grid = build()
         else:
-            overall_start_dt = fields.Datetime.now()
-            overall_end_dt = overall_start_dt
+            key = (
+                self.env.cr.dbname, company.id, warehouse_id or None, self.env.lang,
+                weeks[0]['key'] if weeks else None, week_count, tuple(product_ids),
+                tuple(sorted((str(pid), qty) for pid, qty in needed_by_product.items())),
+                change_token,
+            )
+            grid = grid_flight.run(key, build, ttl=self._grid_cache_ttl())
+            # Rows are shared between coalesced callers; meta is theirs to extend
+            grid = dict(grid, meta=dict(grid['meta']))
+
+        if perf.enabled:
+            perf.row_count = len(grid['rows'])
+            grid['meta']['perf'] = perf.as_meta()
+            self.env['tl.rental.perf.stat']._record(
+                'grid', perf, company_id=company.id, warehouse_id=warehouse_id,
+            )
+        return grid
 
-        # Get fleet capacity and committed/incoming quantities
-        base_capacity_by_product = self._get_base_capacity(product_ids, warehouse_id, company)
-        committed_by_product_week = self._get_committed_by_product_week(
-            product_ids, weeks, warehouse_id, company
-        )
-        incoming_by_product_week = self._get_incoming_by_product_week(
-            product_ids, weeks, warehouse_id, company
-        )
+    @api.model
+    def _get_availability_export_header(self):
+        """Column labels of the rows yielded by :meth:`_iter_availability_export`."""
+        return [
+            _("Internal Reference"), _("Product"), _("Unit"), _("Fleet"),
+            _("Week"), _("Week Start"), _("Committed"), _("Incoming"),
+            _("Available"), _("Status"),
+        ]
 
-        # Build grid structure
-        columns = self._build_grid_columns(weeks)
-        rows = self._build_grid_rows(
-            product_ids, weeks, base_capacity_by_product,
-            committed_by_product_week, incoming_by_product_week, needed_by_product
-        )
+    @api.model
+    def _iter_availability_export(self, product_domain, date_start, week_count=52,
+                                  warehouse_id=None, company=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Yield the availability of products x weeks, one row per cell.
+
+        Products are read in chunks of ascending id (keyset pagination, so
+        late chunks cost as much as early ones) and each chunk is computed
+        with the grid engine, then dropped from the ORM cache. Memory stays
+        bounded by the chunk size whatever the number of products and weeks.
+        As in the grid, incoming returns accumulate from the first week.
+
+        :param product_domain: domain of the exported products
+        :param date_start: reference date; the export starts on its Monday
+        :param week_count: number of weeks (capped at EXPORT_MAX_WEEKS)
+        :param warehouse_id: optional stock.warehouse id, as in the grid
+        :param company: res.company record; defaults to the current company
+        :param chunk_size: number of products computed at once
+        :return: generator of row lists, see :meth:`_get_availability_export_header`
+        """
+        company = company or self.env.company
+        week_count = min(max(int(week_count or 0), 1), EXPORT_MAX_WEEKS)
+        self = self.with_context(allowed_company_ids=[company.id])
+        weeks = self._compute_weeks(date_start, week_count)
+        week_starts = [fields.Date.to_string(week['start_dt']) for week in weeks]
+        Product = self.env['product.product']
 
-        return {
-            'meta': {
-                'company_id': company.id,
-                'warehouse_id': warehouse_id,
-                'date_start': fields.Datetime.to_string(overall_start_dt),
-                'date_end': fields.Datetime.to_string(overall_end_dt),
-                'week_count': week_count,
-            },
-            'columns': columns,
-            'rows': rows,
-        }
+        last_id = 0
+        while True:
+            products = Product.search(
+                list(product_domain or []) + [('id', '>', last_id)], order='id', limit=chunk_size,
+            )
+            if not products:
+                return
+            last_id = products[-1].id
+            product_ids = products.ids
+            grid = TlrmGridEngine.from_mappings(
+                product_ids, [week['key'] for week in weeks],
+                self._get_base_capacity(product_ids, warehouse_id, company),
+                self._get_committed_by_product_week(product_ids, weeks, warehouse_id, company),
+                self._get_incoming_by_product_week(product_ids, weeks, warehouse_id, company),
+                {},
+            ).compute().materialize()
+            for product in products:
+                fleet, _needed, cells = grid[product.id]
+                head = [product.default_code or '', product.display_name, product.uom_id.name, fleet]
+                for week_start, (week_key, committed, incoming, _cumulative, available, status) in zip(
+                    week_starts, cells,
+                ):
+                    yield head + [week_key, week_start, committed, incoming, available, status]
+            # Release the chunk before reading the next one
+            self.env.invalidate_all()
@@ -0,0 +1,151 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS_PARAM = 'tl_rental_manager.archive_after_days'
+ARCHIVE_CHUNK_SIZE_PARAM = 'tl_rental_manager.archive_chunk_size'
+ARCHIVED_BOOKING_STATES = ('returned', 'cancelled')
+
+
+class TlRentalBookingArchive(models.Model):
+    """Closed booking moved out of ``tl_rental_booking``.
+
+    Returned and cancelled bookings older than the archive horizon are
+    copied here by a cron, with their lines, and deleted from the live
+    tables. Availability queries only ever read the live tables, which stay
+    as small as the open bookings; archived data stays reportable here.
+    """
+    _name = 'tl.rental.booking.archive'
+    _description = 'TL Rental Archived Booking'
+    _order = 'date_start desc, id desc'
+
+    original_id = fields.Integer(string="Original Booking ID", readonly=True)
+    name = fields.Char(string="Booking Reference", readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", readonly=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', string="Customer", readonly=True)
+    project_id = fields.Many2one('project.project', string="Project", readonly=True)
+    source_warehouse_id = fields.Many2one('stock.warehouse', string="Source Warehouse", readonly=True)
+    date_start = fields.Datetime(string="Start Date", readonly=True)
+    date_end = fields.Datetime(string="End Date", readonly=True)
+    state = fields.Selection([
+        ('returned', 'Returned'),
+        ('cancelled', 'Cancelled'),
+    ], string="Status", readonly=True)
+    notes = fields.Text(string="Notes", readonly=True)
+    archived_at = fields.Datetime(string="Archived On", readonly=True)
+    line_ids = fields.One2many('tl.rental.booking.line.archive', 'archive_id', string="Lines", readonly=True)
+
+    _original_uniq = models.UniqueIndex('(original_id)')
+
+    @api.model
+    def _cron_archive_closed_bookings(self, auto_commit=None):
+        """Archive closed bookings older than the horizon, one chunk per transaction.
+
+        The horizon (``tl_rental_manager.archive_after_days``, default 365,
+        ``0`` disables archiving) counts from the booking end date, or from
+        its last change when it has none. Chunks hold
+        ``tl_rental_manager.archive_chunk_size`` bookings (default 500).
+        """
+        if auto_commit is None:
+            auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            days = int(ICP.get_param(ARCHIVE_AFTER_DAYS_PARAM, 365))
+            chunk_size = int(ICP.get_param(ARCHIVE_CHUNK_SIZE_PARAM, 500))
+        except (TypeError, ValueError):
+            days, chunk_size = 365, 500
+        if days <= 0:
+            return 0
+        cutoff = fields.Datetime.now() - timedelta(days=days)
+        Booking = self.env['tl.rental.booking'].sudo()
+        domain = [
+            ('state', 'in', ARCHIVED_BOOKING_STATES),
+            '|',
+            ('date_end', '<', cutoff),
+            '&', ('date_end', '=', False), ('write_date', '<', cutoff),
+        ]
+
+        archived = 0
+        while True:
+            bookings = Booking.search(domain, order='id', limit=max(chunk_size, 1))
+            if not bookings:
+                break
+            archived += len(self._archive_bookings(bookings))
+            if auto_commit:
+                self.env.cr.commit()
+            self.env.invalidate_all()
+            logger.info("Archived %s closed rental bookings so far", archived)
+        return archived
+
+    @api.model
+    def _archive_bookings(self, bookings):
+        """Copy ``bookings`` and their lines to the archive tables, then delete them.
+
+        Rows are copied with two ``INSERT ... SELECT`` statements; the live
+        records are deleted through the ORM so that related data (messages,
+        followers, picking links) is cleaned up as usual.
+
+        :param bookings: tl.rental.booking records in a closed state
+        :return: the created tl.rental.booking.archive records
+        """
+        if not bookings:
+            return self.browse()
+        self.env.flush_all()
+        params = {'booking_ids': tuple(bookings.ids), 'uid': self.env.uid}
+        self.env.cr.execute("""
+            INSERT INTO tl_rental_booking_archive (
+                original_id, name, company_id, partner_id, project_id, source_warehouse_id,
+                date_start, date_end, state, notes, archived_at,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT id, name, company_id, partner_id, project_id, source_warehouse_id,
+                   date_start, date_end, state, notes, NOW() AT TIME ZONE 'UTC',
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM tl_rental_booking
+             WHERE id IN %(booking_ids)s
+            RETURNING id
+        """, params)
+        archive_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.env.cr.execute("""
+            INSERT INTO tl_rental_booking_line_archive (
+                archive_id, company_id, product_id, quantity, source_warehouse_id,
+                return_warehouse_id, expected_return_date, date_start, date_end, state,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT archive.id, line.company_id, line.product_id, line.quantity, line.source_warehouse_id,
+                   line.return_warehouse_id, line.expected_return_date, line.date_start, line.date_end,
+                   line.state,
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM tl_rental_booking_line line
+              JOIN tl_rental_booking_archive archive ON archive.original_id = line.booking_id
+             WHERE line.booking_id IN %(booking_ids)s
+        """, params)
+        bookings.unlink()
+        return self.browse(archive_ids)
+
+
+class TlRentalBookingLineArchive(models.Model):
+    """Line of an archived booking, see :class:`TlRentalBookingArchive`."""
+    _name = 'tl.rental.booking.line.archive'
+    _description = 'TL Rental Archived Booking Line'
+    _order = 'date_start desc, id desc'
+
+    archive_id = fields.Many2one(
+        'tl.rental.booking.archive', string="Booking", required=True, readonly=True,
+        ondelete='cascade', index=True,
+    )
+    company_id = fields.Many2one('res.company', string="Company", readonly=True, ondelete='cascade')
+    product_id = fields.Many2one('product.product', string="Product", readonly=True, index=True)
+    quantity = fields.Float(string="Quantity", readonly=True, digits='Product Unit of Measure')
+    source_warehouse_id = fields.Many2one('stock.warehouse', string="Source Warehouse", readonly=True)
+    return_warehouse_id = fields.Many2one('stock.warehouse', string="Return Warehouse", readonly=True)
+    expected_return_date = fields.Datetime(string="Expected Return Date", readonly=True)
+    date_start = fields.Datetime(string="Start Date", readonly=True)
+    date_end = fields.Datetime(string="End Date", readonly=True)
+    state = fields.Selection([
+        ('returned', 'Returned'),
+        ('cancelled', 'Cancelled'),
+    ], string="Status", readonly=True)
@@ -0,0 +1,382 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+import base64
+import csv
+import io
+import json
+import logging
+import time
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Columns of an import file, one row per booking line
+IMPORT_COLUMNS = [
+    'booking_ref', 'project', 'warehouse', 'customer', 'date_start', 'date_end',
+    'state', 'product', 'quantity', 'return_warehouse', 'notes',
+]
+IMPORT_STATES = ('draft', 'planned')
+
+
+class TlRentalBookingImport(models.TransientModel):
+    """Bulk import of bookings from a CSV, JSON or JSON Lines file.
+
+    The file holds one booking line per row; consecutive rows sharing a
+    ``booking_ref`` form one booking. Rows are read lazily and imported in
+    chunks of whole bookings. For each chunk, references (products,
+    warehouses, projects, customers) are resolved with one search per
+    model, booking names are reserved from the sequence as one block,
+    bookings and lines are created with one ``create`` each, and
+    availability is validated for the whole chunk at once. Rejected
+    bookings are rolled back and reported in a result file.
+    """
+    _name = 'tl.rental.booking.import'
+    _description = 'TL Rental Booking Import'
+
+    file = fields.Binary(string="File", required=True)
+    filename = fields.Char(string="File Name")
+    chunk_size = fields.Integer(
+        string="Lines per Chunk",
+        default=1000,
+        help="Booking lines created and validated together. Bookings are never split across chunks.",
+    )
+    state = fields.Selection([
+        ('upload', 'Upload'),
+        ('done', 'Done'),
+    ], default='upload')
+    booking_count = fields.Integer(string="Imported Bookings", readonly=True)
+    line_count = fields.Integer(string="Imported Lines", readonly=True)
+    rejected_count = fields.Integer(string="Rejected Lines", readonly=True)
+    duration = fields.Float(string="Duration (s)", readonly=True, digits=(16, 1))
+    result_file = fields.Binary(string="Rejected Rows", readonly=True, attachment=False)
+    result_filename = fields.Char(readonly=True)
+
+    def _iter_rows(self):
+        """Yield the rows of the uploaded file as dicts, with their ``row_number``.
+
+        ``.jsonl`` / ``.ndjson`` files hold one JSON object per line and are
+        read lazily; ``.json`` files hold one array of objects. Anything
+        else is read as CSV with a header.
+        """
+        self.ensure_one()
+        data = base64.b64decode(self.file or b'')
+        stream = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+        filename = (self.filename or '').lower()
+        if filename.endswith(('.jsonl', '.ndjson')):
+            for row_number, text in enumerate(stream, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    values = json.loads(text)
+                except ValueError:
+                    raise UserError(_("Line %s is not a valid JSON object.", row_number))
+                yield self._json_row(values, row_number)
+        elif filename.endswith('.json'):
+            try:
+                rows = json.load(stream)
+            except ValueError:
+                raise UserError(_("The file is not valid JSON."))
+            if not isinstance(rows, list):
+                raise UserError(_("A .json file must hold an array of objects, one per booking line. "
+                                  "Use .jsonl for one object per line."))
+            for row_number, values in enumerate(rows, start=1):
+                yield self._json_row(values, row_number)
+        else:
+            reader = csv.DictReader(stream)
+            missing = {'booking_ref', 'product', 'quantity'} - set(reader.fieldnames or [])
+            if missing:
+                raise UserError(_("Missing columns in the import file: %s", ', '.join(sorted(missing))))
+            for row_number, values in enumerate(reader, start=2):
+                yield dict(values, row_number=row_number)
+
+    def _json_row(self, values, row_number):
+        """Return the import row of one JSON object, see :meth:`_iter_rows`."""
+        if not isinstance(values, dict):
+            raise UserError(_("Row %s is not a valid JSON object.", row_number))
+        return dict({key: str(value) for key, value in values.items() if value is not None},
+                    row_number=row_number)
+
+    def _iter_chunks(self, rows, rejects):
+        """Group consecutive rows into bookings, and bookings into chunks.
+
+        :param rejects: list receiving ``(row, message)`` of rows that cannot
+            be grouped
+        :return: generator of lists of booking row groups
+        """
+        chunk_size = max(self.chunk_size or 0, 1)
+        seen = set()
+        chunk, chunk_lines = [], 0
+        group, group_ref = [], None
+
+        def close_group():
+            nonlocal chunk, chunk_lines
+            if not group:
+                return None
+            if group_ref in seen:
+                for row in group:
+                    rejects.append((row, _("Rows of booking %s must be consecutive.", group_ref)))
+                return None
+            seen.add(group_ref)
+            chunk.append(group)
+            chunk_lines += len(group)
+            if chunk_lines >= chunk_size:
+                full, chunk, chunk_lines = chunk, [], 0
+                return full
+            return None
+
+        for row in rows:
+            ref = (row.get('booking_ref') or '').strip()
+            if not ref:
+                rejects.append((row, _("Missing booking reference.")))
+                continue
+            if ref != group_ref:
+                full = close_group()
+                if full:
+                    yield full
+                group, group_ref = [], ref
+            group.append(row)
+        full = close_group()
+        if full:
+            yield full
+        if chunk:
+            yield chunk
+
+    def _resolve_references(self, chunk, cache):
+        """Fill ``cache`` with the records referenced by ``chunk``, one search per model.
+
+        :param cache: dict model -> {key: record id or False}, kept across chunks
+        """
+        company = self.env.company
+        wanted = {'product.product': set(), 'project.project': set(), 'res.partner': set()}
+        for group in chunk:
+            for row in group:
+                wanted['product.product'].add((row.get('product') or '').strip())
+                wanted['project.project'].add((row.get('project') or '').strip())
+                wanted['res.partner'].add((row.get('customer') or '').strip())
+
+        if 'stock.warehouse' not in cache:
+            warehouses = cache['stock.warehouse'] = {}
+            for warehouse in self.env['stock.warehouse'].search([('company_id', '=', company.id)]):
+                warehouses.setdefault(warehouse.name, warehouse.id)
+                warehouses[warehouse.code] = warehouse.id
+
+        searches = {
+            'product.product': ('default_code', [
+                ('company_id', 'in', [company.id, False]),
+                *self.env['product.product']._tlrm_rental_product_domain(),
+            ]),
+            'project.project': ('name', [('company_id', 'in', [company.id, False])]),
+            'res.partner': ('name', [('company_id', 'in', [company.id, False])]),
+        }
+        for model, (key_field, domain) in searches.items():
+            model_cache = cache.setdefault(model, {})
+            keys = [key for key in wanted[model] if key and key not in model_cache]
+            if not keys:
+                continue
+            for record in self.env[model].search(domain + [(key_field, 'in', keys)], order='id'):
+                model_cache.setdefault(record[key_field], record.id)
+            for key in keys:
+                model_cache.setdefault(key, False)
+
+    def _prepare_booking(self, group, cache):
+        """Return ``(booking_vals, lines_vals)`` for one booking's rows.
+
+        :raise UserError: when a row cannot be imported
+        """
+        header = group[0]
+        ref = header['booking_ref'].strip()
+
+        def lookup(model, value, label, required=False):
+            value = (value or '').strip()
+            if not value:
+                if required:
+                    raise UserError(_("%s is required.", label))
+                return False
+            record_id = cache[model].get(value)
+            if not record_id:
+                raise UserError(_("%(label)s '%(value)s' not found.", label=label, value=value))
+            return record_id
+
+        def to_datetime(value, label):
+            try:
+                return fields.Datetime.to_datetime((value or '').strip() or False)
+            except ValueError:
+                raise UserError(_("%(label)s '%(value)s' is not a valid date.", label=label, value=value))
+
+        date_start = to_datetime(header.get('date_start'), _("Start date"))
+        date_end = to_datetime(header.get('date_end'), _("End date"))
+        state = (header.get('state') or 'draft').strip()
+        if state not in IMPORT_STATES:
+            raise UserError(_("State must be one of: %s.", ', '.join(IMPORT_STATES)))
+        if state == 'planned' and not (date_start and date_end):
+            raise UserError(_("Planned bookings need a start and an end date."))
+        if date_start and date_end and date_start > date_end:
+            raise UserError(_("Start date cannot be after end date."))
+        warehouse_id = lookup('stock.warehouse', header.get('warehouse'), _("Warehouse"), required=True)
+
+        booking_vals = {
+            'project_id': lookup('project.project', header.get('project'), _("Project"), required=True),
+            'partner_id': lookup('res.partner', header.get('customer'), _("Customer")),
+            'source_warehouse_id': warehouse_id,
+            'date_start': date_start,
+            'date_end': date_end,
+            'state': state,
+            'notes': header.get('notes') or False,
+            'company_id': self.env.company.id,
+        }
+        lines_vals = []
+        for row in group:
+            try:
+                quantity = float(row.get('quantity') or 0.0)
+            except ValueError:
+                raise UserError(_("Quantity '%s' is not a number.", row.get('quantity')))
+            if quantity <= 0:
+                raise UserError(_("Quantity must be positive."))
+            if (row.get('date_start') or header.get('date_start')) != header.get('date_start') \
+                    or (row.get('date_end') or header.get('date_end')) != header.get('date_end'):
+                raise UserError(_("All rows of booking %s must have the same dates.", ref))
+            lines_vals.append({
+                'product_id': lookup('product.product', row.get('product'), _("Product"), required=True),
+                'quantity': quantity,
+                'source_warehouse_id': warehouse_id,
+                'return_warehouse_id': lookup(
+                    'stock.warehouse', row.get('return_warehouse'), _("Return warehouse"),
+                ) or warehouse_id,
+            })
+        return booking_vals, lines_vals
+
+    def _create_bookings(self, prepared):
+        """Create the prepared bookings and reject those exceeding availability.
+
+        Availability is checked for all lines at once, each line counting
+        only the bookings before it in the file, as a row by row import
+        would. Bookings with a violating line are deleted. Deleting them
+        only frees capacity, so the remaining bookings stay valid; a
+        rejected booking may however have been counted against a later one.
+
+        The per-line availability constraint is skipped for the insert
+        (superuser environment, see
+        :meth:`~TlRentalBookingLine._constrains_check_availability`) and
+        replaced by the set-based check below; access to the bookings is
+        checked beforehand.
+
+        :param prepared: list of ``(group, booking_vals, lines_vals)``
+        :return: tuple ``(bookings, rejects)``
+        """
+        self.env['tl.rental.booking'].check_access('create')
+        self.env['tl.rental.booking.line'].check_access('create')
+        Booking = self.env['tl.rental.booking'].sudo().with_context(tlrm_skip_availability_check=True)
+        names = Booking._reserve_names(len(prepared))
+        bookings = Booking.create([
+            dict(booking_vals, name=name)
+            for name, (_group, booking_vals, _lines_vals) in zip(names, prepared)
+        ])
+        group_by_booking = {}
+        lines_vals_list = []
+        for booking, (group, _booking_vals, lines_vals) in zip(bookings, prepared):
+            group_by_booking[booking.id] = group
+            lines_vals_list.extend(dict(vals, booking_id=booking.id) for vals in lines_vals)
+        Booking.env['tl.rental.booking.line'].create(lines_vals_list)
+
+        rejects = []
+        violations = bookings.line_ids._get_availability_violations(ordered=True)
+        if violations:
+            rejected = Booking.env['tl.rental.booking.line'].browse(list(violations)).booking_id
+            for booking in rejected:
+                message = '\n'.join(violations[line.id] for line in booking.line_ids if line.id in violations)
+                rejects.extend((row, message) for row in group_by_booking[booking.id])
+            bookings -= rejected
+            rejected.unlink()
+        return bookings.with_env(self.env), rejects
+
+    def _import_chunk(self, chunk, cache):
+        """Import one chunk of booking row groups.
+
+        :return: tuple ``(bookings, rejects)``
+        """
+        self._resolve_references(chunk, cache)
+        prepared, rejects = [], []
+        for group in chunk:
+            try:
+                booking_vals, lines_vals = self._prepare_booking(group, cache)
+            except UserError as error:
+                rejects.extend((row, error.args[0]) for row in group)
+                continue
+            prepared.append((group, booking_vals, lines_vals))
+        if not prepared:
+            return self.env['tl.rental.booking'], rejects
+
+        try:
+            with self.env.cr.savepoint():
+                bookings, chunk_rejects = self._create_bookings(prepared)
+            return bookings, rejects + chunk_rejects
+        except (UserError, psycopg2.Error):
+            # e.g. the database capacity guard refused a line: retry one
+            # booking at a time, so only the failing bookings are rejected
+            self.env.invalidate_all()
+        bookings = self.env['tl.rental.booking']
+        for item in prepared:
+            try:
+                with self.env.cr.savepoint():
+                    created, booking_rejects = self._create_bookings([item])
+            except (UserError, psycopg2.Error) as error:
+                self.env.invalidate_all()
+                message = error.args[0] if isinstance(error, UserError) else str(error).strip()
+                rejects.extend((row, message) for row in item[0])
+                continue
+            bookings |= created
+            rejects.extend(booking_rejects)
+        return bookings, rejects
+
+    def _write_result_file(self, rejects):
+        """Store the rejected rows, with their error, as a CSV result file."""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=['row_number', *IMPORT_COLUMNS, 'error'], extrasaction='ignore')
+        writer.writeheader()
+        for row, message in sorted(rejects, key=lambda reject: reject[0].get('row_number', 0)):
+            writer.writerow(dict(row, error=message))
+        self.result_file = base64.b64encode(buffer.getvalue().encode())
+        self.result_filename = 'rejected_%s.csv' % (self.filename or 'bookings').rsplit('.', 1)[0]
+
+    def action_import(self):
+        """Import the uploaded file and show the result."""
+        self.ensure_one()
+        start = time.perf_counter()
+        self = self.with_context(
+            tracking_disable=True,
+            mail_create_nolog=True,
+            mail_notrack=True,
+        )
+        cache = {}
+        rejects = []
+        booking_count = line_count = 0
+        for chunk in self._iter_chunks(self._iter_rows(), rejects):
+            bookings, chunk_rejects = self._import_chunk(chunk, cache)
+            booking_count += len(bookings)
+            line_count += len(bookings.line_ids)
+            rejects.extend(chunk_rejects)
+            # Keep the ORM cache bounded by the chunk size
+            self.env.invalidate_all()
+
+        values = {
+            'state': 'done',
+            'booking_count': booking_count,
+            'line_count': line_count,
+            'rejected_count': len(rejects),
+            'duration': time.perf_counter() - start,
+        }
+        self.write(values)
+        if rejects:
+            self._write_result_file(rejects)
+        logger.info(
+            "Booking import %s: %s bookings, %s lines, %s rejected rows in %.1f s",
+            self.filename, booking_count, line_count, len(rejects), values['duration'],
+        )
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
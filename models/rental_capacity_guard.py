@@ -0,0 +1,131 @@
+from odoo import models, fields, api
+import logging
+
+logger = logging.getLogger(__name__)
+
+CAPACITY_GUARD_PARAM = 'tl_rental_manager.db_capacity_guard'
+CAPACITY_GUARD_TRIGGER = 'tl_rental_booking_line_capacity_guard'
+
+# Mirrors TlRentalBookingLine._check_line_availability in SQL:
+#   quantity + overlapping commitments (same source warehouse)
+#       <= fleet capacity (template quants, internal locations)
+#        + incoming returns (to the source warehouse, before date_start)
+# Every check first bumps the (company, product) guard row. Two transactions
+# touching the same product therefore update the same row: the second waits,
+# then fails with a serialization error under REPEATABLE READ and is retried
+# by Odoo with a fresh snapshot, so concurrent checks never miss each other.
+CAPACITY_GUARD_FUNCTION = """
+CREATE OR REPLACE FUNCTION tl_rental_capacity_guard_check() RETURNS trigger AS $$
+DECLARE
+    fleet numeric;
+    committed numeric;
+    incoming numeric;
+BEGIN
+    IF NEW.state NOT IN ('planned', 'reserved', 'ongoing', 'finished')
+       OR NEW.product_id IS NULL OR NEW.company_id IS NULL
+       OR NEW.date_start IS NULL OR NEW.date_end IS NULL
+       OR COALESCE(NEW.quantity, 0) <= 0 THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO tl_rental_capacity_guard (company_id, product_id, version)
+    VALUES (NEW.company_id, NEW.product_id, 1)
+    ON CONFLICT (company_id, product_id)
+    DO UPDATE SET version = tl_rental_capacity_guard.version + 1;
+
+    SELECT COALESCE(SUM(q.quantity), 0) INTO fleet
+      FROM stock_quant q
+      JOIN stock_location loc ON loc.id = q.location_id
+      JOIN product_product variant ON variant.id = q.product_id
+     WHERE variant.product_tmpl_id = (
+               SELECT product_tmpl_id FROM product_product WHERE id = NEW.product_id)
+       AND q.company_id = NEW.company_id
+       AND loc.usage = 'internal';
+
+    SELECT COALESCE(SUM(l.quantity), 0) INTO committed
+      FROM tl_rental_booking_line l
+     WHERE l.id != NEW.id
+       AND l.product_id = NEW.product_id
+       AND l.company_id = NEW.company_id
+       AND l.state IN ('planned', 'reserved', 'ongoing', 'finished')
+       AND l.date_start < NEW.date_end
+       AND l.date_end > NEW.date_start
+       AND (NEW.source_warehouse_id IS NULL OR l.source_warehouse_id = NEW.source_warehouse_id);
+
+    SELECT COALESCE(SUM(l.quantity), 0) INTO incoming
+      FROM tl_rental_booking_line l
+     WHERE l.id != NEW.id
+       AND l.product_id = NEW.product_id
+       AND l.company_id = NEW.company_id
+       AND l.state IN ('ongoing', 'finished')
+       AND l.return_warehouse_id IS NOT DISTINCT FROM NEW.source_warehouse_id
+       AND l.expected_return_date <= NEW.date_start;
+
+    IF NEW.quantity > fleet - committed + incoming THEN
+        RAISE EXCEPTION 'Not enough availability for product id % (fleet capacity %, committed %, incoming %, requested %)',
+            NEW.product_id, fleet, committed, incoming, NEW.quantity
+            USING ERRCODE = 'check_violation', CONSTRAINT = 'tl_rental_booking_line_capacity_guard';
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+class TlRentalCapacityGuard(models.Model):
+    """Per (company, product) row bumped by the database capacity guard.
+
+    Only used to serialize concurrent availability checks; ``version`` counts
+    guarded writes and has no business meaning.
+    """
+    _name = 'tl.rental.capacity.guard'
+    _description = 'TL Rental Capacity Guard'
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', string="Company", required=True, ondelete='cascade')
+    product_id = fields.Many2one('product.product', string="Product", required=True, ondelete='cascade')
+    version = fields.Integer(string="Version", default=0)
+
+    _company_product_uniq = models.Constraint(
+        'UNIQUE(company_id, product_id)',
+        "Only one capacity guard row per company and product.",
+    )
+
+    def init(self):
+        super().init()
+        self._sync_trigger()
+
+    @api.model
+    def _is_enabled(self):
+        param = self.env['ir.config_parameter'].sudo().get_param(CAPACITY_GUARD_PARAM)
+        return param not in (False, None, '', '0', 'False', 'false')
+
+    @api.model
+    def _sync_trigger(self):
+        """Install or drop the guard trigger according to the system parameter."""
+        cr = self.env.cr
+        cr.execute(CAPACITY_GUARD_FUNCTION)
+        cr.execute(f"DROP TRIGGER IF EXISTS {CAPACITY_GUARD_TRIGGER} ON tl_rental_booking_line")
+        if self._is_enabled():
+            cr.execute(f"""
+                CREATE TRIGGER {CAPACITY_GUARD_TRIGGER}
+                AFTER INSERT OR UPDATE OF product_id, quantity, state, date_start, date_end,
+                                          source_warehouse_id, company_id
+                ON tl_rental_booking_line
+                FOR EACH ROW EXECUTE FUNCTION tl_rental_capacity_guard_check()
+            """)
+            logger.info("TL Rental database capacity guard enabled")
+
+    @api.model
+    def action_enable(self):
+        """Enforce booking capacity in the database as well as in Python."""
+        self.env['ir.config_parameter'].sudo().set_param(CAPACITY_GUARD_PARAM, '1')
+        self._sync_trigger()
+        return True
+
+    @api.model
+    def action_disable(self):
+        """Leave capacity enforcement to the Python constraint only."""
+        self.env['ir.config_parameter'].sudo().set_param(CAPACITY_GUARD_PARAM, '0')
+        self._sync_trigger()
+        return True
@@ -0,0 +1,227 @@
+from odoo import models, fields, api
+from odoo.tools import SQL
+from collections import defaultdict
+from datetime import timedelta
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FORECAST_HISTORY_PARAM = 'tl_rental_manager.forecast_history_weeks'
+FORECAST_HORIZON_PARAM = 'tl_rental_manager.forecast_horizon_weeks'
+# Booking states counted as demand, as committed in the grid, plus past rentals
+FORECAST_DEMAND_STATES = ('planned', 'reserved', 'ongoing', 'finished', 'returned')
+SEASON_WEEKS = 52
+# Weight of the latest week in the smoothed level
+SMOOTHING_ALPHA = 0.3
+
+
+def fit_seasonal_forecasts(history, horizon, season=SEASON_WEEKS, alpha=SMOOTHING_ALPHA):
+    """Forecast many weekly series with additive seasonality and a smoothed level.
+
+    With at least two full seasons of history, the seasonal profile of a
+    series is the mean deviation of each week of the season from its
+    season's mean, over the last full seasons. The level is the
+    exponentially smoothed deseasonalized series. Forecasts are
+    ``level + profile`` of the week, never negative.
+
+    :param history: list of series (one list of weekly quantities each,
+        oldest first, all of the same length)
+    :param horizon: number of weeks to forecast
+    :return: list of forecasts, one list of ``horizon`` floats per series
+    """
+    if not history or horizon <= 0:
+        return [[] for _series in history]
+    length = len(history[0])
+    seasons = length // season if length >= 2 * season else 0
+    offset = length - seasons * season
+    forecasts = []
+    for series in history:
+        profile = [0.0] * season
+        if seasons:
+            for index in range(seasons):
+                chunk = series[offset + index * season:offset + (index + 1) * season]
+                mean = sum(chunk) / season
+                for position, quantity in enumerate(chunk):
+                    profile[position] += (quantity - mean) / seasons
+        level = None
+        for week, quantity in enumerate(series):
+            value = quantity - profile[(week - offset) % season]
+            level = value if level is None else alpha * value + (1.0 - alpha) * level
+        forecasts.append([
+            max(level + profile[(week - offset) % season], 0.0)
+            for week in range(length, length + horizon)
+        ])
+    return forecasts
+
+
+class TlRentalDemandForecast(models.Model):
+    """Forecast weekly demand per product and source warehouse.
+
+    Demand is the quantity booked over a week, counted like committed
+    quantities in the availability grid, from live and archived booking
+    lines. A weekly cron rebuilds the forecasts of every company from its
+    booking history; they are shown as an overlay on the availability grid
+    and in a report.
+    """
+    _name = 'tl.rental.demand.forecast'
+    _description = 'TL Rental Demand Forecast'
+    _order = 'week_start, product_id, warehouse_id'
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', string="Company", required=True, readonly=True, ondelete='cascade')
+    product_id = fields.Many2one('product.product', string="Product", required=True, readonly=True,
+                                 ondelete='cascade')
+    warehouse_id = fields.Many2one('stock.warehouse', string="Warehouse", readonly=True, ondelete='cascade')
+    week_start = fields.Datetime(string="Week", required=True, readonly=True)
+    forecast_qty = fields.Float(string="Forecast Demand", readonly=True, digits='Product Unit of Measure')
+    history_weeks = fields.Integer(string="History (weeks)", readonly=True)
+    fitted_at = fields.Datetime(string="Computed On", readonly=True)
+
+    _company_product_week_idx = models.Index('(company_id, product_id, week_start)')
+
+    @api.model
+    def _get_forecast_settings(self):
+        """Return ``(history_weeks, horizon_weeks)`` from the system parameters."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            history_weeks = int(ICP.get_param(FORECAST_HISTORY_PARAM, 156))
+            horizon_weeks = int(ICP.get_param(FORECAST_HORIZON_PARAM, 26))
+        except (TypeError, ValueError):
+            history_weeks, horizon_weeks = 156, 26
+        return max(history_weeks, 1), max(horizon_weeks, 1)
+
+    @api.model
+    def _cron_compute_forecasts(self, auto_commit=None):
+        """Rebuild the demand forecasts of every company, one transaction each."""
+        if auto_commit is None:
+            auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        for company in self.env['res.company'].search([]):
+            self._compute_company_forecasts(company)
+            if auto_commit:
+                self.env.cr.commit()
+
+    @api.model
+    def _get_weekly_demand(self, company, history_start, history_end):
+        """Aggregate booked quantities per product, warehouse and week in one query.
+
+        :return: list of ``(product_id, warehouse_id, week_start, quantity)``
+        """
+        self.env.flush_all()
+        self.env.cr.execute(SQL("""
+            WITH demand_lines AS (
+                SELECT product_id, source_warehouse_id AS warehouse_id, quantity, date_start, date_end
+                  FROM tl_rental_booking_line
+                 WHERE company_id = %(company_id)s AND state IN %(states)s
+                   AND date_start < %(history_end)s AND date_end > %(history_start)s
+                UNION ALL
+                SELECT product_id, source_warehouse_id, quantity, date_start, date_end
+                  FROM tl_rental_booking_line_archive
+                 WHERE company_id = %(company_id)s AND state IN %(states)s
+                   AND date_start < %(history_end)s AND date_end > %(history_start)s
+            )
+            SELECT line.product_id, line.warehouse_id, week.start, SUM(line.quantity)
+              FROM demand_lines line
+             CROSS JOIN LATERAL generate_series(
+                   date_trunc('week', line.date_start), line.date_end, INTERVAL '1 week'
+                   ) AS week(start)
+             WHERE line.product_id IS NOT NULL
+               AND week.start < line.date_end
+               AND week.start >= %(history_start)s AND week.start < %(history_end)s
+             GROUP BY 1, 2, 3
+        """,
+            company_id=company.id,
+            states=FORECAST_DEMAND_STATES,
+            history_start=history_start,
+            history_end=history_end,
+        ))
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _compute_company_forecasts(self, company):
+        """Replace the forecasts of ``company`` with ones fitted on its history.
+
+        :return: number of series forecast
+        """
+        start = time.perf_counter()
+        history_weeks, horizon_weeks = self._get_forecast_settings()
+        Line = self.env['tl.rental.booking.line']
+        current_week = Line._compute_weeks(fields.Datetime.now(), 1)[0]['start_dt']
+        history_start = current_week - timedelta(weeks=history_weeks)
+
+        series_index = {}
+        history = []
+        for product_id, warehouse_id, week_start, quantity in self._get_weekly_demand(
+                company, history_start, current_week):
+            key = (product_id, warehouse_id)
+            if key not in series_index:
+                series_index[key] = len(history)
+                history.append([0.0] * history_weeks)
+            week = (week_start - history_start).days // 7
+            history[series_index[key]][week] = float(quantity)
+
+        forecasts = fit_seasonal_forecasts(history, horizon_weeks)
+        weeks = [current_week + timedelta(weeks=index) for index in range(horizon_weeks)]
+        columns = defaultdict(list)
+        for (product_id, warehouse_id), row in series_index.items():
+            for week_start, quantity in zip(weeks, forecasts[row]):
+                if quantity <= 0.0:
+                    continue
+                columns['product_id'].append(product_id)
+                columns['warehouse_id'].append(warehouse_id)
+                columns['week_start'].append(week_start)
+                columns['forecast_qty'].append(round(quantity, 2))
+
+        self.env.cr.execute(SQL("DELETE FROM tl_rental_demand_forecast WHERE company_id = %s", company.id))
+        if columns:
+            self.env.cr.execute(SQL("""
+                INSERT INTO tl_rental_demand_forecast (
+                    company_id, product_id, warehouse_id, week_start, forecast_qty, history_weeks, fitted_at
+                )
+                SELECT %(company_id)s, rows.product_id, rows.warehouse_id, rows.week_start, rows.forecast_qty,
+                       %(history_weeks)s, NOW() AT TIME ZONE 'UTC'
+                  FROM unnest(%(product_ids)s::int[], %(warehouse_ids)s::int[],
+                              %(week_starts)s::timestamp[], %(quantities)s::float8[])
+                       AS rows(product_id, warehouse_id, week_start, forecast_qty)
+            """,
+                company_id=company.id,
+                history_weeks=history_weeks,
+                product_ids=columns['product_id'],
+                warehouse_ids=columns['warehouse_id'],
+                week_starts=columns['week_start'],
+                quantities=columns['forecast_qty'],
+            ))
+        self.invalidate_model()
+        logger.info(
+            "Demand forecasts of company %s: %s series, %s forecast weeks, %.1f s",
+            company.id, len(history), len(columns['product_id']), time.perf_counter() - start,
+        )
+        return len(history)
+
+    @api.model
+    def _get_grid_overlay(self, company, warehouse_id, product_ids, weeks):
+        """Return the forecast demand of grid cells.
+
+        Without a warehouse, the forecasts of all warehouses are summed.
+
+        :param weeks: list of week dicts from _compute_weeks
+        :return: nested dict product_id -> week key -> forecast quantity
+        """
+        overlay = defaultdict(dict)
+        if not product_ids or not weeks:
+            return overlay
+        key_by_start = {week['start_dt']: week['key'] for week in weeks}
+        warehouse_filter = SQL("AND warehouse_id = %s", warehouse_id) if warehouse_id else SQL()
+        self.env.cr.execute(SQL("""
+            SELECT product_id, week_start, SUM(forecast_qty)
+              FROM tl_rental_demand_forecast
+             WHERE company_id = %s AND product_id = ANY(%s)
+               AND week_start >= %s AND week_start < %s %s
+             GROUP BY product_id, week_start
+        """, company.id, list(product_ids), weeks[0]['start_dt'], weeks[-1]['end_dt'], warehouse_filter))
+        for product_id, week_start, quantity in self.env.cr.fetchall():
+            key = key_by_start.get(week_start)
+            if key:
+                overlay[product_id][key] = quantity
+        return overlay
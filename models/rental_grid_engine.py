@@ -0,0 +1,108 @@
+# Status codes used inside the engine, materialized as strings at the edge
+STATUS_FULL, STATUS_PARTIAL, STATUS_FREE = 0, 1, 2
+STATUS_LABELS = ('full', 'partial', 'free')
+
+
+class TlrmGridEngine:
+    """Dense product x period lists for the availability grid.
+
+    Fleet capacity, committed and incoming quantities are held as lists
+    indexed by row (product) and column (period). Cumulative incoming,
+    availability and cell status are then computed for the whole grid in
+    one pass, and Python dicts are only built when the rows are materialized.
+    """
+
+    def __init__(self, product_ids, column_keys):
+        self.product_ids = list(dict.fromkeys(product_ids))
+        self.column_keys = list(column_keys)
+        self.row_index = {pid: index for index, pid in enumerate(self.product_ids)}
+        self.column_index = {key: index for index, key in enumerate(self.column_keys)}
+        shape = (len(self.product_ids), len(self.column_keys))
+        self.fleet = [0.0] * shape[0]
+        self.needed = [0.0] * shape[0]
+        self.committed = [[0.0] * shape[1] for _row in range(shape[0])]
+        self.incoming = [[0.0] * shape[1] for _row in range(shape[0])]
+        self.available = None
+        self.cumulative_incoming = None
+        self.status = None
+
+    @classmethod
+    def from_mappings(cls, product_ids, column_keys, capacity, committed, incoming, needed):
+        """Build an engine from the mappings returned by the grid helpers.
+
+        :param product_ids: list of product.product ids, one row each
+        :param column_keys: list of period keys, one column each
+        :param capacity: dict product_id -> fleet capacity
+        :param committed: nested dict product_id -> period key -> quantity
+        :param incoming: nested dict product_id -> period key -> quantity
+        :param needed: dict product_id -> needed quantity
+        :return: engine with its input arrays filled
+        """
+        engine = cls(product_ids, column_keys)
+        for pid, row in engine.row_index.items():
+            engine.fleet[row] = float(capacity.get(pid, 0.0) or 0.0)
+            engine.needed[row] = float(needed.get(pid, 0.0) or 0.0)
+        engine._load(engine.committed, committed)
+        engine._load(engine.incoming, incoming)
+        return engine
+
+    def _load(self, target, mapping):
+        # Only touch the non-zero entries; iterating the dense grid would
+        # bring back the per-cell Python loop this class avoids.
+        for pid, by_key in mapping.items():
+            row = self.row_index.get(pid)
+            if row is None:
+                continue
+            for key, qty in by_key.items():
+                column = self.column_index.get(key)
+                if column is not None and qty:
+                    target[row][column] += float(qty)
+
+    def compute(self):
+        """Compute cumulative incoming, availability and status codes."""
+        self.cumulative_incoming = []
+        self.available = []
+        self.status = []
+        for row, fleet in enumerate(self.fleet):
+            needed = self.needed[row]
+            committed_row = self.committed[row]
+            cumulative = 0.0
+            cumulative_row, available_row, status_row = [], [], []
+            for column, incoming in enumerate(self.incoming[row]):
+                cumulative += incoming
+                available = max(fleet - committed_row[column] + cumulative, 0.0)
+                if needed > 0.0:
+                    if available >= needed:
+                        status = STATUS_FREE
+                    elif available > 0.0:
+                        status = STATUS_PARTIAL
+                    else:
+                        status = STATUS_FULL
+                else:
+                    status = STATUS_FREE if available > 0.0 else STATUS_FULL
+                cumulative_row.append(cumulative)
+                available_row.append(available)
+                status_row.append(status)
+            self.cumulative_incoming.append(cumulative_row)
+            self.available.append(available_row)
+            self.status.append(status_row)
+        return self
+
+    def materialize(self):
+        """Return the computed grid as plain Python values.
+
+        :return: dict product_id -> ``(fleet, needed, cells)`` where ``cells``
+            is a list of ``(column_key, committed, incoming, cumulative_incoming,
+            available, status)`` tuples of Python floats and strings
+        """
+        result = {}
+        for pid, row in self.row_index.items():
+            cells = [
+                (key, committed_qty, incoming_qty, cumulative_qty, available_qty, STATUS_LABELS[code])
+                for key, committed_qty, incoming_qty, cumulative_qty, available_qty, code in zip(
+                    self.column_keys, self.committed[row], self.incoming[row],
+                    self.cumulative_incoming[row], self.available[row], self.status[row],
+                )
+            ]
+            result[pid] = (self.fleet[row], self.needed[row], cells)
+        return result
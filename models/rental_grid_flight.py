@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TlrmSingleFlight:
+    """Coalesce identical computations running concurrently in one process.
+
+    The first caller of a key computes the value while later callers of the
+    same key wait for it and reuse it. Values can also be kept for a short
+    time (``ttl``) in a small LRU, so requests arriving just after the
+    computation finished get the same result. Keys must include everything
+    the value depends on, including a data version, since nothing here is
+    ever invalidated.
+
+    If the computation fails, waiting callers compute the value themselves.
+    """
+
+    def __init__(self, max_entries=64, wait_timeout=60.0):
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._results = OrderedDict()
+
+    def run(self, key, compute, ttl=0.0):
+        """Return ``compute()``, shared with identical concurrent calls.
+
+        :param key: hashable key of the computation
+        :param compute: callable without arguments
+        :param ttl: seconds the result is reused after being computed
+        """
+        with self._lock:
+            now = time.monotonic()
+            cached = self._results.get(key)
+            if cached is not None:
+                if cached[0] > now:
+                    self._results.move_to_end(key)
+                    return cached[1]
+                del self._results[key]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = {'done': threading.Event(), 'ok': False, 'value': None}
+
+        if not leader:
+            if flight['done'].wait(self.wait_timeout) and flight['ok']:
+                return flight['value']
+            return compute()
+
+        try:
+            value = compute()
+            flight['value'] = value
+            flight['ok'] = True
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight['ok'] and ttl > 0:
+                    self._store(key, value, ttl)
+            flight['done'].set()
+        return value
+
+    def _store(self, key, value, ttl):
+        now = time.monotonic()
+        self._results[key] = (now + ttl, value)
+        self._results.move_to_end(key)
+        for old_key in [k for k, (expires, _value) in self._results.items() if expires <= now]:
+            del self._results[old_key]
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+
+# Availability grids of this worker process, see TlRentalBookingLine.get_availability_grid
+grid_flight = TlrmSingleFlight()
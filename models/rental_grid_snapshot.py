@@ -0,0 +1,205 @@
+from odoo import models, fields, api
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_WEEKS_PARAM = 'tl_rental_manager.warmup_weeks'
+
+
+class TlRentalGridSnapshot(models.Model):
+    """Precomputed availability grid of all rentable products.
+
+    One snapshot per company, warehouse (empty for all warehouses), first
+    week and language, refreshed off-hours by a cron. It is only used while
+    its change token matches the live data, so a stale snapshot is never
+    served. The token only covers what the grid reads from its first week
+    on, plus the rental products themselves: bookings that ended earlier
+    and stock of other products leave snapshots valid.
+
+    The snapshot holds the grid's meta and columns; its rows are stored
+    one per product (tl.rental.grid.snapshot.row), so serving a page only
+    reads and decodes the rows of that page.
+    """
+    _name = 'tl.rental.grid.snapshot'
+    _description = 'TL Rental Availability Snapshot'
+    _order = 'date_start desc, company_id, warehouse_id'
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', string="Company", required=True, readonly=True, ondelete='cascade')
+    warehouse_id = fields.Many2one('stock.warehouse', string="Warehouse", readonly=True, ondelete='cascade')
+    lang = fields.Char(string="Language", required=True, readonly=True)
+    date_start = fields.Datetime(string="First Week", required=True, readonly=True)
+    week_count = fields.Integer(string="Weeks", readonly=True)
+    product_count = fields.Integer(string="Products", readonly=True)
+    change_token = fields.Char(string="Change Token", readonly=True)
+    computed_at = fields.Datetime(string="Computed At", readonly=True)
+    compute_ms = fields.Float(string="Compute Time (ms)", readonly=True, digits=(16, 1))
+    payload = fields.Json(string="Grid", readonly=True, help="Meta and columns of the grid, without rows.")
+    row_ids = fields.One2many('tl.rental.grid.snapshot.row', 'snapshot_id', string="Rows", readonly=True)
+
+    _partition_uniq = models.UniqueIndex(
+        '(company_id, COALESCE(warehouse_id, 0), date_start, lang)'
+    )
+
+    @api.model
+    def _get_grid(self, company, warehouse_id, weeks, product_ids, change_token):
+        """Return the snapshot grid matching a request, or None.
+
+        A snapshot serves requests with the same company, warehouse,
+        language and first week, for at most as many weeks as it holds
+        (cumulative incoming returns start at the first week, so a prefix
+        of the weeks is exact) and products it contains.
+
+        :param weeks: list of week dicts from _compute_weeks
+        :param product_ids: requested product.product ids, in row order
+        :param change_token: current availability change token
+        :return: grid dict or None
+        """
+        if not weeks or not product_ids:
+            return None
+        snapshot = self.sudo().search([
+            ('company_id', '=', company.id),
+            ('warehouse_id', '=', warehouse_id or False),
+            ('lang', '=', self.env.lang or 'en_US'),
+            ('date_start', '=', weeks[0]['start_dt']),
+            ('week_count', '>=', len(weeks)),
+            ('change_token', '=', change_token),
+        ], limit=1)
+        if not snapshot:
+            return None
+
+        rows_by_product = {
+            row.product_id.id: row.payload
+            for row in self.env['tl.rental.grid.snapshot.row'].sudo().search_fetch([
+                ('snapshot_id', '=', snapshot.id),
+                ('product_id', 'in', product_ids),
+            ], ['product_id', 'payload'])
+        }
+        if any(pid not in rows_by_product for pid in product_ids):
+            return None
+        week_count = len(weeks)
+        rows = []
+        for pid in product_ids:
+            row = rows_by_product[pid]
+            rows.append(dict(row, cells=row['cells'][:week_count]))
+        payload = snapshot.payload or {}
+        meta = dict(payload.get('meta', {}))
+        meta.update({
+            'date_end': fields.Datetime.to_string(weeks[-1]['end_dt']),
+            'week_count': week_count,
+            'snapshot': True,
+        })
+        return {
+            'meta': meta,
+            'columns': payload.get('columns', [])[:week_count],
+            'rows': rows,
+        }
+
+    @api.model
+    def _cron_warm_up(self, auto_commit=None):
+        """Precompute the next weeks of availability for every company and warehouse.
+
+        Only partitions whose change token moved since the last run are
+        recomputed. Snapshots of past weeks are deleted.
+        """
+        if auto_commit is None:
+            auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        try:
+            week_count = int(self.env['ir.config_parameter'].sudo().get_param(WARMUP_WEEKS_PARAM, 12))
+        except (TypeError, ValueError):
+            week_count = 12
+        Line = self.env['tl.rental.booking.line'].sudo()
+        langs = [code for code, _name in self.env['res.lang'].get_installed()]
+        current_week = Line._compute_weeks(fields.Datetime.now(), 1)[0]['start_dt']
+
+        for company in self.env['res.company'].search([]):
+            company_line = Line.with_company(company).with_context(allowed_company_ids=[company.id])
+            _ids, company_week_count, _company, _needed = company_line._normalize_grid_params(
+                [], week_count, company.id, None
+            )
+            weeks = company_line._compute_weeks(current_week, company_week_count)
+            product_ids = self.env['product.product'].with_company(company).search(
+                self.env['product.product']._tlrm_rental_product_domain()
+            ).ids
+            warehouse_ids = [None] + self.env['stock.warehouse'].search([('company_id', '=', company.id)]).ids
+            for warehouse_id in warehouse_ids:
+                for lang in langs:
+                    self.with_context(lang=lang)._refresh_partition(
+                        company_line.with_context(lang=lang), company, warehouse_id, weeks, product_ids,
+                    )
+                    if auto_commit:
+                        self.env.cr.commit()
+
+        self.search([('date_start', '<', current_week)]).unlink()
+        if auto_commit:
+            self.env.cr.commit()
+
+    @api.model
+    def _refresh_partition(self, line_model, company, warehouse_id, weeks, product_ids):
+        """Recompute one snapshot unless its change token is still current.
+
+        :param line_model: tl.rental.booking.line in the snapshot's language and company
+        :return: the tl.rental.grid.snapshot record
+        """
+        lang = self.env.lang or 'en_US'
+        change_token = line_model._get_availability_change_token(company, warehouse_id, weeks[0]['start_dt'])
+        snapshot = self.search([
+            ('company_id', '=', company.id),
+            ('warehouse_id', '=', warehouse_id or False),
+            ('date_start', '=', weeks[0]['start_dt']),
+            ('lang', '=', lang),
+        ], limit=1)
+        if (snapshot and snapshot.change_token == change_token
+                and snapshot.week_count == len(weeks) and snapshot.product_count == len(product_ids)):
+            return snapshot
+
+        computed_at = fields.Datetime.now()
+        start = time.perf_counter()
+        perf = self.env['tl.rental.perf.stat']._new_recorder()
+        grid = line_model._compute_availability_grid(
+            product_ids, weeks, len(weeks), warehouse_id, company, {}, change_token, perf,
+        )
+        compute_ms = (time.perf_counter() - start) * 1000.0
+        vals = {
+            'company_id': company.id,
+            'warehouse_id': warehouse_id or False,
+            'lang': lang,
+            'date_start': weeks[0]['start_dt'],
+            'week_count': len(weeks),
+            'product_count': len(product_ids),
+            'change_token': change_token,
+            'computed_at': computed_at,
+            'compute_ms': compute_ms,
+            'payload': {'meta': grid['meta'], 'columns': grid['columns']},
+        }
+        if snapshot:
+            snapshot.row_ids.unlink()
+            snapshot.write(vals)
+        else:
+            snapshot = self.create(vals)
+        self.env['tl.rental.grid.snapshot.row'].create([
+            {'snapshot_id': snapshot.id, 'product_id': row['product_id'], 'payload': row}
+            for row in grid['rows']
+        ])
+        logger.debug(
+            "Availability snapshot refreshed: company %s, warehouse %s, %s products, %.1f ms",
+            company.id, warehouse_id, len(product_ids), compute_ms,
+        )
+        return snapshot
+
+
+class TlRentalGridSnapshotRow(models.Model):
+    """One product row of a tl.rental.grid.snapshot."""
+    _name = 'tl.rental.grid.snapshot.row'
+    _description = 'TL Rental Availability Snapshot Row'
+    _log_access = False
+
+    snapshot_id = fields.Many2one('tl.rental.grid.snapshot', string="Snapshot", required=True, readonly=True,
+                                  ondelete='cascade')
+    product_id = fields.Many2one('product.product', string="Product", required=True, readonly=True,
+                                 ondelete='cascade')
+    payload = fields.Json(string="Row", readonly=True)
+
+    _snapshot_product_uniq = models.UniqueIndex('(snapshot_id, product_id)')
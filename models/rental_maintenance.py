@@ -0,0 +1,200 @@
+from odoo import models, api, _
+from odoo.exceptions import UserError
+import logging
+import threading
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+
+class TlRentalMaintenance(models.AbstractModel):
+    """Maintenance operations on rental data, see ``odoo-bin tlrm_purge``.
+
+    Data is removed in chunks of bookings (or products), each in its own
+    transaction, so that no table stays locked for long and an interrupted
+    run can simply be started again.
+    """
+    _name = 'tl.rental.maintenance'
+    _description = 'TL Rental Maintenance'
+
+    @api.model
+    def _purge_domain(self, company=None, date_from=None, date_to=None):
+        """Domain of the bookings, live or archived, in the purge scope."""
+        domain = []
+        if company:
+            domain.append(('company_id', '=', company.id))
+        if date_from:
+            domain.append(('date_start', '>=', date_from))
+        if date_to:
+            domain.append(('date_start', '<', date_to))
+        return domain
+
+    @api.model
+    def _rental_moves(self, bookings):
+        """Return the stock moves of the rental pickings of ``bookings``."""
+        return self.env['stock.move'].sudo().search([
+            '|',
+            ('tlrm_booking_id', 'in', bookings.ids),
+            ('picking_id.tlrm_booking_id', 'in', bookings.ids),
+        ])
+
+    @api.model
+    def _rental_products_domain(self, company=None):
+        domain = list(self.env['product.product']._tlrm_rental_product_domain())
+        if company:
+            domain.append(('company_id', 'in', [company.id, False]))
+        return domain
+
+    @api.model
+    def _purge_rental_data(self, company=None, date_from=None, date_to=None, chunk_size=500,
+                           dry_run=False, reset=False, auto_commit=None):
+        """Delete rental bookings, their pickings and archived bookings in chunks.
+
+        Pending rental moves are cancelled, which releases their
+        reservations, and deleted with their pickings through the ORM. Done
+        moves cannot be deleted through the ORM, so those of the chunk are
+        deleted in SQL, together with their move lines.
+
+        :param company: optional res.company record to restrict the purge to
+        :param date_from: optional datetime; only bookings starting from it
+        :param date_to: optional datetime; only bookings starting before it
+        :param chunk_size: number of bookings (or products) per transaction
+        :param dry_run: only count what would be deleted
+        :param reset: also delete the rental products and their stock, and
+            restart the booking sequence when no booking is left; only
+            allowed without a date range
+        :param auto_commit: commit after each chunk; defaults to True outside tests
+        :return: dict of counts per kind of record
+        """
+        if reset and (date_from or date_to):
+            raise UserError(_("A reset deletes products and cannot be limited to a date range."))
+        if auto_commit is None:
+            auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        chunk_size = max(int(chunk_size or 0), 1)
+        Booking = self.env['tl.rental.booking'].sudo().with_context(active_test=False)
+        Archive = self.env['tl.rental.booking.archive'].sudo()
+        Product = self.env['product.product'].sudo().with_context(active_test=False)
+        booking_domain = self._purge_domain(company, date_from, date_to)
+
+        if dry_run:
+            counts = {
+                'bookings': Booking.search_count(booking_domain),
+                'booking_lines': self.env['tl.rental.booking.line'].sudo().search_count(
+                    [('booking_id', 'any', booking_domain)]),
+                'pickings': self.env['stock.picking'].sudo().search_count([
+                    '|',
+                    ('tlrm_booking_id', 'any', booking_domain),
+                    ('move_ids.tlrm_booking_id', 'any', booking_domain),
+                ]),
+                'moves': self.env['stock.move'].sudo().search_count([
+                    '|',
+                    ('tlrm_booking_id', 'any', booking_domain),
+                    ('picking_id.tlrm_booking_id', 'any', booking_domain),
+                ]),
+                'archived_bookings': Archive.search_count(booking_domain),
+            }
+            if reset:
+                product_domain = self._rental_products_domain(company)
+                counts['products'] = Product.search_count(product_domain)
+                counts['quants'] = self.env['stock.quant'].sudo().search_count(
+                    [('product_id', 'any', product_domain)])
+            logger.info("Rental purge dry run: %s", counts)
+            return counts
+
+        counts = dict.fromkeys(('bookings', 'booking_lines', 'pickings', 'moves', 'archived_bookings'), 0)
+        total = Booking.search_count(booking_domain)
+        while True:
+            bookings = Booking.search(booking_domain, order='id', limit=chunk_size)
+            if not bookings:
+                break
+            self._purge_bookings(bookings, counts)
+            if auto_commit:
+                self.env.cr.commit()
+            self.env.invalidate_all()
+            logger.info("Rental purge: %s/%s bookings deleted", counts['bookings'], total)
+
+        while True:
+            archives = Archive.search(booking_domain, order='id', limit=chunk_size)
+            if not archives:
+                break
+            counts['archived_bookings'] += len(archives)
+            archives.unlink()
+            if auto_commit:
+                self.env.cr.commit()
+            logger.info("Rental purge: %s archived bookings deleted", counts['archived_bookings'])
+
+        if reset:
+            self._reset_rental_products(company, chunk_size, counts, auto_commit)
+            if not Booking.search_count([]):
+                sequence = self.env['ir.sequence'].sudo().search([('code', '=', 'tl.rental.booking')])
+                sequence.write({'number_next': 1})
+            if auto_commit:
+                self.env.cr.commit()
+        logger.info("Rental purge done: %s", counts)
+        return counts
+
+    @api.model
+    def _purge_bookings(self, bookings, counts):
+        """Delete one chunk of bookings with their rental pickings and moves."""
+        moves = self._rental_moves(bookings)
+        pickings = moves.picking_id | self.env['stock.picking'].sudo().search(
+            [('tlrm_booking_id', 'in', bookings.ids)]
+        )
+        counts['moves'] += len(moves)
+        counts['pickings'] += len(pickings)
+        counts['bookings'] += len(bookings)
+        counts['booking_lines'] += len(bookings.line_ids)
+
+        done_moves = moves.filtered(lambda move: move.state == 'done')
+        (moves - done_moves)._action_cancel()
+        if done_moves:
+            self.env.flush_all()
+            self.env.cr.execute("DELETE FROM stock_move_line WHERE move_id IN %s", [tuple(done_moves.ids)])
+            self.env.cr.execute("DELETE FROM stock_move WHERE id IN %s", [tuple(done_moves.ids)])
+            self.env.invalidate_all()
+        # Wave pickings shared with bookings out of scope keep their other moves
+        (moves - done_moves).exists().with_context(prefetch_fields=False).unlink()
+        pickings.exists().filtered(lambda picking: not picking.move_ids).unlink()
+        bookings.unlink()
+
+    @api.model
+    def _reset_rental_products(self, company, chunk_size, counts, auto_commit):
+        """Delete the stock and then the rental products, one chunk at a time.
+
+        Products still referenced elsewhere (e.g. by other moves) are
+        archived instead of deleted.
+        """
+        Product = self.env['product.product'].sudo().with_context(active_test=False)
+        Quant = self.env['stock.quant'].sudo()
+        counts.update(products=0, archived_products=0, quants=0)
+        last_id = 0
+        while True:
+            products = Product.search(
+                self._rental_products_domain(company) + [('id', '>', last_id)], order='id', limit=chunk_size,
+            )
+            if not products:
+                break
+            last_id = products[-1].id
+            quants = Quant.search([('product_id', 'in', products.ids)])
+            counts['quants'] += len(quants)
+            quants.unlink()
+            for product in products:
+                try:
+                    with self.env.cr.savepoint():
+                        if len(product.product_tmpl_id.product_variant_ids) == 1:
+                            product.product_tmpl_id.unlink()
+                        else:
+                            product.unlink()
+                    counts['products'] += 1
+                except (UserError, psycopg2.Error):
+                    self.env.invalidate_all()
+                    product.active = False
+                    counts['archived_products'] += 1
+            if auto_commit:
+                self.env.cr.commit()
+            self.env.invalidate_all()
+            logger.info(
+                "Rental reset: %s products deleted, %s archived",
+                counts['products'], counts['archived_products'],
+            )
@@ -0,0 +1,272 @@
+from odoo import models, fields, api, SUPERUSER_ID
+from odoo.http import request
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PERF_PARAM = 'tl_rental_manager.perf_instrumentation'
+PROFILE_THRESHOLD_PARAM = 'tl_rental_manager.profile_threshold_ms'
+PROFILE_SAMPLE_RATE_PARAM = 'tl_rental_manager.profile_sample_rate'
+PROFILE_PREFIX = 'tlrm_profile_'
+
+_profiling = threading.local()
+
+
+def _float_param(env, key):
+    try:
+        return float(env['ir.config_parameter'].sudo().get_param(key) or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def tlrm_profiled(name):
+    """Profile a sample of calls and keep the slow ones as attachments.
+
+    Works on controller endpoints and model methods. Sampling is opt-in:
+    ``tl_rental_manager.profile_sample_rate`` (0-1) selects the share of calls
+    run under cProfile and ``tl_rental_manager.profile_threshold_ms`` is the
+    duration above which the profile is stored. Unsampled calls only pay for
+    two cached parameter reads.
+
+    :param name: label used in the attachment name, e.g. ``'grid_global'``
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            env = getattr(self, 'env', None) or request.env
+            threshold_ms = _float_param(env, PROFILE_THRESHOLD_PARAM)
+            sample_rate = _float_param(env, PROFILE_SAMPLE_RATE_PARAM)
+            if (threshold_ms <= 0 or sample_rate <= 0
+                    or getattr(_profiling, 'active', False)
+                    or random.random() >= sample_rate):
+                return func(self, *args, **kwargs)
+
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler (e.g. Odoo's own) is already attached
+                return func(self, *args, **kwargs)
+            _profiling.active = True
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                profiler.disable()
+                _profiling.active = False
+                elapsed_ms = (time.perf_counter() - start) * 1000.0
+                if elapsed_ms >= threshold_ms:
+                    _store_profile(env, name, elapsed_ms, profiler)
+        return wrapper
+    return decorator
+
+
+def _store_profile(env, name, elapsed_ms, profiler):
+    """Save a cProfile report as an attachment of ``tl.rental.perf.stat``.
+
+    A separate cursor is used so the profile survives a failing request.
+    """
+    stream = io.StringIO()
+    path = request.httprequest.path if request else None
+    stream.write("Operation: %s\n" % name)
+    if path:
+        stream.write("Path: %s\n" % path)
+    stream.write("User: %s\n" % env.uid)
+    stream.write("Duration: %.1f ms\n\n" % elapsed_ms)
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(80)
+    timestamp = time.strftime('%Y%m%d_%H%M%S', time.gmtime())
+    try:
+        with env.registry.cursor() as cr:
+            su_env = api.Environment(cr, SUPERUSER_ID, {})
+            su_env['ir.attachment'].create({
+                'name': f"{PROFILE_PREFIX}{name}_{timestamp}_{int(elapsed_ms)}ms.txt",
+                'description': f"{name}: {elapsed_ms:.1f} ms" + (f" ({path})" if path else ""),
+                'res_model': 'tl.rental.perf.stat',
+                'mimetype': 'text/plain',
+                'raw': stream.getvalue().encode(),
+            })
+    except Exception:
+        logger.warning("Could not store rental profile for %s", name, exc_info=True)
+
+
+class TlrmPerfRecorder:
+    """Collect per-phase timings, query counts and row counts for one call.
+
+    A disabled recorder is a no-op, so hot paths can always wrap their
+    phases without paying for the bookkeeping.
+    """
+
+    def __init__(self, cr, enabled=False):
+        self.cr = cr
+        self.enabled = enabled
+        self.phases = {}
+        self.phase_queries = {}
+        self.row_count = 0
+        self._start = time.perf_counter() if enabled else 0.0
+        self._query_start = self._query_count() if enabled else 0
+
+    def _query_count(self):
+        return getattr(self.cr, 'sql_log_count', 0)
+
+    @contextmanager
+    def phase(self, name):
+        """Time the wrapped block and add it to phase ``name``."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        query_start = self._query_count()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+            self.phase_queries[name] = self.phase_queries.get(name, 0) + self._query_count() - query_start
+
+    @property
+    def total_ms(self):
+        if not self.enabled:
+            return 0.0
+        return (time.perf_counter() - self._start) * 1000.0
+
+    @property
+    def query_count(self):
+        if not self.enabled:
+            return 0
+        return self._query_count() - self._query_start
+
+    def as_meta(self):
+        """Return the collected figures as a JSON-serializable dict."""
+        return {
+            'total_ms': round(self.total_ms, 3),
+            'query_count': self.query_count,
+            'row_count': self.row_count,
+            'phases': {name: round(ms, 3) for name, ms in self.phases.items()},
+            'phase_queries': dict(self.phase_queries),
+        }
+
+
+class TlRentalPerfStat(models.Model):
+    _name = 'tl.rental.perf.stat'
+    _description = 'TL Rental Performance Statistic'
+    _order = 'total_ms desc, id'
+    _log_access = False
+
+    operation = fields.Selection([
+        ('grid', 'Availability Grid'),
+        ('line_check', 'Line Availability Check'),
+    ], string="Operation", required=True, readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", readonly=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string="Warehouse", readonly=True)
+    product_id = fields.Many2one('product.product', string="Product", readonly=True)
+
+    call_count = fields.Integer(string="Calls", readonly=True)
+    total_ms = fields.Float(string="Total (ms)", readonly=True, digits=(16, 1))
+    avg_ms = fields.Float(string="Average (ms)", readonly=True, digits=(16, 1), aggregator='avg')
+    max_ms = fields.Float(string="Max (ms)", readonly=True, digits=(16, 1), aggregator='max')
+    last_ms = fields.Float(string="Last (ms)", readonly=True, digits=(16, 1), aggregator='max')
+    query_count = fields.Integer(string="Queries", readonly=True)
+    row_count = fields.Integer(string="Rows", readonly=True)
+    phase_ms = fields.Json(string="Time per Phase (ms)", readonly=True)
+    last_call_at = fields.Datetime(string="Last Call", readonly=True)
+
+    _key_uniq = models.UniqueIndex(
+        '(operation, company_id, COALESCE(warehouse_id, 0), COALESCE(product_id, 0))'
+    )
+
+    @api.model
+    def _new_recorder(self):
+        """Return a recorder, enabled when instrumentation is switched on.
+
+        Instrumentation is opt-in, either per call with the ``tlrm_perf``
+        context key or globally with the ``tl_rental_manager.perf_instrumentation``
+        system parameter.
+        """
+        enabled = bool(self.env.context.get('tlrm_perf'))
+        if not enabled:
+            param = self.env['ir.config_parameter'].sudo().get_param(PERF_PARAM)
+            enabled = param not in (False, None, '', '0', 'False', 'false')
+        return TlrmPerfRecorder(self.env.cr, enabled)
+
+    @api.model
+    def _record(self, operation, recorder, company_id=None, warehouse_id=None, product_id=None):
+        """Queue the figures of ``recorder`` for aggregation.
+
+        Statistics are written after the current transaction commits, in a
+        separate cursor, so they never lock or roll back business data and
+        are simply dropped when the transaction fails.
+        """
+        if not recorder.enabled:
+            return
+        entries = self.env.cr.postcommit.data.setdefault('tlrm.perf_stats', [])
+        if not entries:
+            registry = self.env.registry
+            self.env.cr.postcommit.add(lambda: self._flush_entries(registry, entries))
+        entries.append((
+            operation,
+            company_id or None,
+            warehouse_id or None,
+            product_id or None,
+            recorder.total_ms,
+            recorder.query_count,
+            recorder.row_count,
+            json.dumps({name: round(ms, 3) for name, ms in recorder.phases.items()}),
+        ))
+
+    @api.model
+    def _flush_entries(self, registry, entries):
+        """Upsert queued entries into the statistics table."""
+        query = """
+            INSERT INTO tl_rental_perf_stat AS stat (
+                operation, company_id, warehouse_id, product_id,
+                call_count, total_ms, avg_ms, max_ms, last_ms,
+                query_count, row_count, phase_ms, last_call_at
+            )
+            VALUES (%s, %s, %s, %s, 1, %s, %s, %s, %s, %s, %s, %s::jsonb, (now() AT TIME ZONE 'UTC'))
+            ON CONFLICT (operation, company_id, COALESCE(warehouse_id, 0), COALESCE(product_id, 0))
+            DO UPDATE SET
+                call_count = stat.call_count + 1,
+                total_ms = stat.total_ms + EXCLUDED.total_ms,
+                avg_ms = (stat.total_ms + EXCLUDED.total_ms) / (stat.call_count + 1),
+                max_ms = GREATEST(stat.max_ms, EXCLUDED.max_ms),
+                last_ms = EXCLUDED.last_ms,
+                query_count = stat.query_count + EXCLUDED.query_count,
+                row_count = stat.row_count + EXCLUDED.row_count,
+                phase_ms = (
+                    SELECT jsonb_object_agg(
+                        key,
+                        COALESCE((stat.phase_ms ->> key)::float, 0.0)
+                        + COALESCE((EXCLUDED.phase_ms ->> key)::float, 0.0)
+                    )
+                    FROM jsonb_object_keys(COALESCE(stat.phase_ms, '{}'::jsonb) || EXCLUDED.phase_ms) AS key
+                ),
+                last_call_at = EXCLUDED.last_call_at
+        """
+        params = [
+            (operation, company_id, warehouse_id, product_id,
+             total_ms, total_ms, total_ms, total_ms,
+             query_count, row_count, phases)
+            for (operation, company_id, warehouse_id, product_id,
+                 total_ms, query_count, row_count, phases) in entries
+        ]
+        try:
+            with registry.cursor() as cr:
+                for row in params:
+                    cr.execute(query, row)
+        except Exception:
+            logger.warning("Could not record rental performance statistics", exc_info=True)
+
+    def action_reset(self):
+        """Delete the selected statistics (all of them when called on an empty set)."""
+        records = self or self.search([])
+        records.unlink()
+        return True
@@ -0,0 +1,95 @@
+import math
+
+HOURS_PER_DAY = 24
+HOURS_PER_WEEK = 7 * HOURS_PER_DAY
+# Price table columns, one row per product template
+PRICE_TABLE_FIELDS = (
+    'tlrm_price_hour', 'tlrm_price_day', 'tlrm_price_week',
+    'tlrm_min_hours', 'tlrm_min_days', 'tlrm_min_weeks',
+)
+
+
+class TlrmPricingEngine:
+    """Cheapest hour/day/week rental price of many periods at once.
+
+    A period of ``D`` hours (rounded up) is billed as ``w`` weeks, ``d``
+    days and ``h`` hours covering it. A unit is only used when it has a
+    price, and then at least its minimum count (``tlrm_min_*``). As the
+    unit sizes divide each other, the cheapest cover is found among few
+    candidates: no weeks, the minimum weeks, or the weeks that cover the
+    period (rounded up, or down and a few less so that the remainder can
+    reach the minimum days and hours); the same for days over the
+    remaining hours, and the rest in hours.
+    """
+
+    def __init__(self, price_tables):
+        """:param price_tables: dict template_id -> tuple of PRICE_TABLE_FIELDS values"""
+        self.price_tables = price_tables
+
+    def price(self, template_ids, hours):
+        """Price one unit of each template for the matching duration.
+
+        :param template_ids: list of product.template ids
+        :param hours: list of durations in hours, same length
+        :return: list of ``(price, weeks, days, hours)`` tuples; periods
+            without any priced unit cost 0
+        """
+        if not template_ids:
+            return []
+        empty = (0.0,) * len(PRICE_TABLE_FIELDS)
+        rows = [self.price_tables.get(tid, empty) for tid in template_ids]
+        columns = [[float(row[index] or 0.0) for row in rows] for index in range(len(PRICE_TABLE_FIELDS))]
+        durations = [max(math.ceil(float(duration or 0.0) - 1e-9), 0) for duration in hours]
+        return self._price(columns, durations)
+
+    @staticmethod
+    def _step_backs(min_days, min_hours):
+        """Number of units below the covering count worth trying, for weeks and days.
+
+        Billing a unit less leaves a larger remainder, which can be cheaper
+        when the remainder would otherwise be bumped to the next unit's
+        minimum.
+        """
+        return (
+            math.ceil(min_days / 7) + math.ceil(min_hours / HOURS_PER_WEEK) + 1,
+            math.ceil(min_hours / HOURS_PER_DAY) + 1,
+        )
+
+    @staticmethod
+    def _candidates(hours, unit_hours, minimum, step_back):
+        """Unit counts worth trying to cover ``hours`` with units of ``unit_hours``."""
+        covering = hours // unit_hours
+        return [0, minimum, math.ceil(hours / unit_hours)] + [
+            max(covering - step, 0) for step in range(step_back + 1)
+        ]
+
+    def _price(self, columns, durations):
+        result = []
+        for index, total in enumerate(durations):
+            price_hour, price_day, price_week, min_hours, min_days, min_weeks = (
+                column[index] for column in columns
+            )
+            min_hours, min_days, min_weeks = (
+                math.ceil(value - 1e-9) for value in (min_hours, min_days, min_weeks)
+            )
+            week_back, day_back = self._step_backs(min_days, min_hours)
+            best = None
+            for weeks in self._candidates(total, HOURS_PER_WEEK, min_weeks, week_back):
+                rest = max(total - weeks * HOURS_PER_WEEK, 0)
+                for days in self._candidates(rest, HOURS_PER_DAY, min_days, day_back):
+                    billed = (
+                        max(weeks, min_weeks) if weeks > 0 else 0,
+                        max(days, min_days) if days > 0 else 0,
+                        max(rest - days * HOURS_PER_DAY, min_hours) if rest > days * HOURS_PER_DAY else 0,
+                    )
+                    if ((billed[0] and price_week <= 0) or (billed[1] and price_day <= 0)
+                            or (billed[2] and price_hour <= 0)):
+                        continue
+                    cost = billed[0] * price_week + billed[1] * price_day + billed[2] * price_hour
+                    # Strict comparison keeps the first cheapest candidate
+                    if best is None or cost < best[0]:
+                        best = (cost, *billed)
+            result.append(
+                (float(best[0]), int(best[1]), int(best[2]), int(best[3])) if best else (0.0, 0, 0, 0)
+            )
+        return result
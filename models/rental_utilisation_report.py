@@ -0,0 +1,157 @@
+from odoo import models, fields, api
+from odoo.tools import SQL
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Booking states whose lines count as booked: committed plans and past rentals
+UTILISATION_BOOKED_STATES = ('planned', 'reserved', 'ongoing', 'finished', 'returned')
+
+
+class TlRentalUtilisationReport(models.Model):
+    """Booked and owned unit-days per product, warehouse, project and month.
+
+    Backed by a materialized view over the live and archived booking lines,
+    refreshed nightly by a cron, so that multi-year analyses are plain
+    grouped reads. Each month holds the booked unit-days of the lines
+    overlapping it (per project), and the capacity of the fleet currently
+    in stock (on the rows without project). Grouping over both gives the
+    utilisation; the capacity uses today's stock for every month, as
+    historical stock levels are not kept.
+
+    Row ids are derived from the grouping key (month, company, product,
+    warehouse and project), as a 52-bit hash that the web client handles
+    exactly, so a row keeps its id across refreshes.
+    """
+    _name = 'tl.rental.utilisation.report'
+    _description = 'TL Rental Utilisation Analysis'
+    _auto = False
+    _order = 'period desc, product_id, warehouse_id'
+
+    period = fields.Date(string="Month", readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", readonly=True)
+    product_id = fields.Many2one('product.product', string="Product", readonly=True)
+    warehouse_id = fields.Many2one('stock.warehouse', string="Warehouse", readonly=True)
+    project_id = fields.Many2one('project.project', string="Project", readonly=True)
+    booked_unit_days = fields.Float(string="Booked Unit-Days", readonly=True, digits=(16, 1))
+    capacity_unit_days = fields.Float(string="Capacity Unit-Days", readonly=True, digits=(16, 1))
+    utilisation = fields.Float(
+        string="Utilisation (%)", readonly=True, digits=(16, 1), aggregator='avg',
+        help="Booked unit-days divided by capacity unit-days. Grouped, it is "
+             "computed from the sums of both, not averaged over rows.",
+    )
+
+    def init(self):
+        product_query = self.env['product.product'].with_context(active_test=False)._search(
+            self.env['product.product']._tlrm_rental_product_domain()
+        )
+        self.env.cr.execute(SQL("DROP MATERIALIZED VIEW IF EXISTS %s", SQL.identifier(self._table)))
+        self.env.cr.execute(SQL("""
+            CREATE MATERIALIZED VIEW %(table)s AS
+            WITH booked_lines AS (
+                SELECT line.company_id, line.product_id, line.source_warehouse_id AS warehouse_id,
+                       line.project_id, line.quantity, line.date_start, line.date_end
+                  FROM tl_rental_booking_line line
+                 WHERE line.state IN %(states)s
+                UNION ALL
+                SELECT line.company_id, line.product_id, line.source_warehouse_id AS warehouse_id,
+                       archive.project_id, line.quantity, line.date_start, line.date_end
+                  FROM tl_rental_booking_line_archive line
+                  JOIN tl_rental_booking_archive archive ON archive.id = line.archive_id
+                 WHERE line.state IN %(states)s
+            ),
+            booked AS (
+                SELECT bl.company_id, bl.product_id, bl.warehouse_id, bl.project_id,
+                       month.period::date AS period,
+                       SUM(bl.quantity * EXTRACT(EPOCH FROM
+                           LEAST(bl.date_end, month.period + INTERVAL '1 month')
+                           - GREATEST(bl.date_start, month.period)
+                       ) / 86400.0) AS unit_days
+                  FROM booked_lines bl
+                 CROSS JOIN LATERAL generate_series(
+                       date_trunc('month', bl.date_start), bl.date_end, INTERVAL '1 month'
+                       ) AS month(period)
+                 WHERE bl.product_id IS NOT NULL
+                   AND bl.date_end > bl.date_start
+                   AND month.period < bl.date_end
+                 GROUP BY 1, 2, 3, 4, 5
+            ),
+            periods AS (
+                SELECT generate_series(
+                           MIN(period),
+                           GREATEST(MAX(period), date_trunc('month', NOW() AT TIME ZONE 'UTC')::date),
+                           INTERVAL '1 month'
+                       )::date AS period
+                  FROM booked
+            ),
+            fleet AS (
+                SELECT quant.company_id, quant.product_id, location.warehouse_id,
+                       SUM(quant.quantity) AS quantity
+                  FROM stock_quant quant
+                  JOIN stock_location location ON location.id = quant.location_id
+                 WHERE location.usage = 'internal'
+                   AND quant.product_id IN %(products)s
+                 GROUP BY 1, 2, 3
+                HAVING SUM(quant.quantity) > 0
+            ),
+            report_rows AS (
+                SELECT company_id, product_id, warehouse_id, project_id, period,
+                       unit_days AS booked_unit_days, 0.0 AS capacity_unit_days
+                  FROM booked
+                UNION ALL
+                SELECT fleet.company_id, fleet.product_id, fleet.warehouse_id, NULL::integer, periods.period,
+                       0.0, fleet.quantity * ((periods.period + INTERVAL '1 month')::date - periods.period)
+                  FROM fleet
+                 CROSS JOIN periods
+            )
+            SELECT ('x' || lpad(left(md5(concat_ws('/',
+                       period, company_id, product_id, COALESCE(warehouse_id, 0), COALESCE(project_id, 0)
+                   )), 13), 16, '0'))::bit(64)::bigint AS id,
+                   period, company_id, product_id, warehouse_id, project_id,
+                   SUM(booked_unit_days) AS booked_unit_days,
+                   SUM(capacity_unit_days) AS capacity_unit_days,
+                   CASE WHEN SUM(capacity_unit_days) > 0
+                        THEN 100.0 * SUM(booked_unit_days) / SUM(capacity_unit_days)
+                   END AS utilisation
+              FROM report_rows
+             GROUP BY period, company_id, product_id, warehouse_id, project_id
+        """,
+            table=SQL.identifier(self._table),
+            states=UTILISATION_BOOKED_STATES,
+            products=product_query.subselect(),
+        ))
+        # REFRESH ... CONCURRENTLY needs a unique index
+        self.env.cr.execute(SQL(
+            "CREATE UNIQUE INDEX %s ON %s (id)",
+            SQL.identifier(f'{self._table}_id_uniq'), SQL.identifier(self._table),
+        ))
+        self.env.cr.execute(SQL(
+            "CREATE INDEX %s ON %s (period, company_id)",
+            SQL.identifier(f'{self._table}_period_idx'), SQL.identifier(self._table),
+        ))
+
+    def _read_group_select(self, aggregate_spec, query):
+        # Utilisation of a group is the ratio of its sums, not an average of row ratios
+        fname, __, __ = aggregate_spec.partition(':')
+        if fname == 'utilisation':
+            return SQL(
+                "100.0 * SUM(%s) / NULLIF(SUM(%s), 0)",
+                self._field_to_sql(self._table, 'booked_unit_days', query),
+                self._field_to_sql(self._table, 'capacity_unit_days', query),
+            )
+        return super()._read_group_select(aggregate_spec, query)
+
+    @api.model
+    def _refresh(self):
+        """Recompute the view from the current booking lines and stock.
+
+        The refresh is concurrent, so reports stay readable meanwhile.
+        """
+        self.env.flush_all()
+        self.env.cr.execute(SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY %s", SQL.identifier(self._table)))
+        self.env.invalidate_all()
+
+    @api.model
+    def _cron_refresh(self):
+        self._refresh()
+        logger.info("Rental utilisation report refreshed")
@@ -0,0 +1,143 @@
+from collections import defaultdict
+from itertools import combinations
+
+# Up to this many warehouses, all warehouse sets are tried by increasing size
+MAX_EXACT_WAREHOUSES = 8
+
+
+class TlrmWarehouseAllocator:
+    """Assign the lines of one booking to source warehouses.
+
+    Works on a snapshot of the quantity available per product and
+    warehouse over the booking period. The lines are served from as few
+    warehouses as possible, each extra source warehouse meaning more
+    pickings: the smallest set of warehouses covering every product is
+    searched exhaustively when there are few warehouses, greedily
+    otherwise, preferring sets with the booking's own warehouse, then the
+    fewest split lines and the most spare units. Within that set, a line
+    stays in one warehouse when one can hold it (the preferred one first),
+    and is only split over several warehouses otherwise.
+    """
+
+    def __init__(self, available, preferred_warehouse_id=None):
+        """
+        :param available: dict product_id -> dict warehouse_id -> available quantity
+        :param preferred_warehouse_id: stock.warehouse id of the booking header
+        """
+        self.available = available
+        self.preferred = preferred_warehouse_id
+        warehouse_ids = {wid for by_warehouse in available.values() for wid in by_warehouse}
+        if preferred_warehouse_id:
+            warehouse_ids.add(preferred_warehouse_id)
+        # Preferred warehouse first, then by total availability
+        totals = defaultdict(float)
+        for by_warehouse in available.values():
+            for wid, quantity in by_warehouse.items():
+                totals[wid] += max(quantity, 0.0)
+        self.warehouse_ids = sorted(
+            warehouse_ids, key=lambda wid: (wid != preferred_warehouse_id, -totals[wid], wid),
+        )
+
+    def _capacity(self, product_id, warehouse_ids):
+        by_warehouse = self.available.get(product_id, {})
+        return sum(max(by_warehouse.get(wid, 0.0), 0.0) for wid in warehouse_ids)
+
+    def _slack(self, needed, warehouse_ids):
+        """Spare units of a warehouse set, or None when it cannot cover ``needed``."""
+        slack = 0.0
+        for product_id, quantity in needed.items():
+            spare = self._capacity(product_id, warehouse_ids) - quantity
+            if spare < 0:
+                return None
+            slack += spare
+        return slack
+
+    def _select_warehouses(self, demands, needed):
+        """Return the warehouse ids to serve the demands from.
+
+        :param needed: dict product_id -> total demanded quantity
+        """
+        if len(self.warehouse_ids) <= MAX_EXACT_WAREHOUSES:
+            for size in range(1, len(self.warehouse_ids) + 1):
+                best = None
+                for subset in combinations(self.warehouse_ids, size):
+                    slack = self._slack(needed, subset)
+                    if slack is None:
+                        continue
+                    allocation, _shortages = self._assign(demands, list(subset))
+                    splits = sum(len(pieces) - 1 for pieces in allocation.values())
+                    rank = (self.preferred not in subset, splits, -slack)
+                    if best is None or rank < best[0]:
+                        best = (rank, subset)
+                if best:
+                    return list(best[1])
+            return list(self.warehouse_ids)
+
+        # Greedy set cover: add the warehouse covering most of what is missing
+        selected = [self.preferred] if self.preferred else []
+        while self._slack(needed, selected) is None:
+            def gain(wid):
+                return sum(
+                    min(max(self.available.get(pid, {}).get(wid, 0.0), 0.0),
+                        max(quantity - self._capacity(pid, selected), 0.0))
+                    for pid, quantity in needed.items()
+                )
+            remaining = [wid for wid in self.warehouse_ids if wid not in selected]
+            if not remaining:
+                break
+            best = max(remaining, key=gain)
+            if gain(best) <= 0:
+                break
+            selected.append(best)
+        return selected or list(self.warehouse_ids[:1])
+
+    def allocate(self, demands):
+        """Split the demanded quantities over warehouses.
+
+        :param demands: list of ``(key, product_id, quantity)``, one per line
+        :return: tuple ``(allocation, shortages)``: ``allocation`` maps each
+            key to a list of ``(warehouse_id, quantity)`` pieces, the first
+            one being the largest; ``shortages`` maps product ids to the
+            quantity no warehouse can provide, which is left on the
+            preferred (or first selected) warehouse
+        """
+        needed = defaultdict(float)
+        for _key, product_id, quantity in demands:
+            needed[product_id] += quantity
+        return self._assign(demands, self._select_warehouses(demands, needed))
+
+    def _assign(self, demands, selected):
+        """Split the demands over the ``selected`` warehouse ids, see :meth:`allocate`."""
+        remaining = {
+            product_id: {wid: max(self.available.get(product_id, {}).get(wid, 0.0), 0.0) for wid in selected}
+            for _key, product_id, _quantity in demands
+        }
+        fallback = self.preferred if self.preferred in selected or not selected else selected[0]
+
+        allocation = {}
+        shortages = defaultdict(float)
+        # Largest lines first, so that they are the ones kept whole
+        for key, product_id, quantity in sorted(demands, key=lambda demand: -demand[2]):
+            stock = remaining[product_id]
+            whole = next((wid for wid in selected if stock[wid] >= quantity), None)
+            if whole is not None:
+                stock[whole] -= quantity
+                allocation[key] = [(whole, quantity)]
+                continue
+            pieces = []
+            left = quantity
+            for wid in sorted(selected, key=lambda wid: -stock[wid]):
+                if left <= 0 or stock[wid] <= 0:
+                    break
+                taken = min(stock[wid], left)
+                stock[wid] -= taken
+                left -= taken
+                pieces.append((wid, taken))
+            if left > 0:
+                shortages[product_id] += left
+                pieces.append((fallback, left))
+            merged = defaultdict(float)
+            for wid, taken in pieces:
+                merged[wid] += taken
+            allocation[key] = sorted(merged.items(), key=lambda piece: -piece[1])
+        return allocation, dict(shortages)
@@ -0,0 +1,40 @@
+from odoo import models, fields, api
+
+# Keys the availability screens may store in tlrm_preferences
+TLRM_PREFERENCE_KEYS = {'warehouse_id', 'sort_order', 'week_count', 'view_mode'}
+
+
+class ResUsers(models.Model):
+    _inherit = 'res.users'
+
+    tlrm_preferences = fields.Json(
+        string="Rental Screen Preferences",
+        copy=False,
+        groups='base.group_system',
+        help="Last choices made on the rental availability screens (warehouse, sort order, ...).",
+    )
+
+    def _tlrm_get_preferences(self):
+        """Return the rental screen preferences of this user."""
+        self.ensure_one()
+        return dict(self.sudo().tlrm_preferences or {})
+
+    def _tlrm_set_preferences(self, values):
+        """Merge ``values`` into the rental screen preferences of this user.
+
+        Unknown keys are ignored; a ``None`` value removes the key.
+
+        :param values: dict of preference values
+        :return: the updated preferences
+        """
+        self.ensure_one()
+        preferences = self._tlrm_get_preferences()
+        for key, value in (values or {}).items():
+            if key not in TLRM_PREFERENCE_KEYS:
+                continue
+            if value is None:
+                preferences.pop(key, None)
+            else:
+                preferences[key] = value
+        self.sudo().tlrm_preferences = preferences
+        return preferences
@@ -0,0 +1,12 @@
+from odoo import models, fields
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    # Booking of the move, also when its picking is a wave shared by many bookings
+    tlrm_booking_id = fields.Many2one('tl.rental.booking', string="Rental Booking", index='btree_not_null')
+
+    def _prepare_merge_moves_distinct_fields(self):
+        """Never merge moves of different bookings in a wave picking."""
+        return super()._prepare_merge_moves_distinct_fields() + ['tlrm_booking_id']
@@ -1,4 +1,6 @@
-from odoo import models, fields
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from collections import defaultdict
 
 
 class StockPicking(models.Model):
@@ -9,26 +11,128 @@ class StockPicking(models.Model):
         ('out', 'Rental Out'),
         ('in', 'Rental In'),
     ], string="Rental Direction")
+    tlrm_wave = fields.Boolean(
+        string="Rental Wave",
+        help="Consolidated picking holding the rental moves of several bookings on the same day.",
+    )
+    tlrm_booking_ids = fields.Many2many(
+        'tl.rental.booking',
+        string="Rental Bookings",
+        compute='_compute_tlrm_booking_ids',
+    )
+
+    @api.depends('tlrm_booking_id', 'move_ids.tlrm_booking_id')
+    def _compute_tlrm_booking_ids(self):
+        for picking in self:
+            picking.tlrm_booking_ids = picking.tlrm_booking_id | picking.move_ids.tlrm_booking_id
+
+    def _tlrm_autofill_quantities(self):
+        """Set the quantity of unprocessed rental moves to their demand.
+
+        Moves are written in one batch per demanded quantity instead of
+        one write per move.
+        """
+        moves_by_qty = defaultdict(lambda: self.env['stock.move'])
+        for move in self.filtered('tlrm_direction').move_ids:
+            if move.state not in ('done', 'cancel') and move.quantity == 0 and move.product_uom_qty > 0:
+                moves_by_qty[move.product_uom_qty] |= move
+        for qty, moves in moves_by_qty.items():
+            moves.write({'quantity': qty})
 
     def button_validate(self):
         """Auto-fill done quantities for rental pickings before validation."""
-        for picking in self:
-            if picking.tlrm_booking_id and picking.tlrm_direction:
-                for move in picking.move_ids:
-                    if move.quantity == 0 and move.product_uom_qty > 0:
-                        move.quantity = move.product_uom_qty
+        self._tlrm_autofill_quantities()
         return super().button_validate()
 
+    def action_tlrm_bulk_validate(self):
+        """Validate many rental pickings at once and report the failures.
+
+        Rental pickings are reserved and their quantities filled in batch,
+        then validated together without the backorder wizard (a remaining
+        quantity becomes a backorder). When the batch fails, the pickings
+        are validated one by one so that only the failing ones are left.
+
+        :return: notification action summarizing the result
+        """
+        rental = self.filtered(lambda picking: picking.tlrm_direction and picking.state not in ('done', 'cancel'))
+        skipped = self - rental
+        failures = []
+        rental.filtered(lambda picking: picking.state in ('confirmed', 'waiting')).action_assign()
+        rental._tlrm_autofill_quantities()
+        rental = rental.with_context(skip_backorder=True)
+        try:
+            with self.env.cr.savepoint():
+                rental.button_validate()
+        except UserError:
+            self.env.invalidate_all()
+            for picking in rental:
+                try:
+                    with self.env.cr.savepoint():
+                        picking.button_validate()
+                except UserError as error:
+                    self.env.invalidate_all()
+                    failures.append('%s: %s' % (picking.name, error.args[0]))
+
+        done_count = len(rental.filtered(lambda picking: picking.state == 'done'))
+        message = _("%(done)s of %(total)s rental pickings validated.", done=done_count, total=len(rental))
+        if skipped:
+            message += '\n' + _("%s pickings skipped (not rental, done or cancelled).", len(skipped))
+        if failures:
+            message += '\n' + '\n'.join(failures)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _("Validate Rental Pickings"),
+                'message': message,
+                'type': 'warning' if failures else 'success',
+                'sticky': bool(failures),
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
+
     def _action_done(self):
         """Update booking state when picking is completed."""
         res = super()._action_done()
-        for picking in self:
-            booking = picking.tlrm_booking_id
-            if not booking:
-                continue
-            if picking.tlrm_direction == 'out' and booking.state == 'reserved':
-                booking.state = 'ongoing'
-            elif picking.tlrm_direction == 'in':
-                if booking.state in ['ongoing', 'finished']:
-                    booking.state = 'returned'
+        self._tlrm_sync_booking_states()
         return res
+
+    def _tlrm_sync_booking_states(self):
+        """Move the bookings of these rental pickings on once their transfers are done.
+
+        Target states are computed for all bookings of the recordset first,
+        then applied with one write per target state:
+
+        - a done outbound picking moves its reserved bookings to ongoing;
+        - a done return picking moves its ongoing or finished bookings to
+          returned, unless other return transfers of the booking are still
+          pending (partial return).
+        """
+        rental = self.filtered(lambda picking: picking.tlrm_direction and picking.state == 'done')
+        if not rental:
+            return
+        outbound = rental.filtered(lambda picking: picking.tlrm_direction == 'out')
+        to_ongoing = outbound.tlrm_booking_ids.filtered(lambda booking: booking.state == 'reserved')
+        if to_ongoing:
+            # The lines stay committed: no availability to check again
+            to_ongoing.sudo().with_context(tlrm_skip_availability_check=True).write({'state': 'ongoing'})
+
+        returns = rental.filtered(lambda picking: picking.tlrm_direction == 'in')
+        candidates = returns.tlrm_booking_ids.filtered(lambda booking: booking.state in ('ongoing', 'finished'))
+        if not candidates:
+            return
+        pending_moves = self.env['stock.move'].search([
+            ('tlrm_booking_id', 'in', candidates.ids),
+            ('picking_id.tlrm_direction', '=', 'in'),
+            ('state', 'not in', ('done', 'cancel')),
+        ])
+        # Pickings created before moves carried their booking
+        pending_pickings = self.search([
+            ('tlrm_booking_id', 'in', candidates.ids),
+            ('tlrm_direction', '=', 'in'),
+            ('state', 'not in', ('done', 'cancel')),
+        ])
+        to_return = candidates - pending_moves.tlrm_booking_id - pending_pickings.tlrm_booking_id
+        if to_return:
+            # Returned lines no longer commit units: the check has nothing to do
+            to_return.write({'state': 'returned'})
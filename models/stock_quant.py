@@ -0,0 +1,44 @@
+from odoo import models, api
+
+
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super().create(vals_list)
+        quants._tlrm_fleet_quants().filtered('quantity')._tlrm_mark_counters_dirty()
+        return quants
+
+    def write(self, vals):
+        if 'quantity' not in vals:
+            return super().write(vals)
+        fleet_quants = self._tlrm_fleet_quants()
+        old_quantities = {quant.id: quant.quantity for quant in fleet_quants}
+        res = super().write(vals)
+        fleet_quants.filtered(
+            lambda quant: quant.quantity != old_quantities[quant.id]
+        )._tlrm_mark_counters_dirty()
+        return res
+
+    def unlink(self):
+        self._tlrm_fleet_quants().filtered('quantity')._tlrm_mark_counters_dirty()
+        return super().unlink()
+
+    def _tlrm_fleet_quants(self):
+        """Return the quants counted in the fleet capacity of rental products."""
+        rental_products = self.product_id.filtered_domain(
+            self.env['product.product']._tlrm_rental_product_domain()
+        )
+        return self.filtered(
+            lambda quant: quant.product_id in rental_products and quant.location_id.usage == 'internal'
+        )
+
+    def _tlrm_mark_counters_dirty(self):
+        """Fleet capacity changed: refresh the stored rental counters."""
+        if not self:
+            return
+        self.env['product.template']._tlrm_mark_counters_dirty(
+            self.product_id.product_tmpl_id.ids,
+            self.company_id.ids,
+        )
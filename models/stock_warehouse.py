@@ -11,6 +11,12 @@ class StockWarehouse(models.Model):
         help="Location where products are moved when rented out. "
              "Products in this location are not available for other bookings.",
     )
+    tlrm_consolidate_pickings = fields.Boolean(
+        string="Consolidate Rental Pickings",
+        help="Group the rental moves of all bookings leaving (or returning to) this "
+             "warehouse on the same day into one outbound (or return) wave picking, "
+             "instead of one picking per booking.",
+    )
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -0,0 +1,125 @@
+/** @odoo-module **/
+
+import { onMounted, onWillUnmount } from "@odoo/owl";
+import { useService } from "@web/core/utils/hooks";
+import { _t } from "@web/core/l10n/translation";
+
+// Keep in sync with AVAILABILITY_BUS_TYPE in models/rental_booking.py
+export const AVAILABILITY_BUS_TYPE = "tlrm_availability_delta";
+
+/**
+ * Subscribe to availability deltas pushed by the server while the
+ * component is mounted.
+ *
+ * @param {Function} callback called with the message payload
+ *     ({company_id, deltas: [[kind, product_id, warehouse_id, start, end, qty], ...]})
+ */
+export function useAvailabilityDeltas(callback) {
+    const busService = useService("bus_service");
+    const handler = (payload) => callback(payload);
+    onMounted(() => busService.subscribe(AVAILABILITY_BUS_TYPE, handler));
+    onWillUnmount(() => busService.unsubscribe(AVAILABILITY_BUS_TYPE, handler));
+}
+
+/**
+ * Recompute cumulative incoming, availability and status of a grid row,
+ * following TlrmGridEngine on the server.
+ */
+function recomputeRow(row) {
+    const fleet = row.fleet_capacity || 0;
+    const needed = row.needed;
+    let cumulativeIncoming = 0;
+    for (const cell of row.cells) {
+        cumulativeIncoming += cell.incoming || 0;
+        const available = Math.max(fleet - (cell.committed || 0) + cumulativeIncoming, 0);
+        cell.available = available;
+        if (needed) {
+            cell.status = available >= needed ? "free" : available > 0 ? "partial" : "full";
+            cell.booking_ok = available >= needed;
+        } else {
+            cell.status = available > 0 ? "free" : "full";
+            cell.booking_ok = null;
+        }
+        cell.cumulative_incoming = cumulativeIncoming;
+        if (cell.forecast) {
+            cell.forecast_short = cell.forecast - (cell.committed || 0) > available;
+        }
+    }
+}
+
+/**
+ * Tooltip of a grid cell. The server only sends numbers, so the text is
+ * formatted here, for the cells actually hovered.
+ *
+ * @param {number} fleet fleet capacity of the cell's row
+ * @param {Object} cell grid cell
+ * @returns {string}
+ */
+export function cellTooltip(fleet, cell) {
+    let tooltip = _t(
+        "Fleet: %(fleet)s, Committed: %(committed)s, Incoming: %(incoming)s, Available: %(available)s",
+        {
+            fleet: fleet || 0,
+            committed: cell.committed || 0,
+            incoming: cell.cumulative_incoming || 0,
+            available: cell.available || 0,
+        }
+    );
+    if (cell.forecast) {
+        tooltip += "\n" + _t("Forecast demand: %(forecast)s", { forecast: cell.forecast });
+    }
+    return tooltip;
+}
+
+/**
+ * Apply server deltas in place to a week grid returned by get_availability_grid.
+ *
+ * Dates are UTC strings in Odoo's "YYYY-MM-DD HH:MM:SS" format, so they can be
+ * compared directly with the column bounds. Like the server, committed
+ * quantities are filtered by source warehouse only when the grid is, and
+ * incoming returns only count for a warehouse-specific grid.
+ *
+ * @returns {boolean} whether any row of the grid changed
+ */
+export function applyAvailabilityDeltas(grid, payload) {
+    if (!grid || !grid.rows || !grid.meta || payload.company_id !== grid.meta.company_id) {
+        return false;
+    }
+    const warehouseId = grid.meta.warehouse_id || null;
+    const columns = grid.columns || [];
+    const rowsByProduct = new Map();
+    for (const row of grid.rows) {
+        rowsByProduct.set(row.product_id, [...(rowsByProduct.get(row.product_id) || []), row]);
+    }
+    const touched = new Set();
+    for (const [kind, productId, deltaWarehouseId, start, end, qty] of payload.deltas || []) {
+        const rows = rowsByProduct.get(productId);
+        if (!rows) {
+            continue;
+        }
+        columns.forEach((column, index) => {
+            let hit = false;
+            if (kind === "committed") {
+                hit = (!warehouseId || deltaWarehouseId === warehouseId)
+                    && start < column.end && end > column.start;
+            } else if (kind === "incoming") {
+                hit = warehouseId && deltaWarehouseId === warehouseId
+                    && column.start <= start && start < column.end;
+            }
+            if (!hit) {
+                return;
+            }
+            for (const row of rows) {
+                const cell = row.cells[index];
+                if (cell) {
+                    cell[kind] = (cell[kind] || 0) + qty;
+                    touched.add(row);
+                }
+            }
+        });
+    }
+    for (const row of touched) {
+        recomputeRow(row);
+    }
+    return touched.size > 0;
+}
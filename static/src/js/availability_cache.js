@@ -0,0 +1,125 @@
+/** @odoo-module **/
+
+import { session } from "@web/session";
+import { user } from "@web/core/user";
+
+/**
+ * Persistent cache of availability grids in IndexedDB.
+ *
+ * Entries are keyed per database, user, company, warehouse and week window
+ * and carry the server's change token (``grid.meta.change_token``), so a
+ * screen can render from cache at once and revalidate in the background.
+ * Every function degrades to a cache miss when IndexedDB is unavailable
+ * (private browsing, quota errors, ...).
+ */
+
+const DB_NAME = "tl_rental_manager";
+const DB_VERSION = 1;
+const STORE = "availability_grids";
+// Oldest entries are evicted beyond this count
+const MAX_ENTRIES = 50;
+
+let dbPromise = null;
+
+function requestToPromise(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function openDatabase() {
+    if (!dbPromise) {
+        dbPromise = new Promise((resolve) => {
+            if (!window.indexedDB) {
+                resolve(null);
+                return;
+            }
+            const request = window.indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = () => {
+                const store = request.result.createObjectStore(STORE, { keyPath: "key" });
+                store.createIndex("savedAt", "savedAt");
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => resolve(null);
+            request.onblocked = () => resolve(null);
+        });
+    }
+    return dbPromise;
+}
+
+/**
+ * Build the cache key of a grid.
+ *
+ * @param {Object} params
+ * @param {string} params.scope screen or request kind, e.g. "global" or "bootstrap"
+ * @param {number|null} params.warehouseId
+ * @param {string} params.weekStart Monday of the first week (YYYY-MM-DD)
+ * @param {number} params.weekCount
+ * @param {number|null} params.limit
+ */
+export function availabilityCacheKey({ scope, warehouseId, weekStart, weekCount, limit }) {
+    const companyId = user.activeCompany?.id || "";
+    return [
+        session.db || "", user.userId, companyId, scope,
+        warehouseId || "all", weekStart, weekCount, limit || "",
+    ].join(":");
+}
+
+/**
+ * @returns {Promise<Object|null>} the cached value stored under ``key``
+ */
+export async function getCachedAvailability(key) {
+    try {
+        const db = await openDatabase();
+        if (!db) {
+            return null;
+        }
+        const entry = await requestToPromise(
+            db.transaction(STORE, "readonly").objectStore(STORE).get(key)
+        );
+        return entry ? entry.value : null;
+    } catch {
+        return null;
+    }
+}
+
+/**
+ * Store ``value`` under ``key`` and evict the oldest entries beyond the limit.
+ */
+export async function putCachedAvailability(key, value) {
+    try {
+        const db = await openDatabase();
+        if (!db) {
+            return;
+        }
+        const store = db.transaction(STORE, "readwrite").objectStore(STORE);
+        await requestToPromise(store.put({ key, value, savedAt: Date.now() }));
+        const count = await requestToPromise(store.count());
+        if (count > MAX_ENTRIES) {
+            let excess = count - MAX_ENTRIES;
+            const cursorRequest = store.index("savedAt").openCursor();
+            cursorRequest.onsuccess = () => {
+                const cursor = cursorRequest.result;
+                if (cursor && excess > 0) {
+                    cursor.delete();
+                    excess--;
+                    cursor.continue();
+                }
+            };
+        }
+    } catch {
+        // A cache write failure only costs a refetch next time
+    }
+}
+
+/**
+ * Monday (YYYY-MM-DD) of the week containing ``date``, matching the
+ * week alignment of get_availability_grid.
+ */
+export function weekStartOf(date) {
+    const monday = new Date(date);
+    monday.setDate(monday.getDate() - ((monday.getDay() + 6) % 7));
+    const pad = (n) => String(n).padStart(2, "0");
+    return `${monday.getFullYear()}-${pad(monday.getMonth() + 1)}-${pad(monday.getDate())}`;
+}
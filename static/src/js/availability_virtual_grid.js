@@ -0,0 +1,144 @@
+/** @odoo-module **/
+
+import { Component, onMounted, onWillUnmount, useRef, useState } from "@odoo/owl";
+import { cellTooltip } from "./availability_bus";
+
+/**
+ * Availability grid that only renders the rows and columns in view.
+ *
+ * Rows have a fixed height and columns a fixed width, so the visible window
+ * follows directly from the scroll position; spacer rows and cells keep the
+ * scrollbars the size of the full grid. The product column and the header
+ * stay sticky.
+ */
+export class TlrmVirtualGrid extends Component {
+    static template = "tl_rental_manager.TlrmVirtualGrid";
+    static props = {
+        columns: { type: Array },
+        rows: { type: Array },
+        sortOrder: { type: String, optional: true },
+        getCellColor: { type: Function },
+        getCellTitle: { type: Function, optional: true },
+        isCellClickable: { type: Function, optional: true },
+        onCellClick: { type: Function, optional: true },
+        onProductClick: { type: Function, optional: true },
+        onToggleSort: { type: Function, optional: true },
+        rowHeight: { type: Number, optional: true },
+        columnWidth: { type: Number, optional: true },
+        nameWidth: { type: Number, optional: true },
+        overscan: { type: Number, optional: true },
+    };
+    static defaultProps = {
+        sortOrder: "asc",
+        rowHeight: 37,
+        columnWidth: 72,
+        nameWidth: 240,
+        overscan: 8,
+    };
+
+    setup() {
+        this.viewportRef = useRef("viewport");
+        this.viewport = useState({ top: 0, left: 0, height: 600, width: 1200 });
+        this.frame = null;
+
+        onMounted(() => {
+            const el = this.viewportRef.el;
+            this.resizeObserver = new ResizeObserver(() => this.measure());
+            this.resizeObserver.observe(el);
+            this.measure();
+        });
+        onWillUnmount(() => {
+            this.resizeObserver?.disconnect();
+            if (this.frame) {
+                cancelAnimationFrame(this.frame);
+            }
+        });
+    }
+
+    measure() {
+        const el = this.viewportRef.el;
+        if (!el) {
+            return;
+        }
+        this.viewport.top = el.scrollTop;
+        this.viewport.left = el.scrollLeft;
+        this.viewport.height = el.clientHeight;
+        this.viewport.width = el.clientWidth;
+    }
+
+    onScroll() {
+        // At most one re-render per animation frame while scrolling
+        if (this.frame) {
+            return;
+        }
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.measure();
+        });
+    }
+
+    /**
+     * Visible slice of rows and columns, with the sizes of the spacers
+     * standing in for everything outside it.
+     */
+    get visibleWindow() {
+        const { rows, columns, rowHeight, columnWidth, nameWidth, overscan } = this.props;
+        const { top, left, height, width } = this.viewport;
+
+        const rowStart = Math.max(0, Math.floor(top / rowHeight) - overscan);
+        const rowEnd = Math.min(rows.length, Math.ceil((top + height) / rowHeight) + overscan);
+
+        const scrolledColumns = Math.max(0, left - nameWidth) / columnWidth;
+        const colStart = Math.max(0, Math.floor(scrolledColumns) - 2);
+        const colEnd = Math.min(columns.length, Math.ceil((left + width) / columnWidth) + 2);
+
+        return {
+            rowStart,
+            rowEnd,
+            colStart,
+            colEnd,
+            topPad: rowStart * rowHeight,
+            bottomPad: (rows.length - rowEnd) * rowHeight,
+            leftPad: colStart * columnWidth,
+            rightPad: (columns.length - colEnd) * columnWidth,
+        };
+    }
+
+    get tableStyle() {
+        const width = this.props.nameWidth + this.props.columns.length * this.props.columnWidth;
+        return `table-layout: fixed; width: ${width}px; border-collapse: separate; border-spacing: 0;`;
+    }
+
+    get visibleColumns() {
+        const { colStart, colEnd } = this.visibleWindow;
+        const visible = [];
+        for (let index = colStart; index < colEnd; index++) {
+            visible.push({ index, column: this.props.columns[index] });
+        }
+        return visible;
+    }
+
+    get visibleRows() {
+        const { rowStart, rowEnd } = this.visibleWindow;
+        return this.props.rows.slice(rowStart, rowEnd);
+    }
+
+    get spanCount() {
+        // Product column + visible columns + the two horizontal spacers
+        return 1 + this.visibleColumns.length + 2;
+    }
+
+    cellTitle(row, cell) {
+        return this.props.getCellTitle ? this.props.getCellTitle(cell) : cellTooltip(row.fleet_capacity, cell);
+    }
+
+    isClickable(cell) {
+        return this.props.isCellClickable ? this.props.isCellClickable(cell) : false;
+    }
+
+    onCellClick(row, cell, column) {
+        if (this.props.onCellClick && this.isClickable(cell)) {
+            this.props.onCellClick(row, cell, column);
+        }
+    }
+}
@@ -6,6 +6,7 @@ import { registry } from "@web/core/registry";
 import { Dialog } from "@web/core/dialog/dialog";
 import { jsonrpc } from "@web/core/network/rpc";
 import { _t } from "@web/core/l10n/translation";
+import { applyAvailabilityDeltas, cellTooltip, useAvailabilityDeltas } from "./availability_bus";
 
 /**
  * Booking Availability Wizard
@@ -43,24 +44,59 @@ export class BookingAvailabilityWizard extends Component {
             selectedWarehouseId: this.props.warehouseId || null,
         });
 
+        // Week grid as returned by the server, before any day expansion
+        this.weekGrid = null;
+
         onWillStart(async () => {
-            await this.loadWarehouses();
-            await this.loadGrid();
+            await this.bootstrap();
         });
+
+        useAvailabilityDeltas((payload) => this.onAvailabilityDelta(payload));
     }
 
-    async loadWarehouses() {
+    onAvailabilityDelta(payload) {
+        if (this.state.viewMode === "day") {
+            if (applyAvailabilityDeltas(this.weekGrid, payload)) {
+                this.state.grid = this.expandToDays(this.weekGrid);
+            }
+        } else {
+            applyAvailabilityDeltas(this.state.grid, payload);
+        }
+    }
+
+    /**
+     * Load warehouses and the first grid in one request.
+     */
+    async bootstrap() {
+        this.state.loading = true;
+        this.state.error = null;
         try {
-            const result = await jsonrpc('/tlrm/warehouses', {
+            const result = await jsonrpc("/tlrm/availability_bootstrap", {
                 company_id: this.props.companyId || null,
+                warehouse_id: this.state.selectedWarehouseId,
+                date_start: this.startDateString,
+                week_count: 12,
+                product_ids: this.props.bookingLines.map(l => l.product_id),
+                needed_by_product: this.neededByProduct,
             });
             this.state.warehouses = result.warehouses || [];
+            this.state.selectedWarehouseId = result.grid?.meta?.warehouse_id || null;
+            this.weekGrid = result.grid;
+            this.state.grid = result.grid;
         } catch (error) {
-            // Failed to load warehouses - continue with empty list
-            this.state.warehouses = [];
+            this.state.error = (error && error.message) ? error.message : String(error);
+        } finally {
+            this.state.loading = false;
         }
     }
 
+    get startDateString() {
+        const startDate = new Date();
+        startDate.setDate(startDate.getDate() + (this.state.weekOffset * 7));
+        const pad = (n) => String(n).padStart(2, '0');
+        return `${startDate.getFullYear()}-${pad(startDate.getMonth() + 1)}-${pad(startDate.getDate())} 00:00:00`;
+    }
+
     async onWarehouseChange(ev) {
         const value = ev.target.value;
         this.state.selectedWarehouseId = value ? parseInt(value, 10) : null;
@@ -93,11 +129,6 @@ export class BookingAvailabilityWizard extends Component {
                 return;
             }
 
-            const startDate = new Date();
-            startDate.setDate(startDate.getDate() + (this.state.weekOffset * 7));
-            const pad = (n) => String(n).padStart(2, '0');
-            const dateStr = `${startDate.getFullYear()}-${pad(startDate.getMonth() + 1)}-${pad(startDate.getDate())} 00:00:00`;
-
             const periodCount = this.state.viewMode === "week" ? 12 : 28;  // 12 weeks or 28 days
 
             const grid = await this.orm.call(
@@ -105,7 +136,7 @@ export class BookingAvailabilityWizard extends Component {
                 "get_availability_grid",
                 [productIds],
                 {
-                    date_start: dateStr,
+                    date_start: this.startDateString,
                     week_count: this.state.viewMode === "week" ? periodCount : Math.ceil(periodCount / 7),
                     warehouse_id: this.state.selectedWarehouseId,
                     company_id: this.props.companyId || null,
@@ -113,6 +144,7 @@ export class BookingAvailabilityWizard extends Component {
                 }
             );
 
+            this.weekGrid = grid;
             // If day view, we need to expand weeks into days
             if (this.state.viewMode === "day") {
                 this.state.grid = this.expandToDays(grid);
@@ -225,6 +257,11 @@ export class BookingAvailabilityWizard extends Component {
         return this.isColumnSelected(colIndex);
     }
 
+    getCellTitle(row, cell) {
+        return cellTooltip(row.fleet_capacity, cell)
+            + " " + _t("(Need: %(needed)s)", { needed: this.neededByProduct[row.product_id] || 0 });
+    }
+
     getCellColor(cell, fleetCapacity, isSelected) {
         const capacity = fleetCapacity || 0;
         const booked = cell.committed || 0;
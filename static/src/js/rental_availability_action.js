@@ -1,13 +1,35 @@
 /** @odoo-module **/
 
-import { Component, onWillStart, useState } from "@odoo/owl";
+import { Component, onWillStart, toRaw, useState } from "@odoo/owl";
 import { useService } from "@web/core/utils/hooks";
+import { useDebounced } from "@web/core/utils/timing";
 import { registry } from "@web/core/registry";
 import { jsonrpc } from "@web/core/network/rpc";
 import { _t } from "@web/core/l10n/translation";
+import { applyAvailabilityDeltas, useAvailabilityDeltas } from "./availability_bus";
+import { TlrmVirtualGrid } from "./availability_virtual_grid";
+import {
+    availabilityCacheKey,
+    getCachedAvailability,
+    putCachedAvailability,
+    weekStartOf,
+} from "./availability_cache";
 
 const actionRegistry = registry.category("actions");
 
+// Rows loaded with the first paint
+const PAGE_SIZE = 100;
+const WEEK_COUNT = 12;
+// Weeks downloaded by the export buttons
+const EXPORT_WEEK_COUNT = 52;
+
+// One collator for all comparisons: much cheaper than String.localeCompare
+const collator = new Intl.Collator(undefined, { sensitivity: "base", numeric: true });
+
+function normalizeSearch(value) {
+    return (value || "").toLowerCase().trim();
+}
+
 export class TlrmAvailabilityAction extends Component {
     setup() {
         this.orm = useService("orm");
@@ -24,71 +46,217 @@ export class TlrmAvailabilityAction extends Component {
         });
 
         onWillStart(async () => {
-            await this.loadWarehouses();
-            await this.loadGrid();
+            await this.bootstrap();
+        });
+
+        // Bookings changed elsewhere: patch the affected cells in place
+        useAvailabilityDeltas((payload) => applyAvailabilityDeltas(this.state.grid, payload));
+
+        // Filtering waits for a pause in typing
+        this.debouncedSearch = useDebounced((query) => {
+            this.state.searchQuery = query;
+        }, 250);
+
+        // Memoized row views, see the rows getter
+        this.sortedCache = null;
+        this.rowsCache = null;
+
+        // Incremented by every load so late responses of older loads are dropped
+        this.loadSeq = 0;
+    }
+
+    cacheKey(scope, warehouseId) {
+        return availabilityCacheKey({
+            scope,
+            warehouseId,
+            weekStart: weekStartOf(this.startDate),
+            weekCount: WEEK_COUNT,
+            limit: PAGE_SIZE,
         });
     }
 
-    async loadWarehouses() {
+    /**
+     * Load warehouses, preferences and the first page of the grid in one request.
+     *
+     * A cached bootstrap is rendered at once and revalidated in the background.
+     */
+    async bootstrap() {
+        const seq = ++this.loadSeq;
+        const key = this.cacheKey("bootstrap", null);
+        const cached = await getCachedAvailability(key);
+        if (cached) {
+            this.applyBootstrap(cached);
+            this.state.loading = false;
+            this.revalidate(seq, cached.grid, async () => {
+                const result = await this.fetchBootstrap();
+                if (seq === this.loadSeq) {
+                    this.applyBootstrap(result);
+                    putCachedAvailability(key, result);
+                }
+            });
+            return;
+        }
+
+        this.state.loading = true;
+        this.state.error = null;
         try {
-            const result = await jsonrpc('/tlrm/warehouses', {});
-            this.state.warehouses = result.warehouses || [];
+            const result = await this.fetchBootstrap();
+            this.applyBootstrap(result);
+            putCachedAvailability(key, result);
         } catch (error) {
-            // Failed to load warehouses - continue with empty list
-            this.state.warehouses = [];
+            this.state.error = error && error.message ? error.message : String(error);
+        } finally {
+            this.state.loading = false;
         }
     }
 
+    fetchBootstrap() {
+        return jsonrpc("/tlrm/availability_bootstrap", {
+            date_start: this.startDateString,
+            week_count: WEEK_COUNT,
+            limit: PAGE_SIZE,
+        });
+    }
+
+    applyBootstrap(result) {
+        const preferences = result.preferences || {};
+        this.state.warehouses = result.warehouses || [];
+        this.state.selectedWarehouseId = result.grid?.meta?.warehouse_id || null;
+        this.state.sortOrder = preferences.sort_order === "desc" ? "desc" : "asc";
+        this.state.grid = result.grid;
+    }
+
+    /**
+     * Refetch in the background when the server's change token differs from
+     * the one the cached grid was built with. Failures keep the cached grid.
+     */
+    async revalidate(seq, grid, refetch) {
+        try {
+            const { change_token } = await jsonrpc("/tlrm/availability_change_token", {
+                warehouse_id: grid?.meta?.warehouse_id || null,
+                date_start: grid?.meta?.date_start || null,
+            });
+            if (seq !== this.loadSeq || (change_token && change_token === grid?.meta?.change_token)) {
+                return;
+            }
+            await refetch();
+        } catch {
+            // Keep showing the cached grid
+        }
+    }
+
+    savePreferences(preferences) {
+        // Best effort: a lost preference must not break the screen
+        jsonrpc("/tlrm/preferences", { preferences }).catch(() => {});
+    }
+
     async onWarehouseChange(ev) {
         const value = ev.target.value;
         this.state.selectedWarehouseId = value ? parseInt(value, 10) : null;
+        this.savePreferences({ warehouse_id: this.state.selectedWarehouseId });
         await this.loadGrid();
     }
 
-    async loadGrid() {
-        this.state.loading = true;
-        this.state.error = null;
-        try {
-            // Include all products for now, limit to 100
-            const productDomain = [];
-            const products = await this.orm.searchRead(
-                "product.product",
-                productDomain,
-                ["id"],
-                { limit: 100 }
-            );
-            const productIds = products.map((p) => p.id);
-
-            if (productIds.length === 0) {
-                this.state.grid = { columns: [], rows: [] };
-                this.state.loading = false;
-                return;
-            }
+    /**
+     * Download the availability of all products from the current week on,
+     * with the current warehouse filter. The server streams the file.
+     */
+    exportAvailability(format) {
+        const params = new URLSearchParams({
+            date_start: this.startDateString,
+            week_count: EXPORT_WEEK_COUNT,
+            export_format: format,
+        });
+        if (this.state.selectedWarehouseId) {
+            params.set("warehouse_id", this.state.selectedWarehouseId);
+        }
+        this.action.doAction({
+            type: "ir.actions.act_url",
+            url: `/tlrm/availability_export?${params}`,
+            target: "download",
+        });
+    }
 
-            // Calculate start date based on week offset (Odoo format: YYYY-MM-DD HH:MM:SS)
-            const startDate = new Date();
-            startDate.setDate(startDate.getDate() + (this.state.weekOffset * 7));
-            const pad = (n) => String(n).padStart(2, '0');
-            const dateStr = `${startDate.getFullYear()}-${pad(startDate.getMonth() + 1)}-${pad(startDate.getDate())} ${pad(startDate.getHours())}:${pad(startDate.getMinutes())}:${pad(startDate.getSeconds())}`;
-
-            const grid = await this.orm.call(
-                "tl.rental.booking.line",
-                "get_availability_grid",
-                [productIds],
-                {
-                    date_start: dateStr,
-                    week_count: 12,
-                    warehouse_id: this.state.selectedWarehouseId,
-                    needed_by_product: {},
+    get startDate() {
+        const startDate = new Date();
+        startDate.setDate(startDate.getDate() + (this.state.weekOffset * 7));
+        return startDate;
+    }
+
+    /**
+     * Start of the displayed period in Odoo format (YYYY-MM-DD HH:MM:SS),
+     * based on the week offset.
+     */
+    get startDateString() {
+        const startDate = this.startDate;
+        const pad = (n) => String(n).padStart(2, '0');
+        return `${startDate.getFullYear()}-${pad(startDate.getMonth() + 1)}-${pad(startDate.getDate())} ${pad(startDate.getHours())}:${pad(startDate.getMinutes())}:${pad(startDate.getSeconds())}`;
+    }
+
+    /**
+     * @param {string} [etag] version of the grid the caller already has
+     * @returns {Promise<Object|null>} the grid, or null when ``etag`` is still current
+     */
+    async fetchGrid(etag = null) {
+        const grid = await jsonrpc("/tlrm/availability_grid/global", {
+            date_start: this.startDateString,
+            week_count: WEEK_COUNT,
+            warehouse_id: this.state.selectedWarehouseId,
+            limit: PAGE_SIZE,
+            if_none_match: etag,
+        });
+        return grid.not_modified ? null : grid;
+    }
+
+    /**
+     * Show the grid of the selected warehouse and week window, from cache
+     * when possible.
+     *
+     * @param {Object} [options]
+     * @param {boolean} [options.showLoading=true] show the spinner on a cache miss
+     */
+    async loadGrid({ showLoading = true } = {}) {
+        const seq = ++this.loadSeq;
+        const key = this.cacheKey("global", this.state.selectedWarehouseId);
+        const cached = await getCachedAvailability(key);
+        if (seq !== this.loadSeq) {
+            return;
+        }
+        this.state.error = null;
+        if (cached) {
+            this.state.grid = cached.grid;
+            this.state.loading = false;
+            // One conditional request: the server answers "not modified"
+            // when the cached version is still current
+            this.fetchGrid(cached.grid?.meta?.etag).then((grid) => {
+                if (grid && seq === this.loadSeq) {
+                    this.state.grid = grid;
+                    putCachedAvailability(key, { grid });
                 }
-            );
+            }).catch(() => {
+                // Keep showing the cached grid
+            });
+            return;
+        }
 
-            this.state.grid = grid;
+        if (showLoading) {
+            this.state.loading = true;
+        }
+        try {
+            const grid = await this.fetchGrid();
+            if (seq === this.loadSeq) {
+                this.state.grid = grid;
+                putCachedAvailability(key, { grid });
+            }
         } catch (error) {
             // Grid load failed
-            this.state.error = error && error.message ? error.message : String(error);
+            if (seq === this.loadSeq) {
+                this.state.error = error && error.message ? error.message : String(error);
+            }
         } finally {
-            this.state.loading = false;
+            if (seq === this.loadSeq) {
+                this.state.loading = false;
+            }
         }
     }
 
@@ -135,20 +303,21 @@ export class TlrmAvailabilityAction extends Component {
     }
 
     onSearchInput(ev) {
-        this.state.searchQuery = ev.target.value;
+        this.debouncedSearch(ev.target.value);
     }
 
     toggleSort() {
         this.state.sortOrder = this.state.sortOrder === "asc" ? "desc" : "asc";
+        this.savePreferences({ sort_order: this.state.sortOrder });
     }
 
     async previousWeeks() {
-        this.state.weekOffset -= 12;
+        this.state.weekOffset -= WEEK_COUNT;
         await this.reloadGrid();
     }
 
     async nextWeeks() {
-        this.state.weekOffset += 12;
+        this.state.weekOffset += WEEK_COUNT;
         await this.reloadGrid();
     }
 
@@ -159,32 +328,7 @@ export class TlrmAvailabilityAction extends Component {
 
     async reloadGrid() {
         // Reload grid without showing full loading state
-        try {
-            const productIds = (this.state.grid?.rows || []).map(r => r.product_id);
-            if (productIds.length === 0) {
-                return;
-            }
-            
-            const startDate = new Date();
-            startDate.setDate(startDate.getDate() + (this.state.weekOffset * 7));
-            const pad = (n) => String(n).padStart(2, '0');
-            const dateStr = `${startDate.getFullYear()}-${pad(startDate.getMonth() + 1)}-${pad(startDate.getDate())} ${pad(startDate.getHours())}:${pad(startDate.getMinutes())}:${pad(startDate.getSeconds())}`;
-
-            const grid = await this.orm.call(
-                "tl.rental.booking.line",
-                "get_availability_grid",
-                [productIds],
-                {
-                    date_start: dateStr,
-                    week_count: 12,
-                    warehouse_id: this.state.selectedWarehouseId,
-                    needed_by_product: {},
-                }
-            );
-            this.state.grid = grid;
-        } catch (error) {
-            // Grid reload failed
-        }
+        await this.loadGrid({ showLoading: false });
     }
 
     get selectedWarehouseName() {
@@ -199,33 +343,62 @@ export class TlrmAvailabilityAction extends Component {
         return (this.state.grid && this.state.grid.columns) || [];
     }
 
+    /**
+     * Rows of the grid sorted by name, with their search keys, computed once
+     * per loaded grid. Bus deltas patch cells in place and never change
+     * names, so the order stays valid until the next load.
+     */
+    get sortedEntries() {
+        const rows = (this.state.grid && this.state.grid.rows) || [];
+        const rawRows = toRaw(rows);
+        if (this.sortedCache && this.sortedCache.source === rawRows && this.sortedCache.length === rawRows.length) {
+            return this.sortedCache.entries;
+        }
+        const entries = rows.map((row) => ({
+            row,
+            sortKey: row.display_name || "",
+            searchKey: `${row.display_name || ""}\u0000${row.default_code || ""}`.toLowerCase(),
+        }));
+        entries.sort((a, b) => collator.compare(a.sortKey, b.sortKey));
+        this.sortedCache = { source: rawRows, length: rawRows.length, entries };
+        return entries;
+    }
+
     get rows() {
-        let rows = (this.state.grid && this.state.grid.rows) || [];
-        
-        // Filter by search query
-        const query = (this.state.searchQuery || "").toLowerCase().trim();
-        if (query) {
-            rows = rows.filter((row) => {
-                const name = (row.display_name || "").toLowerCase();
-                const code = (row.default_code || "").toLowerCase();
-                return name.includes(query) || code.includes(query);
-            });
+        const entries = this.sortedEntries;
+        const query = normalizeSearch(this.state.searchQuery);
+        const sortOrder = this.state.sortOrder;
+        const cache = this.rowsCache;
+        if (cache && cache.entries === entries && cache.query === query && cache.sortOrder === sortOrder) {
+            return cache.rows;
         }
-        
-        // Sort by product name
-        rows = [...rows].sort((a, b) => {
-            const nameA = (a.display_name || "").toLowerCase();
-            const nameB = (b.display_name || "").toLowerCase();
-            if (this.state.sortOrder === "asc") {
-                return nameA.localeCompare(nameB);
-            } else {
-                return nameB.localeCompare(nameA);
-            }
-        });
-        
+
+        // Narrowing a query only needs to look at the previous matches
+        let candidates = entries;
+        if (cache && cache.entries === entries && query && cache.query && query.startsWith(cache.query)) {
+            candidates = cache.matches;
+        }
+        const matches = query ? candidates.filter((entry) => entry.searchKey.includes(query)) : entries;
+        const rows = matches.map((entry) => entry.row);
+        if (sortOrder === "desc") {
+            rows.reverse();
+        }
+
+        this.rowsCache = { entries, query, sortOrder, matches, rows };
         return rows;
     }
 
+    getCellTitle(cell) {
+        let title = "No commitments";
+        if (cell.committed > 0) {
+            title = (cell.committed === 1 ? "1 unit committed" : cell.committed + " units committed") + " - Click to view";
+        }
+        if (cell.forecast) {
+            title += "\nForecast demand: " + cell.forecast;
+        }
+        return title;
+    }
+
     get sortIcon() {
         return this.state.sortOrder === "asc" ? "↑" : "↓";
     }
@@ -276,6 +449,7 @@ export class TlrmAvailabilityAction extends Component {
 }
 
 TlrmAvailabilityAction.template = "tl_rental_manager.TlrmAvailabilityAction";
+TlrmAvailabilityAction.components = { TlrmVirtualGrid };
 TlrmAvailabilityAction.props = { "*": true };
 
 actionRegistry.add("tlrm_availability_global", TlrmAvailabilityAction);
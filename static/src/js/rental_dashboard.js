@@ -1,8 +1,10 @@
 /** @odoo-module **/
 
-import { Component, onWillStart, useState } from "@odoo/owl";
+import { Component, onWillStart, onWillUnmount, useState } from "@odoo/owl";
 import { useService } from "@web/core/utils/hooks";
 import { registry } from "@web/core/registry";
+import { debounce } from "@web/core/utils/timing";
+import { useAvailabilityDeltas } from "./availability_bus";
 
 const actionRegistry = registry.category("actions");
 
@@ -22,6 +24,11 @@ export class TlrmDashboard extends Component {
         onWillStart(async () => {
             await this.loadData();
         });
+
+        // KPIs are aggregates: reload them once a burst of booking changes settles
+        this.debouncedRefresh = debounce(() => this.loadData(), 2000);
+        useAvailabilityDeltas(() => this.debouncedRefresh());
+        onWillUnmount(() => this.debouncedRefresh.cancel());
     }
 
     async loadData() {
@@ -1,7 +1,10 @@
-from odoo.tests.common import TransactionCase, tagged
-from odoo.exceptions import ValidationError
+from odoo.tests.common import TransactionCase, new_test_user, tagged
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import mute_logger
 from odoo import fields
 from datetime import timedelta
+from unittest.mock import patch
+import psycopg2
 
 
 @tagged('post_install', '-at_install')
@@ -515,3 +518,795 @@ class TestRentalAvailability(TransactionCase):
         directions = pickings.mapped('tlrm_direction')
         self.assertIn('out', directions)
         self.assertIn('in', directions)
+
+    def test_23_grid_perf_instrumentation_opt_in(self):
+        """Test that grid timings are only exposed when instrumentation is enabled."""
+        Line = self.env['tl.rental.booking.line']
+        result = Line.get_availability_grid(
+            product_ids=[self.product.id],
+            date_start=fields.Datetime.now(),
+            week_count=2,
+            warehouse_id=self.warehouse.id,
+            company_id=self.company.id,
+        )
+        self.assertNotIn('perf', result['meta'])
+
+        result = Line.with_context(tlrm_perf=True).get_availability_grid(
+            product_ids=[self.product.id],
+            date_start=fields.Datetime.now(),
+            week_count=2,
+            warehouse_id=self.warehouse.id,
+            company_id=self.company.id,
+        )
+        perf = result['meta']['perf']
+        self.assertEqual(perf['row_count'], 1)
+        for phase in ('weeks', 'capacity', 'committed', 'incoming', 'rows', 'serialization'):
+            self.assertIn(phase, perf['phases'])
+
+    def test_24_slow_calls_are_profiled_when_sampled(self):
+        """Test that sampled calls above the threshold leave a profile attachment."""
+        Param = self.env['ir.config_parameter'].sudo()
+        Param.set_param('tl_rental_manager.profile_sample_rate', '1')
+        Param.set_param('tl_rental_manager.profile_threshold_ms', '0.000001')
+        Attachment = self.env['ir.attachment'].sudo()
+        domain = [('res_model', '=', 'tl.rental.perf.stat'), ('name', '=like', 'tlrm_profile_%')]
+        before = Attachment.search_count(domain)
+
+        self.env['tl.rental.booking'].get_dashboard_data()
+
+        self.assertEqual(Attachment.search_count(domain), before + 1)
+
+    def test_25_stored_counters_follow_bookings(self):
+        """Test that stored product counters are refreshed and searchable."""
+        product = self.env['product.product'].create({
+            'name': 'Counter Product',
+            'type': 'consu',
+        })
+        self.env['stock.quant'].create({
+            'product_id': product.id,
+            'location_id': self.warehouse.lot_stock_id.id,
+            'quantity': 10.0,
+        })
+        template = product.product_tmpl_id
+        self.env.cr.precommit.run()
+        self.assertEqual(template.tlrm_available_units, 10)
+        self.assertEqual(template.tlrm_status, 'available')
+
+        date_start = fields.Datetime.now() - timedelta(hours=1)
+        booking = self._create_booking(
+            product, 4, date_start, date_start + timedelta(days=5), state='planned'
+        )
+        self.env.cr.precommit.run()
+        template.invalidate_recordset()
+        self.assertEqual(template.tlrm_planned_units, 4)
+        self.assertEqual(template.tlrm_available_units, 6)
+        self.assertEqual(template.tlrm_status, 'planned')
+        self.assertIn(
+            template,
+            self.env['product.template'].search([('tlrm_status', '=', 'planned')]),
+        )
+
+        booking.action_cancel()
+        self.env.cr.precommit.run()
+        template.invalidate_recordset()
+        self.assertEqual(template.tlrm_planned_units, 0)
+        self.assertEqual(template.tlrm_status, 'available')
+
+    def test_26_counters_are_time_aware(self):
+        """Test that product counters only count bookings within the window."""
+        date_start = fields.Datetime.now() + timedelta(days=200)
+        date_end = date_start + timedelta(days=5)
+        self._create_booking(self.product, 7, date_start, date_end, state='planned')
+        template = self.product.product_tmpl_id
+
+        today_counts = template.get_tlrm_counts()[template.id]
+        self.assertEqual(today_counts['tlrm_planned_units'], 0)
+
+        window_counts = template.get_tlrm_counts(
+            date_from=date_start, date_to=date_end,
+        )[template.id]
+        self.assertEqual(window_counts['tlrm_planned_units'], 7)
+        self.assertEqual(window_counts['tlrm_available_units'], 13)
+
+        instant = template.with_context(
+            tlrm_date_from=fields.Datetime.to_string(date_start + timedelta(days=1)),
+        ).get_tlrm_counts()[template.id]
+        self.assertEqual(instant['tlrm_planned_units'], 7)
+
+    def test_27_database_capacity_guard(self):
+        """Test that the database guard rejects overbooking that bypasses the ORM."""
+        date_start = fields.Datetime.now() + timedelta(days=210)
+        date_end = date_start + timedelta(days=5)
+        booking = self._create_booking(self.product, 15, date_start, date_end, state='planned')
+        self._create_booking(self.product, 5, date_start, date_end, state='planned')
+        self.env.flush_all()
+
+        self.env['tl.rental.capacity.guard'].action_enable()
+        with self.assertRaises(psycopg2.errors.CheckViolation), mute_logger('odoo.sql_db'), \
+                self.env.cr.savepoint():
+            self.env.cr.execute(
+                "UPDATE tl_rental_booking_line SET quantity = 16 WHERE id = %s",
+                [booking.line_ids.id],
+            )
+
+        # Within capacity is still allowed
+        self.env.cr.execute(
+            "UPDATE tl_rental_booking_line SET quantity = 14 WHERE id = %s",
+            [booking.line_ids.id],
+        )
+        self.env['tl.rental.capacity.guard'].action_disable()
+
+    def test_28_grid_engine_cell_status(self):
+        """Test the status and booking flag the grid engine gives each cell."""
+        line_model = self.env['tl.rental.booking.line']
+        week_start = line_model._compute_weeks(fields.Datetime.now() + timedelta(days=240), 1)[0]['start_dt']
+        date_start = week_start + timedelta(days=1)
+        self._create_booking(self.product, 12, date_start, date_start + timedelta(days=3), state='planned')
+        result = line_model.get_availability_grid(
+            product_ids=[self.product.id],
+            date_start=date_start,
+            week_count=3,
+            warehouse_id=self.warehouse.id,
+            company_id=self.company.id,
+            needed_by_product={self.product.id: 10},
+        )
+
+        cells = result['rows'][0]['cells']
+        for cell in cells:
+            self.assertIsInstance(cell['available'], float)
+        self.assertEqual(
+            [(cell['available'], cell['status'], cell['booking_ok']) for cell in cells],
+            [(8.0, 'partial', False), (20.0, 'free', True), (20.0, 'free', True)],
+        )
+
+        result = line_model.get_availability_grid(
+            product_ids=[self.product.id],
+            date_start=date_start,
+            week_count=1,
+            warehouse_id=self.warehouse.id,
+            company_id=self.company.id,
+        )
+        cell = result['rows'][0]['cells'][0]
+        self.assertEqual((cell['status'], cell['booking_ok']), ('free', None))
+
+    def test_29_booking_changes_push_net_deltas(self):
+        """Test that booking changes publish one net delta per company on the bus."""
+        date_start = fields.Datetime.now() + timedelta(days=270)
+        date_end = date_start + timedelta(days=4)
+        booking = self._create_booking(self.product, 5, date_start, date_end, state='planned')
+        self.env.cr.precommit.run()
+
+        Bus = type(self.env['bus.bus'])
+        with patch.object(Bus, '_sendone', autospec=True) as sendone:
+            booking.line_ids.quantity = 6
+            booking.line_ids.quantity = 8
+            self.env.cr.precommit.run()
+
+        self.assertEqual(sendone.call_count, 1)
+        _bus, channel, notification_type, payload = sendone.call_args.args
+        self.assertEqual(channel, (self.company, 'tlrm_availability'))
+        self.assertEqual(notification_type, 'tlrm_availability_delta')
+        self.assertEqual(payload['company_id'], self.company.id)
+        self.assertEqual(payload['deltas'], [[
+            'committed', self.product.id, self.warehouse.id,
+            fields.Datetime.to_string(booking.date_start),
+            fields.Datetime.to_string(booking.date_end),
+            3.0,
+        ]])
+
+    def test_30_user_preferences_roundtrip(self):
+        """Test that rental screen preferences keep only known keys."""
+        user = self.env.user
+        prefs = user._tlrm_set_preferences({'warehouse_id': self.warehouse.id, 'bogus': 1})
+        self.assertEqual(prefs, {'warehouse_id': self.warehouse.id})
+
+        user._tlrm_set_preferences({'sort_order': 'desc', 'warehouse_id': None})
+        self.assertEqual(user._tlrm_get_preferences(), {'sort_order': 'desc'})
+
+    def test_31_change_token_follows_booking_changes(self):
+        """Test that the availability change token changes only with the data."""
+        Line = self.env['tl.rental.booking.line']
+        date_start = fields.Datetime.now() + timedelta(days=300)
+        booking = self._create_booking(self.product, 2, date_start, date_start + timedelta(days=2), state='planned')
+
+        date_from = Line._compute_weeks(date_start, 1)[0]['start_dt']
+        token = Line._get_availability_change_token(self.company, self.warehouse.id, date_from)
+        self.assertEqual(Line._get_availability_change_token(self.company, self.warehouse.id, date_from), token)
+
+        grid = Line.get_availability_grid(
+            [self.product.id], date_start, week_count=2,
+            warehouse_id=self.warehouse.id, company_id=self.company.id,
+        )
+        self.assertEqual(grid['meta']['change_token'], token)
+
+        booking.line_ids.unlink()
+        self.assertNotEqual(Line._get_availability_change_token(self.company, self.warehouse.id, date_from), token)
+
+    def test_32_etag_matching(self):
+        """Test If-None-Match parsing used by the conditional rental routes."""
+        from odoo.addons.tl_rental_manager.controllers.controllers import _etag_matches, _make_etag
+
+        etag = _make_etag('token', 1, None)
+        self.assertEqual(etag, _make_etag('token', 1, None))
+        self.assertNotEqual(etag, _make_etag('token', 2, None))
+        self.assertTrue(_etag_matches(etag, etag))
+        self.assertTrue(_etag_matches(etag, 'W/"other", W/%s' % etag))
+        self.assertTrue(_etag_matches(etag, '*'))
+        self.assertFalse(_etag_matches(etag, None))
+        self.assertFalse(_etag_matches(etag, '"other"'))
+
+    def test_33_identical_grid_requests_are_coalesced(self):
+        """Test that identical grid requests reuse one computation until data changes."""
+        from odoo.addons.tl_rental_manager.models.rental_grid_flight import grid_flight
+
+        grid_flight.clear()
+        Line = self.env['tl.rental.booking.line']
+        date_start = fields.Datetime.now() + timedelta(days=330)
+        booking = self._create_booking(self.product, 2, date_start, date_start + timedelta(days=2), state='planned')
+        args = ([self.product.id], date_start)
+        kwargs = {'week_count': 2, 'warehouse_id': self.warehouse.id, 'company_id': self.company.id}
+
+        compute = type(Line)._compute_availability_grid
+        with patch.object(type(Line), '_compute_availability_grid', autospec=True, side_effect=compute) as mocked:
+            first = Line.get_availability_grid(*args, **kwargs)
+            second = Line.get_availability_grid(*args, **kwargs)
+            self.assertEqual(mocked.call_count, 1)
+            self.assertEqual(first, second)
+
+            second['meta']['mode'] = 'global'
+            self.assertNotIn('mode', first['meta'])
+
+            booking.line_ids.quantity = 3
+            third = Line.get_availability_grid(*args, **kwargs)
+            self.assertEqual(mocked.call_count, 2)
+            self.assertEqual(third['rows'][0]['cells'][0]['committed'], 3.0)
+
+    def test_34_warm_up_snapshots_serve_grids(self):
+        """Test that warm-up snapshots serve identical grids and are refreshed only on change."""
+        from odoo.addons.tl_rental_manager.models.rental_grid_flight import grid_flight
+
+        Line = self.env['tl.rental.booking.line']
+        Snapshot = self.env['tl.rental.grid.snapshot']
+        now = fields.Datetime.now()
+        self._create_booking(self.product, 4, now + timedelta(days=7), now + timedelta(days=9), state='planned')
+        self.env['ir.config_parameter'].sudo().set_param('tl_rental_manager.warmup_weeks', '4')
+
+        Snapshot._cron_warm_up(auto_commit=False)
+        snapshot = Snapshot.search([
+            ('company_id', '=', self.company.id),
+            ('warehouse_id', '=', self.warehouse.id),
+            ('lang', '=', self.env.lang or 'en_US'),
+        ])
+        self.assertEqual(len(snapshot), 1)
+        self.assertNotIn('rows', snapshot.payload)
+        self.assertIn(self.product, snapshot.row_ids.product_id)
+        computed_at = snapshot.computed_at
+
+        grid_flight.clear()
+        kwargs = {'week_count': 3, 'warehouse_id': self.warehouse.id, 'company_id': self.company.id}
+        served = Line.get_availability_grid([self.product.id], now, **kwargs)
+        self.assertTrue(served['meta'].get('snapshot'))
+
+        weeks = Line._compute_weeks(now, 3)
+        computed = Line._compute_availability_grid(
+            [self.product.id], weeks, 3, self.warehouse.id, self.company, {},
+            served['meta']['change_token'], self.env['tl.rental.perf.stat']._new_recorder(),
+        )
+        self.assertEqual(served['rows'], computed['rows'])
+        self.assertEqual(served['columns'], computed['columns'])
+
+        Snapshot._cron_warm_up(auto_commit=False)
+        self.assertEqual(snapshot.computed_at, computed_at)
+
+        # A renamed product is not served from the snapshot
+        self.product.name = 'Renamed Rental Product'
+        grid_flight.clear()
+        served = Line.get_availability_grid([self.product.id], now, **kwargs)
+        self.assertFalse(served['meta'].get('snapshot'))
+        self.assertEqual(served['rows'][0]['display_name'], self.product.display_name)
+
+    def test_35_availability_export_matches_grid(self):
+        """Test that the chunked availability export yields the grid cells."""
+        date_start = fields.Datetime.now() + timedelta(days=300)
+        self._create_booking(self.product, 7, date_start, date_start + timedelta(days=2), state='planned')
+        other = self.env['product.product'].create({'name': 'Test Rental Product 2', 'type': 'consu'})
+        products = self.product | other
+        line_model = self.env['tl.rental.booking.line']
+
+        rows = list(line_model._iter_availability_export(
+            [('id', 'in', products.ids)], date_start, week_count=30,
+            warehouse_id=self.warehouse.id, company=self.company, chunk_size=1,
+        ))
+        self.assertEqual(len(rows), 2 * 30)
+        self.assertEqual(len(rows[0]), len(line_model._get_availability_export_header()))
+
+        grid = line_model.get_availability_grid(
+            products.ids, date_start, week_count=3,
+            warehouse_id=self.warehouse.id, company_id=self.company.id,
+        )
+        exported = {(row[1], row[4]): row[6:] for row in rows}
+        for grid_row in grid['rows']:
+            for cell in grid_row['cells']:
+                self.assertEqual(
+                    exported[(grid_row['display_name'], cell['column_key'])],
+                    [cell['committed'], cell['incoming'], cell['available'], cell['status']],
+                )
+        self.assertEqual(exported[(self.product.display_name, grid['columns'][0]['key'])][0], 7.0)
+
+    def test_36_bulk_import_rejects_invalid_bookings(self):
+        """Test that the bulk importer creates valid bookings and reports rejected rows."""
+        import base64
+
+        start = fields.Datetime.to_string(fields.Datetime.now() + timedelta(days=330))
+        end = fields.Datetime.to_string(fields.Datetime.now() + timedelta(days=333))
+        header = 'booking_ref,project,warehouse,date_start,date_end,state,product,quantity\n'
+        rows = [
+            f'A,{self.project.name},{self.warehouse.code},{start},{end},planned,TEST-RENTAL,8',
+            f'A,{self.project.name},{self.warehouse.code},{start},{end},planned,TEST-RENTAL,4',
+            f'B,{self.project.name},{self.warehouse.code},{start},{end},planned,TEST-RENTAL,9',
+            f'C,{self.project.name},{self.warehouse.code},{start},{end},draft,UNKNOWN,1',
+        ]
+        wizard = self.env['tl.rental.booking.import'].create({
+            'file': base64.b64encode((header + '\n'.join(rows)).encode()),
+            'filename': 'season.csv',
+            'chunk_size': 2,
+        })
+        wizard.action_import()
+
+        self.assertEqual((wizard.booking_count, wizard.line_count, wizard.rejected_count), (1, 2, 2))
+        booking = self.env['tl.rental.booking.line'].search([
+            ('product_id', '=', self.product.id), ('date_start', '=', start),
+        ]).booking_id
+        self.assertEqual(len(booking), 1)
+        self.assertEqual(booking.state, 'planned')
+        self.assertTrue(booking.name.startswith('TLRM/'))
+        rejected = base64.b64decode(wizard.result_file).decode()
+        self.assertIn('Not enough availability', rejected)
+        self.assertIn('UNKNOWN', rejected)
+
+    def test_37_consolidated_warehouse_uses_wave_pickings(self):
+        """Test that bookings of the same day share wave pickings with traceable moves."""
+        self.warehouse.tlrm_consolidate_pickings = True
+        date_start = fields.Datetime.now() + timedelta(days=360)
+        date_end = date_start + timedelta(days=3)
+        first = self._create_booking(self.product, 2, date_start, date_end, state='planned')
+        second = self._create_booking(self.product, 3, date_start, date_end, state='planned')
+        (first | second).action_reserve()
+
+        moves = self.env['stock.move'].search([('tlrm_booking_id', 'in', (first | second).ids)])
+        pickings = moves.picking_id
+        self.assertEqual(len(pickings), 2)
+        self.assertTrue(all(pickings.mapped('tlrm_wave')))
+        self.assertEqual(sorted(pickings.mapped('tlrm_direction')), ['in', 'out'])
+        for picking in pickings:
+            self.assertEqual(picking.tlrm_booking_ids, first | second)
+            self.assertEqual(sorted(picking.move_ids.mapped('product_uom_qty')), [2.0, 3.0])
+
+        # A later booking of the same day joins the open waves
+        third = self._create_booking(self.product, 1, date_start, date_end, state='reserved')
+        self.assertEqual(
+            self.env['stock.move'].search([('tlrm_booking_id', '=', third.id)]).picking_id, pickings,
+        )
+
+    def test_38_partial_returns_keep_booking_ongoing(self):
+        """Test that a booking is returned only once all its return pickings are done."""
+        date_start = fields.Datetime.now() + timedelta(days=1)
+        date_end = date_start + timedelta(days=4)
+        booking = self._create_booking(self.product, 2, date_start, date_end, state='planned')
+        booking.write({'line_ids': [(0, 0, {
+            'product_id': self.product.id,
+            'quantity': 1,
+            'expected_return_date': date_end + timedelta(days=2),
+        })]})
+        booking.action_reserve()
+
+        pickings = self.env['stock.picking'].search([('tlrm_booking_id', '=', booking.id)])
+        outbound = pickings.filtered(lambda picking: picking.tlrm_direction == 'out')
+        returns = pickings.filtered(lambda picking: picking.tlrm_direction == 'in').sorted('scheduled_date')
+        self.assertEqual(len(returns), 2)
+
+        outbound.button_validate()
+        self.assertEqual(booking.state, 'ongoing')
+
+        returns[0].action_assign()
+        returns[0].button_validate()
+        self.assertEqual(booking.state, 'ongoing')
+
+        returns[1].action_assign()
+        returns[1].button_validate()
+        self.assertEqual(booking.state, 'returned')
+
+    def test_39_bulk_validate_rental_pickings(self):
+        """Test that rental pickings are validated together with their quantities filled."""
+        date_start = fields.Datetime.now() + timedelta(days=2)
+        date_end = date_start + timedelta(days=2)
+        bookings = (
+            self._create_booking(self.product, 2, date_start, date_end, state='reserved')
+            | self._create_booking(self.product, 3, date_start, date_end, state='reserved')
+        )
+        outbound = self.env['stock.picking'].search([
+            ('tlrm_booking_id', 'in', bookings.ids), ('tlrm_direction', '=', 'out'),
+        ])
+        self.assertEqual(len(outbound), 2)
+
+        action = outbound.action_tlrm_bulk_validate()
+        self.assertEqual(action['params']['type'], 'success')
+        self.assertEqual(set(outbound.mapped('state')), {'done'})
+        self.assertEqual(sorted(outbound.move_ids.mapped('quantity')), [2.0, 3.0])
+        self.assertEqual(set(bookings.mapped('state')), {'ongoing'})
+
+    def test_40_cancel_and_reschedule_reserved_pickings(self):
+        """Test that reserved bookings' pickings follow date changes and cancellation."""
+        date_start = fields.Datetime.now() + timedelta(days=20)
+        date_end = date_start + timedelta(days=3)
+        booking = self._create_booking(self.product, 4, date_start, date_end, state='reserved')
+        Picking = self.env['stock.picking']
+        outbound = Picking.search([('tlrm_booking_id', '=', booking.id), ('tlrm_direction', '=', 'out')])
+        self.assertEqual(outbound.move_ids.state, 'assigned')
+
+        new_start = date_start + timedelta(days=7)
+        booking.write({'date_start': new_start, 'date_end': date_end + timedelta(days=7)})
+        self.assertEqual(outbound.move_ids.date, new_start)
+        self.assertEqual(booking.line_ids.expected_return_date, date_end + timedelta(days=7))
+        returns = booking._tlrm_pending_moves('in').picking_id
+        self.assertEqual(len(returns), 1)
+        self.assertEqual(returns.scheduled_date.date(), (date_end + timedelta(days=7)).date())
+
+        booking.action_cancel()
+        self.assertEqual(booking.state, 'cancelled')
+        self.assertFalse(booking._tlrm_pending_moves())
+        self.assertEqual(outbound.state, 'cancel')
+        self.assertFalse(outbound.move_ids.move_line_ids)
+
+    def test_41_archive_closed_bookings(self):
+        """Test that old closed bookings move to the archive tables with their lines."""
+        date_start = fields.Datetime.now() - timedelta(days=500)
+        old = self._create_booking(self.product, 3, date_start, date_start + timedelta(days=5))
+        old.state = 'returned'
+        recent = self._create_booking(self.product, 1, fields.Datetime.now() - timedelta(days=10),
+                                      fields.Datetime.now() - timedelta(days=5))
+        recent.state = 'returned'
+        name = old.name
+
+        archived = self.env['tl.rental.booking.archive']._cron_archive_closed_bookings(auto_commit=False)
+        self.assertEqual(archived, 1)
+        self.assertFalse(old.exists())
+        self.assertTrue(recent.exists())
+
+        archive = self.env['tl.rental.booking.archive'].search([('name', '=', name)])
+        self.assertEqual(archive.state, 'returned')
+        self.assertEqual(archive.project_id, self.project)
+        self.assertEqual(archive.line_ids.product_id, self.product)
+        self.assertEqual(archive.line_ids.quantity, 3.0)
+
+    def test_42_purge_rental_data(self):
+        """Test that the purge counts in dry-run mode and deletes reserved bookings with their pickings."""
+        date_start = fields.Datetime.now() + timedelta(days=30)
+        booking = self._create_booking(self.product, 2, date_start, date_start + timedelta(days=4), state='reserved')
+        pickings = self.env['stock.picking'].search([('tlrm_booking_id', '=', booking.id)])
+        self.assertTrue(pickings)
+        Maintenance = self.env['tl.rental.maintenance']
+        company = self.env.company
+        date_from = date_start - timedelta(days=1)
+
+        counts = Maintenance._purge_rental_data(company=company, date_from=date_from, dry_run=True)
+        self.assertEqual(counts['bookings'], 1)
+        self.assertEqual(counts['booking_lines'], 1)
+        self.assertEqual(counts['pickings'], len(pickings))
+        self.assertTrue(booking.exists())
+
+        with self.assertRaises(UserError):
+            Maintenance._purge_rental_data(company=company, date_from=date_from, reset=True)
+
+        counts = Maintenance._purge_rental_data(company=company, date_from=date_from, auto_commit=False)
+        self.assertEqual(counts['bookings'], 1)
+        self.assertFalse(booking.exists())
+        self.assertFalse(pickings.exists())
+
+    def test_43_utilisation_report(self):
+        """Test that the utilisation view splits booked unit-days per month against the fleet."""
+        date_start = fields.Datetime.to_datetime('2031-03-25 00:00:00')
+        self._create_booking(self.product, 2, date_start, date_start + timedelta(days=11), state='planned')
+        Report = self.env['tl.rental.utilisation.report']
+        Report._refresh()
+
+        groups = Report._read_group(
+            [('product_id', '=', self.product.id), ('period', '>=', '2031-03-01'), ('period', '<', '2031-05-01')],
+            ['period:month'],
+            ['booked_unit_days:sum', 'capacity_unit_days:sum', 'utilisation:avg'],
+        )
+        result = {period.month: (booked, capacity, utilisation) for period, booked, capacity, utilisation in groups}
+        self.assertAlmostEqual(result[3][0], 14.0)
+        self.assertAlmostEqual(result[3][1], 20.0 * 31)
+        self.assertAlmostEqual(result[3][2], 100.0 * 14.0 / 620.0)
+        self.assertAlmostEqual(result[4][0], 8.0)
+        self.assertAlmostEqual(result[4][1], 20.0 * 30)
+
+        by_project = Report._read_group(
+            [('product_id', '=', self.product.id), ('period', '=', '2031-03-01')],
+            ['project_id'], ['booked_unit_days:sum'],
+        )
+        self.assertEqual(dict(by_project)[self.project], 14.0)
+
+        # Ids follow the grouping key, not the row order of a refresh
+        domain = [('product_id', '=', self.product.id), ('period', '=', '2031-04-01')]
+        ids = Report.search(domain).ids
+        self._create_booking(
+            self.product, 1, date_start - timedelta(days=400), date_start - timedelta(days=399), state='planned',
+        )
+        Report._refresh()
+        self.assertEqual(Report.search(domain).ids, ids)
+
+    def test_44_rental_pricing(self):
+        """Test that lines are priced with the cheapest hour/day/week combination."""
+        self.product.product_tmpl_id.write({
+            'tlrm_price_hour': 10.0,
+            'tlrm_price_day': 50.0,
+            'tlrm_price_week': 200.0,
+            'tlrm_min_hours': 4.0,
+        })
+        date_start = fields.Datetime.now() + timedelta(days=60)
+        # 9 days: one week and two days (300) beat 9 days (450) and two weeks (400)
+        booking = self._create_booking(self.product, 3, date_start, date_start + timedelta(days=9))
+        self.assertEqual(booking.line_ids.price_unit, 300.0)
+        self.assertEqual(booking.amount_total, 900.0)
+
+        Line = self.env['tl.rental.booking.line']
+        quote = Line.get_rental_quote([
+            # 2 hours are billed as the 4 hour minimum
+            {'product_id': self.product.id, 'quantity': 1,
+             'date_start': date_start, 'date_end': date_start + timedelta(hours=2)},
+            # 30 hours: two days (100) beat a day and 6 hours (110)
+            {'product_id': self.product.id, 'quantity': 2,
+             'date_start': date_start, 'date_end': date_start + timedelta(hours=30)},
+            {'product_id': False, 'quantity': 1,
+             'date_start': date_start, 'date_end': date_start + timedelta(days=1)},
+        ])
+        self.assertEqual([line['price_unit'] for line in quote['lines']], [40.0, 100.0, 0.0])
+        self.assertEqual((quote['lines'][1]['days'], quote['lines'][1]['hours']), (2, 0))
+        self.assertEqual(quote['amount_total'], 240.0)
+
+        # Price tables are cached, and refreshed when prices change
+        self.product.product_tmpl_id.tlrm_price_day = 20.0
+        self.assertEqual(Line.get_rental_quote([{
+            'product_id': self.product.id, 'quantity': 1,
+            'date_start': date_start, 'date_end': date_start + timedelta(hours=30),
+        }])['amount_total'], 40.0)
+        # A second change in the same transaction starts another version
+        self.product.product_tmpl_id.tlrm_price_day = 30.0
+        self.assertEqual(Line.get_rental_quote([{
+            'product_id': self.product.id, 'quantity': 1,
+            'date_start': date_start, 'date_end': date_start + timedelta(hours=30),
+        }])['amount_total'], 60.0)
+
+    def test_45_demand_forecast_overlay(self):
+        """Test that weekly booking history is forecast and overlaid on the grid."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        ICP.set_param('tl_rental_manager.forecast_history_weeks', 8)
+        ICP.set_param('tl_rental_manager.forecast_horizon_weeks', 4)
+        Line = self.env['tl.rental.booking.line']
+        current_week = Line._compute_weeks(fields.Datetime.now(), 1)[0]['start_dt']
+        for weeks_ago in range(1, 9):
+            date_start = current_week - timedelta(weeks=weeks_ago, days=-1)
+            booking = self._create_booking(self.product, 3, date_start, date_start + timedelta(days=2))
+            booking.state = 'returned'
+
+        Forecast = self.env['tl.rental.demand.forecast']
+        self.assertEqual(Forecast._compute_company_forecasts(self.company), 1)
+        forecasts = Forecast.search([('product_id', '=', self.product.id)])
+        self.assertEqual(len(forecasts), 4)
+        self.assertEqual(forecasts.warehouse_id, self.warehouse)
+        for forecast in forecasts:
+            self.assertAlmostEqual(forecast.forecast_qty, 3.0)
+
+        grid = Line.get_availability_grid([self.product.id], fields.Datetime.now(), 6)
+        cells = grid['rows'][0]['cells']
+        self.assertEqual([cell['forecast'] for cell in cells], [3.0] * 4 + [None] * 2)
+        self.assertFalse(any(cell['forecast_short'] for cell in cells))
+
+    def test_46_allocate_warehouses(self):
+        """Test that lines move or split to the warehouses that have free units."""
+        depot = self.env['stock.warehouse'].create({
+            'name': 'Second Depot',
+            'code': 'TWH2',
+            'company_id': self.company.id,
+        })
+        self.env['stock.quant'].create({
+            'product_id': self.product.id,
+            'location_id': depot.lot_stock_id.id,
+            'quantity': 5.0,
+        })
+        date_start = fields.Datetime.now() + timedelta(days=40)
+        date_end = date_start + timedelta(days=5)
+        self._create_booking(self.product, 18, date_start, date_end, state='planned')
+
+        # 2 units left in the main warehouse, 5 in the depot: the line is split
+        booking = self._create_booking(self.product, 6, date_start, date_end)
+        action = booking.action_allocate_warehouses()
+        self.assertEqual(action['params']['type'], 'success')
+        self.assertEqual(
+            sorted((line.source_warehouse_id.id, line.return_warehouse_id.id, line.quantity)
+                   for line in booking.line_ids),
+            sorted([(depot.id, depot.id, 5.0), (self.warehouse.id, self.warehouse.id, 1.0)]),
+        )
+
+        # With auto-allocation, confirming moves a line that only fits in the depot
+        self.env['ir.config_parameter'].sudo().set_param('tl_rental_manager.auto_allocate_warehouses', '1')
+        booking = self._create_booking(self.product, 4, date_start, date_end, state='planned')
+        self.assertEqual(booking.state, 'planned')
+        self.assertEqual(booking.line_ids.source_warehouse_id, depot)
+        self.assertEqual(booking.line_ids.quantity, 4.0)
+
+    def test_47_client_context_cannot_skip_availability_check(self):
+        """Test that the availability check skip key is ignored outside superuser code."""
+        user = new_test_user(
+            self.env, login='tlrm_rental_user',
+            groups='stock.group_stock_user,tl_rental_manager.tlrm_group_user',
+        )
+        Booking = self.env['tl.rental.booking'].with_user(user).with_context(tlrm_skip_availability_check=True)
+        date_start = fields.Datetime.now() + timedelta(days=70)
+        booking = Booking.create({
+            'project_id': self.project.id,
+            'source_warehouse_id': self.warehouse.id,
+            'date_start': date_start,
+            'date_end': date_start + timedelta(days=2),
+            'line_ids': [(0, 0, {'product_id': self.product.id, 'quantity': 50})],
+        })
+        with self.assertRaises(ValidationError):
+            booking.action_confirm()
+
+    def test_48_fleet_changes_only_follow_rental_stock(self):
+        """Test that only fleet quantity changes mark counters dirty and change the token."""
+        Line = self.env['tl.rental.booking.line']
+        quant = self.env['stock.quant'].search([
+            ('product_id', '=', self.product.id),
+            ('location_id', '=', self.warehouse.lot_stock_id.id),
+        ], limit=1)
+        self.env.cr.precommit.run()
+        token = Line._get_availability_change_token(self.company)
+
+        quant.write({'quantity': quant.quantity})
+        self.env['stock.quant'].create({
+            'product_id': self.product.id,
+            'location_id': self.env.ref('stock.stock_location_customers').id,
+            'quantity': 3.0,
+        })
+        self.assertFalse(self.env.cr.precommit.data.get('tlrm.counters_dirty'))
+        self.assertEqual(Line._get_availability_change_token(self.company), token)
+
+        quant.write({'quantity': quant.quantity + 1})
+        self.assertIn(
+            self.product.product_tmpl_id.id,
+            self.env.cr.precommit.data['tlrm.counters_dirty'][self.company.id],
+        )
+        self.assertNotEqual(Line._get_availability_change_token(self.company), token)
+
+    def test_49_stored_counter_window_uses_company_timezone(self):
+        """Test that stored counters use the company timezone, not the user's."""
+        Template = self.env['product.template']
+        self.env['ir.config_parameter'].sudo().set_param('tl_rental_manager.counter_horizon', 'today')
+        self.company.partner_id.tz = 'Pacific/Kiritimati'
+        company_window = Template._tlrm_horizon_window('Pacific/Kiritimati')
+        user_window = Template._tlrm_horizon_window('Pacific/Pago_Pago')
+        self.assertNotEqual(company_window, user_window)
+
+        Template = Template.with_context(tz='Pacific/Pago_Pago')
+        self.assertEqual(Template._tlrm_stored_counter_window(self.company), company_window)
+        self.assertEqual(Template._tlrm_counter_window(), user_window)
+
+        self.company.partner_id.tz = False
+        self.assertEqual(Template._tlrm_stored_counter_window(self.company), Template._tlrm_horizon_window('UTC'))
+
+    def test_50_grid_reuses_server_change_token(self):
+        """Test that only server code can hand the grid a precomputed change token."""
+        Line = self.env['tl.rental.booking.line']
+        args = ([self.product.id], fields.Datetime.now())
+        kwargs = {'week_count': 2, 'warehouse_id': self.warehouse.id, 'company_id': self.company.id}
+        with self.assertRaises(TypeError):
+            Line.get_availability_grid(*args, change_token='stale', **kwargs)
+
+        token = Line._get_availability_change_token(self.company, self.warehouse.id)
+        with patch.object(type(Line), '_get_availability_change_token', autospec=True) as mocked:
+            grid = Line._get_availability_grid(*args, change_token=token, **kwargs)
+        mocked.assert_not_called()
+        self.assertEqual(grid['meta']['change_token'], token)
+
+    def test_51_change_token_ignores_bookings_before_the_grid(self):
+        """Test that bookings ended before the grid start do not change its token."""
+        Line = self.env['tl.rental.booking.line']
+        date_from = Line._compute_weeks(fields.Datetime.now(), 1)[0]['start_dt']
+        date_start = date_from - timedelta(days=60)
+        booking = self._create_booking(self.product, 2, date_start, date_start + timedelta(days=3))
+
+        token = Line._get_availability_change_token(self.company, self.warehouse.id, date_from)
+        global_token = Line._get_availability_change_token(self.company, self.warehouse.id)
+        booking.write({'date_end': date_start + timedelta(days=2)})
+        self.assertEqual(Line._get_availability_change_token(self.company, self.warehouse.id, date_from), token)
+        self.assertNotEqual(Line._get_availability_change_token(self.company, self.warehouse.id), global_token)
+
+        booking.write({'date_end': date_from + timedelta(days=1)})
+        self.assertNotEqual(Line._get_availability_change_token(self.company, self.warehouse.id, date_from), token)
+
+    def test_52_bulk_import_json_formats(self):
+        """Test that .json files hold an array and .jsonl files one object per line."""
+        import base64
+        import json
+
+        rows = [{
+            'booking_ref': ref, 'project': self.project.name, 'warehouse': self.warehouse.code,
+            'date_start': fields.Datetime.to_string(fields.Datetime.now() + timedelta(days=340)),
+            'date_end': fields.Datetime.to_string(fields.Datetime.now() + timedelta(days=342)),
+            'state': 'draft', 'product': 'TEST-RENTAL', 'quantity': 1,
+        } for ref in ('A', 'B')]
+        Import = self.env['tl.rental.booking.import']
+        for filename, content in [
+            ('season.json', json.dumps(rows)),
+            ('season.jsonl', '\n'.join(json.dumps(row) for row in rows)),
+            ('season.ndjson', '\n'.join(json.dumps(row) for row in rows)),
+        ]:
+            wizard = Import.create({'file': base64.b64encode(content.encode()), 'filename': filename})
+            wizard.action_import()
+            self.assertEqual((wizard.booking_count, wizard.rejected_count), (2, 0), filename)
+
+        wizard = Import.create({
+            'file': base64.b64encode('\n'.join(json.dumps(row) for row in rows).encode()),
+            'filename': 'season.json',
+        })
+        with self.assertRaises(UserError):
+            wizard.action_import()
+
+    def test_53_seasonal_forecast_fit(self):
+        """Test the seasonal forecast on series with a known pattern."""
+        from odoo.addons.tl_rental_manager.models.rental_demand_forecast import fit_seasonal_forecasts
+
+        # Two seasons with a peak in week 10, and a flat series
+        seasonal = [15.0 if week % 52 == 10 else 5.0 for week in range(104)]
+        seasonal_forecast, flat_forecast = fit_seasonal_forecasts([seasonal, [3.0] * 104], 60)
+        self.assertAlmostEqual(seasonal_forecast[10], 15.0)
+        self.assertAlmostEqual(seasonal_forecast[9], 5.0)
+        self.assertEqual(flat_forecast, [3.0] * 60)
+        self.assertEqual(fit_seasonal_forecasts([[0.0] * 4], 2), [[0.0, 0.0]])
+
+    def test_54_grid_etag_follows_products(self):
+        """Test that renaming or archiving a rental product changes the grid ETag."""
+        from odoo.addons.tl_rental_manager.controllers.controllers import TlrmAvailabilityController
+
+        controller = TlrmAvailabilityController()
+        Line = self.env['tl.rental.booking.line']
+        date_start = fields.Datetime.now()
+        date_from = Line._compute_weeks(date_start, 1)[0]['start_dt']
+
+        def etag():
+            token = Line._get_availability_change_token(self.company, self.warehouse.id, date_from)
+            return controller._grid_etag(
+                Line, token, self.company, self.warehouse.id, date_start, 12, 'global', [self.product.id], 1,
+            )
+
+        before = etag()
+        self.assertEqual(etag(), before)
+        self.product.name = 'Renamed Rental Product'
+        renamed = etag()
+        self.assertNotEqual(renamed, before)
+        self.product.default_code = 'TEST-RENTAL-2'
+        self.assertNotEqual(etag(), renamed)
+        recoded = etag()
+        self.product.active = False
+        self.assertNotEqual(etag(), recoded)
+
+    def test_55_new_template_counters_in_every_company(self):
+        """Test that a shared template gets stored counters in every company."""
+        other_company = self.env['res.company'].create({'name': 'Second Rental Company'})
+        self.env.cr.precommit.run()
+        shared = self.env['product.template'].create({'name': 'Shared Rental Product', 'type': 'consu'})
+        own = self.env['product.template'].create({
+            'name': 'Own Rental Product', 'type': 'consu', 'company_id': other_company.id,
+        })
+        dirty = self.env.cr.precommit.data['tlrm.counters_dirty']
+        self.assertIn(shared.id, dirty[self.company.id])
+        self.assertIn(shared.id, dirty[other_company.id])
+        self.assertIn(own.id, dirty[other_company.id])
+        self.assertNotIn(own.id, dirty[self.company.id])
+
+        self.env.cr.precommit.run()
+        self.assertEqual(shared.with_company(other_company).tlrm_status, 'unavailable')
+        self.assertEqual(shared.with_company(self.company).tlrm_status, 'unavailable')